@@ -0,0 +1,263 @@
+import os
+import base64
+import hashlib
+import tempfile
+
+# Blob store configuration
+BLOB_STORE_BACKEND = os.environ.get('BLOB_STORE_BACKEND', 'local')
+BLOB_STORE_PATH = os.environ.get(
+    'BLOB_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blobs')
+)
+BLOB_CHUNK_SIZE = 256 * 1024
+
+# Inline base64 fields of documents written before the blob store, with the
+# blob reference and content type fields that replace them
+INLINE_IMAGE_FIELDS = {
+    "cases": (("original_image", "original_blob", "image_format"),),
+    "results": (("original_image", "original_blob", "original_format"),
+                ("enhanced_image", "enhanced_blob", "enhanced_format")),
+}
+
+
+class BlobNotFound(Exception):
+    """Raised when a blob id is not present in the store"""
+
+
+class BlobFile:
+    """Read handle for a stored blob, modelled on GridFS GridOut"""
+
+    def __init__(self, blob_id, path):
+        self.blob_id = blob_id
+        self.path = path
+        self.length = os.path.getsize(path)
+        self._fh = open(path, 'rb')
+
+    def read(self, size=-1):
+        return self._fh.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._fh.seek(offset, whence)
+
+    def __iter__(self):
+        return self.iter_range(0, self.length)
+
+    def iter_range(self, start, length):
+        """Yield `length` bytes from `start` in chunks, closing the handle at the end"""
+        try:
+            self._fh.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = self._fh.read(min(BLOB_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BlobWriter:
+    """Incremental writer that hashes while writing, modelled on GridFS GridIn"""
+
+    def __init__(self, store, tmp_dir):
+        self._store = store
+        self._hash = hashlib.sha256()
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.tmp')
+        self._fh = os.fdopen(fd, 'wb')
+        self.length = 0
+        self.blob_id = None
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._fh.write(chunk)
+        self.length += len(chunk)
+
+    def close(self):
+        """Finish the blob and return its SHA-256 id"""
+        self._fh.close()
+        self.blob_id = self._hash.hexdigest()
+        self._store._commit(self._tmp_path, self.blob_id)
+        return self.blob_id
+
+    def abort(self):
+        self._fh.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+class BlobStore:
+    """Content-addressed blob store interface (GridFS-like put/get/exists/delete)"""
+
+    def put(self, data):
+        raise NotImplementedError
+
+    def new_file(self):
+        """Return a BlobWriter for streaming content into the store"""
+        raise NotImplementedError
+
+    def local_path(self, blob_id):
+        """Filesystem path of a blob, or None if the backend is not file based"""
+        return None
+
+    def get(self, blob_id):
+        raise NotImplementedError
+
+    def exists(self, blob_id):
+        raise NotImplementedError
+
+    def delete(self, blob_id):
+        raise NotImplementedError
+
+    def iter_blobs(self):
+        """Yield (blob_id, size, mtime) for every stored blob"""
+        raise NotImplementedError
+
+    def read(self, blob_id):
+        """Return the full contents of a blob as bytes"""
+        with self.get(blob_id) as blob:
+            return blob.read()
+
+
+class LocalBlobStore(BlobStore):
+    """Blob store keeping raw bytes on the local filesystem, keyed by SHA-256"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, blob_id):
+        if len(blob_id) != 64 or not all(c in '0123456789abcdef' for c in blob_id):
+            raise BlobNotFound(blob_id)
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    def put(self, data):
+        """Store bytes and return their SHA-256 id; identical content is stored once"""
+        blob_id = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_id)
+        if self._touch(path):
+            return blob_id
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_id
+
+    def new_file(self):
+        return BlobWriter(self, os.path.join(self.root, 'tmp'))
+
+    def _touch(self, path):
+        """Refresh the mtime of an existing blob; False if there is none.
+
+        Garbage collection spares recently written blobs, and a blob stored
+        again by a new upload counts as written.
+        """
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _commit(self, tmp_path, blob_id):
+        path = self._path(blob_id)
+        if self._touch(path):
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    def local_path(self, blob_id):
+        return self._path(blob_id)
+
+    def get(self, blob_id):
+        path = self._path(blob_id)
+        if not os.path.exists(path):
+            raise BlobNotFound(blob_id)
+        return BlobFile(blob_id, path)
+
+    def exists(self, blob_id):
+        try:
+            return os.path.exists(self._path(blob_id))
+        except BlobNotFound:
+            return False
+
+    def delete(self, blob_id):
+        try:
+            os.remove(self._path(blob_id))
+            return True
+        except (BlobNotFound, FileNotFoundError):
+            return False
+
+    def iter_blobs(self):
+        for first in os.scandir(self.root):
+            if not first.is_dir() or len(first.name) != 2:
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                for entry in os.scandir(second.path):
+                    if entry.is_file() and len(entry.name) == 64:
+                        stat = entry.stat()
+                        yield entry.name, stat.st_size, stat.st_mtime
+
+
+def decode_data_uri(image_data):
+    """Split a base64 data URI into raw bytes and its content type"""
+    header, encoded = image_data.split(',', 1)
+    content_type = header[len('data:'):].split(';')[0] or 'application/octet-stream'
+    return base64.b64decode(encoded), content_type
+
+
+def inline_images_update(doc, fields, store, dry_run=False):
+    """Mongo update moving a document's inline images into the store.
+
+    `fields` is an INLINE_IMAGE_FIELDS entry. Returns (update, inline_bytes),
+    or (None, 0) if the document has no inline image. With dry_run the
+    images are decoded but not stored.
+    """
+    update = {"$set": {}, "$unset": {}}
+    inline_bytes = 0
+    for field, blob_field, format_field in fields:
+        if field not in doc:
+            continue
+        inline_bytes += len(doc[field])
+        content, content_type = decode_data_uri(doc[field])
+        if not dry_run:
+            update["$set"][blob_field] = store.put(content)
+            update["$set"][format_field] = content_type
+        update["$unset"][field] = ""
+    if not update["$unset"]:
+        return None, 0
+    if not update["$set"]:
+        del update["$set"]
+    return update, inline_bytes
+
+
+BLOB_STORE_BACKENDS = {
+    "local": lambda: LocalBlobStore(BLOB_STORE_PATH),
+}
+
+
+def get_blob_store(backend=None):
+    """Create the configured blob store backend"""
+    backend = backend or BLOB_STORE_BACKEND
+    if backend not in BLOB_STORE_BACKENDS:
+        raise ValueError(f"Unknown blob store backend: {backend}")
+    return BLOB_STORE_BACKENDS[backend]()
@@ -0,0 +1,159 @@
+"""Haar cascade face detector.
+
+Cascades are parsed once per worker thread (CascadeClassifier is not
+thread-safe) and detection runs on a downscaled copy of the image, with
+boxes mapped back to full resolution.
+
+The frontal cascade runs first; the profile cascade (optionally also on
+the mirrored image, as it only knows one facing direction) is skipped
+when every frontal box is confident. Boxes from all passes are scored and
+merged with non-maximum suppression, so a face found by several cascades
+is reported once.
+"""
+
+import os
+import threading
+import cv2
+import numpy as np
+
+# Detection configuration
+DETECTION_MAX_DIMENSION = int(os.environ.get('DETECTION_MAX_DIMENSION', '1024'))
+DETECTION_SCALE_FACTOR = float(os.environ.get('DETECTION_SCALE_FACTOR', '1.1'))
+DETECTION_MIN_NEIGHBORS = int(os.environ.get('DETECTION_MIN_NEIGHBORS', '4'))
+# Smallest face to report, in full-resolution pixels (0: the cascade window size)
+DETECTION_MIN_SIZE = int(os.environ.get('DETECTION_MIN_SIZE', '0'))
+# Boxes overlapping a higher-scored one by more than this IoU are dropped
+DETECTION_NMS_IOU = float(os.environ.get('DETECTION_NMS_IOU', '0.3'))
+# Skip the profile passes when every frontal box scores at least this (above 1 disables)
+DETECTION_FAST_PATH_SCORE = float(os.environ.get('DETECTION_FAST_PATH_SCORE', '0.9'))
+# Also run the profile cascade on the mirrored image to find faces turned the other way
+DETECTION_PROFILE_FLIP = os.environ.get('DETECTION_PROFILE_FLIP', '0') == '1'
+# Spread of the logistic mapping a box's final-stage cascade sum to a 0..1 score
+DETECTION_SCORE_TEMPERATURE = 2.0
+
+FRONTAL_CASCADE = 'haarcascade_frontalface_default.xml'
+PROFILE_CASCADE = 'haarcascade_profileface.xml'
+
+_local = threading.local()
+
+
+def get_cascades():
+    """Return this thread's (frontal, profile) classifiers, loading them on first use"""
+    cascades = getattr(_local, 'cascades', None)
+    if cascades is None:
+        cascades = (
+            cv2.CascadeClassifier(cv2.data.haarcascades + FRONTAL_CASCADE),
+            cv2.CascadeClassifier(cv2.data.haarcascades + PROFILE_CASCADE),
+        )
+        if any(c.empty() for c in cascades):
+            raise RuntimeError("Failed to load Haar cascades")
+        _local.cascades = cascades
+    return cascades
+
+
+def warm_up():
+    """Load the cascades and run one tiny detection so the first request is not slow"""
+    frontal, profile = get_cascades()
+    blank = np.zeros((64, 64), np.uint8)
+    frontal.detectMultiScale(blank, 1.1, 4)
+    profile.detectMultiScale(blank, 1.1, 4)
+
+
+def downscale_for_detection(gray, max_dimension=DETECTION_MAX_DIMENSION):
+    """Shrink a grayscale image so its longest side is at most max_dimension.
+
+    Returns (image, scale) where scale maps detection coordinates back to the input.
+    """
+    height, width = gray.shape[:2]
+    longest = max(height, width)
+    if not max_dimension or longest <= max_dimension:
+        return gray, 1.0
+    scale = longest / float(max_dimension)
+    size = (max(1, int(round(width / scale))), max(1, int(round(height / scale))))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _to_full_resolution(boxes, scale):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if scale != 1.0:
+        boxes = boxes * scale
+    return np.round(boxes).astype(np.int32)
+
+
+def _scores(level_weights):
+    """Relative 0..1 confidence from the cascade's final-stage sums (not a calibrated probability)"""
+    weights = np.asarray(level_weights, dtype=np.float64).reshape(-1)
+    return 1.0 / (1.0 + np.exp(-weights / DETECTION_SCORE_TEMPERATURE))
+
+
+def non_max_suppression(boxes, scores, iou_threshold=DETECTION_NMS_IOU):
+    """Indices of the boxes (Nx4 x,y,w,h) to keep, highest score first"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        # IoU of the best remaining box against all others at once
+        width = np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+        height = np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None)
+        intersection = width * height
+        iou = intersection / (areas[best] + areas[rest] - intersection)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _detect(cascade, image, scale_factor, min_neighbors, min_size):
+    """(Nx4 boxes, N scores) of one cascade pass"""
+    boxes, _, weights = cascade.detectMultiScale3(
+        image, scale_factor, min_neighbors, minSize=min_size, outputRejectLevels=True
+    )
+    if not len(boxes):
+        return np.empty((0, 4), np.int32), np.empty(0)
+    return np.asarray(boxes, np.int32).reshape(-1, 4), _scores(weights)
+
+
+def detect_face_boxes(gray, scale_factor=DETECTION_SCALE_FACTOR, min_neighbors=DETECTION_MIN_NEIGHBORS,
+                      max_dimension=DETECTION_MAX_DIMENSION, min_size=DETECTION_MIN_SIZE):
+    """Detect faces in a grayscale image.
+
+    Returns (boxes, scores, sources): merged Nx4 x,y,w,h boxes in full
+    resolution, their 0..1 scores and the cascade ("frontal"/"profile")
+    that found each, highest score first.
+    """
+    frontal, profile = get_cascades()
+    small, scale = downscale_for_detection(gray, max_dimension)
+    small_min_size = (0, 0)
+    if min_size:
+        side = max(1, int(round(min_size / scale)))
+        small_min_size = (side, side)
+
+    passes = []
+    boxes, scores = _detect(frontal, small, scale_factor, min_neighbors, small_min_size)
+    passes.append((boxes, scores, "frontal"))
+
+    confident = len(scores) > 0 and scores.min() >= DETECTION_FAST_PATH_SCORE
+    if not confident:
+        boxes, scores = _detect(profile, small, scale_factor, min_neighbors, small_min_size)
+        passes.append((boxes, scores, "profile"))
+        if DETECTION_PROFILE_FLIP:
+            boxes, scores = _detect(profile, cv2.flip(small, 1), scale_factor, min_neighbors, small_min_size)
+            if len(boxes):
+                # Mirror x back: x' = width - x - w
+                boxes[:, 0] = small.shape[1] - boxes[:, 0] - boxes[:, 2]
+            passes.append((boxes, scores, "profile"))
+
+    all_boxes = np.concatenate([boxes for boxes, _, _ in passes])
+    all_scores = np.concatenate([scores for _, scores, _ in passes])
+    all_sources = [source for boxes, _, source in passes for _ in range(len(boxes))]
+    keep = non_max_suppression(all_boxes, all_scores)
+    return (
+        _to_full_resolution(all_boxes[keep], scale),
+        all_scores[keep],
+        [all_sources[index] for index in keep],
+    )
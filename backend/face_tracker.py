@@ -0,0 +1,137 @@
+"""Linking face detections across a sequence of frames.
+
+Boxes are compared in coordinates normalized by frame size, so frames
+stored at different resolutions still line up. Each frame's detections
+are matched to the live tracks greedily by IoU; detections left over are
+matched by centroid distance (relative to the box size), which keeps a
+track when the subject moved further than its box between sampled
+frames. A track ends after TRACK_MAX_GAP frames without a match.
+
+The best detection of a track is the one with the highest quality, a
+blend of detection score, face sharpness and face size.
+"""
+
+import os
+import numpy as np
+
+# Tracking configuration
+TRACK_IOU_THRESHOLD = float(os.environ.get('TRACK_IOU_THRESHOLD', '0.3'))
+# Max centroid distance for a fallback match, in multiples of the larger box side
+TRACK_MAX_CENTROID_DISTANCE = float(os.environ.get('TRACK_MAX_CENTROID_DISTANCE', '1.0'))
+TRACK_MAX_GAP = int(os.environ.get('TRACK_MAX_GAP', '5'))
+
+# Quality weights and the sharpness / face side (pixels) at which each term reaches half its weight
+QUALITY_WEIGHTS = {"score": 0.4, "sharpness": 0.35, "size": 0.25}
+SHARPNESS_REFERENCE = 100.0
+SIZE_REFERENCE = 96.0
+
+
+def detection_quality(box):
+    """0..1 quality of a detection box ({w, h, score?, sharpness?} in full-resolution pixels)"""
+    side = min(box["w"], box["h"])
+    # Boxes from before scores and sharpness were recorded count as average on those terms
+    sharpness = box.get("sharpness")
+    terms = {
+        "score": box.get("score", 0.5),
+        "sharpness": sharpness / (sharpness + SHARPNESS_REFERENCE) if sharpness is not None else 0.5,
+        "size": side / (side + SIZE_REFERENCE),
+    }
+    return round(sum(QUALITY_WEIGHTS[name] * value for name, value in terms.items()), 4)
+
+
+def _normalized(box, width, height):
+    return np.array([box["x"] / width, box["y"] / height, box["w"] / width, box["h"] / height])
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of Nx4 and Mx4 x,y,w,h arrays"""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ax1, ay1 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx1, by1 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    width = np.clip(np.minimum(ax1[:, None], bx1[None]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    height = np.clip(np.minimum(ay1[:, None], by1[None]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    intersection = width * height
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def _centroid_distances(a, b):
+    """Pairwise centroid distance divided by the larger box side of each pair"""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ca = a[:, :2] + a[:, 2:] / 2
+    cb = b[:, :2] + b[:, 2:] / 2
+    distance = np.linalg.norm(ca[:, None] - cb[None], axis=2)
+    scale = np.maximum(a[:, 2:].max(axis=1)[:, None], b[:, 2:].max(axis=1)[None])
+    return distance / np.maximum(scale, 1e-9)
+
+
+def _greedy_pairs(scores, allowed):
+    """(row, col) pairs taken greedily by descending score among allowed cells"""
+    pairs, used_rows, used_cols = [], set(), set()
+    rows, cols = np.nonzero(allowed)
+    for index in np.argsort(-scores[rows, cols], kind='stable'):
+        row, col = int(rows[index]), int(cols[index])
+        if row in used_rows or col in used_cols:
+            continue
+        pairs.append((row, col))
+        used_rows.add(row)
+        used_cols.add(col)
+    return pairs
+
+
+def track_faces(frames, iou_threshold=TRACK_IOU_THRESHOLD, max_centroid_distance=TRACK_MAX_CENTROID_DISTANCE,
+                max_gap=TRACK_MAX_GAP):
+    """Link detections across ordered frames.
+
+    `frames` is a sequence of {frame_id, width, height, boxes}. Returns
+    tracks as [{track_id, detections: [{frame_id, box_index, quality}], best}]
+    where `best` is the highest-quality detection, in order of first appearance.
+    """
+    tracks = []
+    live = []  # indices into tracks
+
+    for position, frame in enumerate(frames):
+        boxes = frame.get("boxes") or []
+        if not boxes or not frame.get("width") or not frame.get("height"):
+            continue
+        current = np.array([_normalized(box, frame["width"], frame["height"]) for box in boxes])
+        live = [index for index in live if position - tracks[index]["last_position"] <= max_gap]
+
+        assigned = {}
+        if live:
+            previous = np.array([tracks[index]["last_box"] for index in live])
+            overlap = iou_matrix(previous, current)
+            for row, col in _greedy_pairs(overlap, overlap >= iou_threshold):
+                assigned[col] = live[row]
+            rows = [row for row in range(len(live)) if live[row] not in assigned.values()]
+            cols = [col for col in range(len(boxes)) if col not in assigned]
+            if rows and cols:
+                distances = _centroid_distances(previous[rows], current[cols])
+                for row, col in _greedy_pairs(-distances, distances <= max_centroid_distance):
+                    assigned[cols[col]] = live[rows[row]]
+
+        for col, box in enumerate(boxes):
+            index = assigned.get(col)
+            if index is None:
+                index = len(tracks)
+                tracks.append({"track_id": index, "detections": []})
+                live.append(index)
+            track = tracks[index]
+            track["detections"].append({
+                "frame_id": frame["frame_id"], "box_index": col, "quality": detection_quality(box)
+            })
+            track["last_box"] = current[col]
+            track["last_position"] = position
+
+    for track in tracks:
+        track.pop("last_box")
+        track.pop("last_position")
+        track["best"] = max(track["detections"], key=lambda detection: detection["quality"])
+    return tracks
+
+
+def best_frames(tracks):
+    """Frame ids holding the best detection of at least one track, in track order"""
+    return list(dict.fromkeys(track["best"]["frame_id"] for track in tracks))
@@ -0,0 +1,301 @@
+"""Adaptive OpenCV fallback enhancement.
+
+The fallback runs up to four stages in a fixed order: contrast (CLAHE on
+the luminance), denoise, sharpen and brightness. plan_fallback() decides
+per image which of them run and with which parameters, from the
+assess_quality scores of the image: a clean image is not denoised, a sharp
+one is not sharpened, and brightness is pulled towards a target instead of
+being raised by a constant. A plan is a list of steps, each naming a
+filter from FILTERS and its parameters, so a stage can be served by a
+cheaper equivalent.
+
+Presets pick the denoising filter and so trade quality against latency:
+
+  quality   bilateral filter at full resolution
+  balanced  bilateral filter on a half-resolution copy, upsampled back
+  fast      fast guided filter (He & Sun) computed at quarter resolution
+  classic   the original fixed pipeline, every stage with constant
+            parameters, so earlier results can be reproduced exactly
+
+Steps run tile by tile (see tiling.py) with a halo covering the reach of
+every planned filter. Downsampling filters pad each tile to whole blocks
+and the halo is a multiple of the block size, so blocks line up with the
+full-frame grid and tiles still join without seams.
+"""
+
+import os
+import math
+import cv2
+import numpy as np
+
+from image_ops import StageTimer, decode_image, encode_image, assess_quality
+from tiling import ScratchBuffers, apply_tiled, iter_tiles, TILE_SIZE
+
+# Fallback stages in the order they run; a routing decision may run a subset
+FALLBACK_STAGES = ("clahe", "denoise", "sharpen", "brightness")
+
+# Deployment-wide preset, overridable per request
+FALLBACK_PRESET = os.environ.get('FALLBACK_PRESET', 'balanced')
+
+# Bump a preset's version when its output changes so cached results are not reused
+FALLBACK_PIPELINE_VERSIONS = {
+    "quality": "opencv-adaptive-v1-quality",
+    "balanced": "opencv-adaptive-v1-balanced",
+    "fast": "opencv-adaptive-v1-fast",
+    "classic": "opencv-clahe-bilateral-sharpen-v1",
+}
+FALLBACK_PRESETS = tuple(FALLBACK_PIPELINE_VERSIONS)
+
+# Denoising filter and working-resolution factor of each adaptive preset
+PRESET_DENOISE = {"quality": ("bilateral", 1), "balanced": ("bilateral_downsampled", 2), "fast": ("guided", 4)}
+
+# The original pipeline's constant steps
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+CLASSIC_PLAN = (
+    {"stage": "clahe", "filter": "clahe", "clip_limit": 2.0},
+    {"stage": "denoise", "filter": "bilateral", "diameter": 9, "sigma_color": 75, "sigma_space": 75},
+    {"stage": "sharpen", "filter": "kernel"},
+    {"stage": "brightness", "filter": "linear", "alpha": 1.2, "beta": 20},
+)
+
+# Adaptive thresholds and targets on the assess_quality scores (grey levels 0..255)
+CLAHE_MAX_CONTRAST = 60.0  # CLAHE runs below this contrast...
+CLAHE_MAX_CLIPPED = 0.05  # ...or with this share of clipped shadows and highlights
+DENOISE_MIN_NOISE = 2.5
+SHARPEN_MAX_BLUR = 300.0
+TARGET_BRIGHTNESS = 120.0
+BRIGHTNESS_TOLERANCE = 25.0  # mean brightness this close to the target is left alone
+TARGET_CONTRAST = 50.0
+
+_scratch = ScratchBuffers()
+
+
+def fallback_preset_name(preset=None):
+    """Validated preset name, defaulting to the deployment configuration; ValueError if unknown"""
+    preset = (preset or FALLBACK_PRESET).lower()
+    if preset not in FALLBACK_PIPELINE_VERSIONS:
+        raise ValueError(f"Unsupported fallback preset '{preset}', expected one of {', '.join(FALLBACK_PRESETS)}")
+    return preset
+
+
+def denoise_step(noise, preset):
+    """Denoising step for a noise sigma (grey levels) using the preset's filter"""
+    name, factor = PRESET_DENOISE[preset]
+    step = {"stage": "denoise", "filter": name}
+    if name == "guided":
+        # Two-pixel radius at quarter resolution; eps in normalized intensity units
+        return {**step, "factor": factor, "radius": 2, "eps": round((1.5 * noise / 255) ** 2, 6)}
+    diameter = 5 if noise < 6 else 9
+    if factor > 1:
+        step["factor"] = factor
+        diameter = 5
+    return {**step, "diameter": diameter, "sigma_color": round(float(np.clip(noise * 5, 10, 75)), 1),
+            "sigma_space": diameter}
+
+
+def brightness_step(brightness, contrast):
+    """Linear step moving mean brightness towards TARGET_BRIGHTNESS and stretching low contrast; None if not needed"""
+    alpha = float(np.clip(TARGET_CONTRAST / max(contrast, 1.0), 1.0, 1.3))
+    shift = TARGET_BRIGHTNESS - brightness
+    shift = 0.0 if abs(shift) <= BRIGHTNESS_TOLERANCE else float(np.clip(shift, -40, 40))
+    if not shift and alpha < 1.02:
+        return None
+    # Scale around the current mean, then shift it
+    beta = brightness + shift - alpha * brightness
+    return {"stage": "brightness", "filter": "linear", "alpha": round(alpha, 3), "beta": round(beta, 2)}
+
+
+def plan_fallback(quality, preset=None, stages=FALLBACK_STAGES):
+    """Steps the fallback runs on an image with the given assess_quality scores"""
+    preset = fallback_preset_name(preset)
+    if preset == "classic":
+        return [dict(step) for step in CLASSIC_PLAN if step["stage"] in stages]
+
+    plan = []
+    clipped = quality["dark_fraction"] + quality["bright_fraction"]
+    if "clahe" in stages and (quality["contrast"] < CLAHE_MAX_CONTRAST or clipped > CLAHE_MAX_CLIPPED):
+        clip_limit = float(np.interp(quality["contrast"], [20.0, CLAHE_MAX_CONTRAST], [3.0, 1.5]))
+        plan.append({"stage": "clahe", "filter": "clahe", "clip_limit": round(clip_limit, 2)})
+    if "denoise" in stages and quality["noise"] > DENOISE_MIN_NOISE:
+        plan.append(denoise_step(quality["noise"], preset))
+    if "sharpen" in stages and quality["blur"] < SHARPEN_MAX_BLUR:
+        amount = float(np.interp(quality["blur"], [20.0, SHARPEN_MAX_BLUR], [1.5, 0.3]))
+        plan.append({"stage": "sharpen", "filter": "unsharp", "sigma": 1.0, "amount": round(amount, 2)})
+    if "brightness" in stages:
+        step = brightness_step(quality["brightness"], quality["contrast"])
+        if step:
+            plan.append(step)
+    return plan
+
+
+def _luminance_clahe(img, clip_limit=2.0):
+    """CLAHE-equalized L channel of the whole image.
+
+    CLAHE's histogram grid spans the full frame, so it cannot be tiled; only
+    the single uint8 L plane is materialized at full size.
+    """
+    height, width = img.shape[:2]
+    l_channel = np.empty((height, width), np.uint8)
+    for (y0, y1, x0, x1), _ in iter_tiles(height, width, TILE_SIZE, 0):
+        lab = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2LAB)
+        l_channel[y0:y1, x0:x1] = lab[:, :, 0]
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(8, 8))
+    return clahe.apply(l_channel, dst=l_channel)
+
+
+def _replan_brightness(plan, l_clahe):
+    """Recompute the brightness step from the equalized luminance, which CLAHE has already moved"""
+    sample = np.ascontiguousarray(l_clahe[::4, ::4])
+    mean, std = cv2.meanStdDev(sample)
+    plan = [step for step in plan if step["stage"] != "brightness"]
+    step = brightness_step(float(mean[0, 0]), float(std[0, 0]))
+    return plan + [step] if step else plan
+
+
+# Filters: apply(src, dst, step, context) -> output, and the context in pixels each one reads.
+# A filter needing an intermediate array takes the shared 'step' scratch buffer; it only
+# lives for the duration of one filter call.
+
+def _downsample(src, factor):
+    """src reduced by an integer factor, edge-padded to whole blocks first"""
+    height, width = src.shape[:2]
+    pad_y, pad_x = -height % factor, -width % factor
+    if pad_y or pad_x:
+        src = cv2.copyMakeBorder(src, 0, pad_y, 0, pad_x, cv2.BORDER_REPLICATE)
+    size = (src.shape[1] // factor, src.shape[0] // factor)
+    return cv2.resize(src, size, interpolation=cv2.INTER_AREA)
+
+
+def _upsample(small, shape, factor):
+    """Bilinear upsampling of a _downsample result back to `shape` (height, width)"""
+    up = cv2.resize(small, (small.shape[1] * factor, small.shape[0] * factor), interpolation=cv2.INTER_LINEAR)
+    return up[:shape[0], :shape[1]]
+
+
+def _clahe(src, dst, step, context):
+    ry0, ry1, rx0, rx1 = context["box"]
+    lab = cv2.cvtColor(src, cv2.COLOR_BGR2LAB, dst=_scratch.get('step', src.shape))
+    lab[:, :, 0] = context["l_clahe"][ry0:ry1, rx0:rx1]
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=dst)
+
+
+def _bilateral(src, dst, step, context):
+    return cv2.bilateralFilter(src, step["diameter"], step["sigma_color"], step["sigma_space"], dst=dst)
+
+
+def _bilateral_downsampled(src, dst, step, context):
+    factor = step["factor"]
+    small = _downsample(src, factor)
+    small = cv2.bilateralFilter(small, step["diameter"], step["sigma_color"], step["sigma_space"])
+    np.copyto(dst, _upsample(small, src.shape, factor))
+    return dst
+
+
+def _guided(src, dst, step, context):
+    """Self-guided fast guided filter: coefficients at low resolution, applied to the full-resolution tile"""
+    factor = step["factor"]
+    ksize = (2 * step["radius"] + 1,) * 2
+    guide = _downsample(src, factor).astype(np.float32) / 255
+    mean = cv2.boxFilter(guide, -1, ksize)
+    variance = cv2.boxFilter(guide * guide, -1, ksize) - mean * mean
+    a = variance / (variance + step["eps"])
+    b = mean - a * mean
+    a = _upsample(cv2.boxFilter(a, -1, ksize), src.shape, factor)
+    b = _upsample(cv2.boxFilter(b, -1, ksize), src.shape, factor)
+    out = a * src.astype(np.float32) + b * 255
+    return cv2.convertScaleAbs(np.clip(out, 0, 255, out=out), dst=dst)
+
+
+def _unsharp(src, dst, step, context):
+    blurred = cv2.GaussianBlur(src, (0, 0), step["sigma"], dst=_scratch.get('step', src.shape))
+    return cv2.addWeighted(src, 1 + step["amount"], blurred, -step["amount"], 0, dst=dst)
+
+
+def _kernel(src, dst, step, context):
+    return cv2.filter2D(src, -1, SHARPEN_KERNEL, dst=dst)
+
+
+def _linear(src, dst, step, context):
+    return cv2.convertScaleAbs(src, dst=dst, alpha=step["alpha"], beta=step["beta"])
+
+
+FILTERS = {
+    "clahe": (_clahe, lambda step: 0),
+    "bilateral": (_bilateral, lambda step: step["diameter"] // 2),
+    "bilateral_downsampled": (_bilateral_downsampled, lambda step: step["factor"] * (step["diameter"] // 2 + 2)),
+    "guided": (_guided, lambda step: step["factor"] * (2 * step["radius"] + 2)),
+    "unsharp": (_unsharp, lambda step: math.ceil(3 * step["sigma"]) + 1),
+    "kernel": (_kernel, lambda step: 1),
+    "linear": (_linear, lambda step: 0),
+}
+
+
+def fallback_halo(plan):
+    """Tile context needed by a plan, rounded up to whole blocks of its downsampling filters"""
+    halo = sum(FILTERS[step["filter"]][1](step) for step in plan)
+    block = max((step.get("factor", 1) for step in plan), default=1)
+    return -(-halo // block) * block
+
+
+def _enhance_tile(region, box, plan, l_clahe):
+    """Run the planned steps over one tile, alternating between two reusable buffers"""
+    shape = region.shape
+    timer = StageTimer()
+    buffers = (_scratch.get('bgr', shape), _scratch.get('denoised', shape))
+    context = {"box": box, "l_clahe": l_clahe}
+
+    current = region
+    for step in plan:
+        # Each step writes into whichever colour buffer does not hold its input
+        free = buffers[1] if current is buffers[0] else buffers[0]
+        current = FILTERS[step["filter"]][0](current, free, step, context)
+        timer.mark(step["stage"])
+    return current, timer.timings
+
+
+def fallback_enhance(source, encoding=None, stages=FALLBACK_STAGES, preset=None):
+    """Advanced fallback enhancement using OpenCV techniques.
+
+    Frames are processed in place in overlapping tiles (see tiling.py), so
+    beyond the decoded image only its L plane and two bands of tiles are
+    held in memory. `stages` limits which of FALLBACK_STAGES may run and
+    `preset` picks the filters (see FALLBACK_PIPELINE_VERSIONS).
+    Returns (encoded_bytes, timings, plan).
+    """
+    preset = fallback_preset_name(preset)
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+
+    quality = None
+    if preset != "classic":
+        quality = assess_quality(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+        timer.mark("analyze")
+    plan = plan_fallback(quality, preset, stages)
+
+    l_clahe = None
+    clahe_step = next((step for step in plan if step["stage"] == "clahe"), None)
+    if clahe_step:
+        l_clahe = _luminance_clahe(img, clahe_step["clip_limit"])
+        if quality is not None and "brightness" in stages:
+            plan = _replan_brightness(plan, l_clahe)
+        timer.mark("clahe")
+
+    tile_timings = {}
+    if plan:
+        tile_timings = apply_tiled(
+            img,
+            lambda region, box: _enhance_tile(region, box, plan, l_clahe),
+            fallback_halo(plan)
+        )
+        del l_clahe
+        timer.mark("tiles")
+
+    data = encode_image(img, encoding)
+    timer.mark("encode")
+
+    timings = timer.timings
+    timings.pop("tiles", None)
+    for stage, seconds in tile_timings.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    return data, timings, plan
@@ -0,0 +1,397 @@
+"""CPU-bound OpenCV pipelines.
+
+Functions here take and return plain bytes/tuples so they can run inside
+worker processes (see workers.py) without touching the web app state.
+Image inputs are either encoded bytes or a path to a blob on local disk;
+paths avoid pickling the image into the worker process.
+"""
+
+import os
+import time
+import hashlib
+import cv2
+import numpy as np
+
+from face_detector import detect_face_boxes
+
+
+class StageTimer:
+    """Collects wall-clock seconds per named pipeline stage"""
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+
+# Face-region enhancement: each box grows by this fraction of its size on every side
+FACE_REGION_PADDING = float(os.environ.get('FACE_REGION_PADDING', '0.25'))
+
+# Output formats: extension, content type, OpenCV level flag and (min, max, default) level.
+# The level is the compression level for PNG and the quality for JPEG/WebP.
+OUTPUT_FORMATS = {
+    "png": (".png", "image/png", cv2.IMWRITE_PNG_COMPRESSION, (0, 9, 1)),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY, (1, 100, 92)),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY, (1, 100, 90)),
+}
+
+# Deployment-wide output encoding, overridable per request
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'png')
+OUTPUT_LEVEL = os.environ.get('OUTPUT_LEVEL')
+
+# Lossless and fast, for images that are decoded again by a later stage
+INTERMEDIATE_ENCODING = ("png", 1)
+
+# Previews generated when an image is written; sizes are the longest side in pixels
+THUMBNAIL_SIZES = tuple(int(size) for size in os.environ.get('THUMBNAIL_SIZES', '160,480').split(','))
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'webp')
+THUMBNAIL_LEVEL = int(os.environ.get('THUMBNAIL_LEVEL', '80'))
+
+
+def decode_image(source):
+    """Decode encoded image bytes, or the file at a path, into a BGR array"""
+    if isinstance(source, str):
+        nparr = np.fromfile(source, np.uint8)
+    else:
+        nparr = np.frombuffer(source, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def output_encoding(output_format=None, level=None):
+    """Validated (format, level) pair, defaulting to the deployment configuration.
+
+    Raises ValueError for unknown formats or out-of-range levels.
+    """
+    output_format = (output_format or OUTPUT_FORMAT).lower()
+    if output_format == "jpg":
+        output_format = "jpeg"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+    low, high, default = OUTPUT_FORMATS[output_format][3]
+    if level is None:
+        level = int(OUTPUT_LEVEL) if OUTPUT_LEVEL and output_format == OUTPUT_FORMAT else default
+    if not low <= level <= high:
+        raise ValueError(f"{output_format} level must be between {low} and {high}")
+    return output_format, level
+
+
+def encode_image(img, encoding=None):
+    """Encode a BGR array with a (format, level) pair from output_encoding()"""
+    output_format, level = encoding or output_encoding()
+    extension, _, flag, _ = OUTPUT_FORMATS[output_format]
+    ok, buffer = cv2.imencode(extension, img, [flag, level])
+    if not ok:
+        raise ValueError(f"Could not encode image as {output_format}")
+    return buffer.tobytes()
+
+
+def transcode_image(source, encoding):
+    """Re-encode an image with the given (format, level); returns (bytes, timings)"""
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+    data = encode_image(img, encoding)
+    timer.mark("encode")
+    return data, timer.timings
+
+
+def make_thumbnails(img, sizes=THUMBNAIL_SIZES):
+    """Encoded previews keyed by size (as a string), each no larger than the image itself"""
+    encoding = output_encoding(THUMBNAIL_FORMAT, THUMBNAIL_LEVEL)
+    thumbnails = {}
+    current = img
+    # Largest first, each resized from the previous one to keep INTER_AREA cheap
+    for size in sorted(set(sizes), reverse=True):
+        height, width = current.shape[:2]
+        scale = size / max(height, width)
+        if scale < 1:
+            current = cv2.resize(
+                current, (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        thumbnails[str(size)] = encode_image(current, encoding)
+    return thumbnails
+
+
+def render_thumbnails(source, sizes=THUMBNAIL_SIZES):
+    """Decode an image and build its previews; returns (thumbnails, timings)"""
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+    thumbnails = make_thumbnails(img, sizes)
+    timer.mark("thumbnails")
+    return thumbnails, timer.timings
+
+
+def sniff_image_type(data):
+    """Content type of encoded image bytes from their magic number"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data.startswith(b'BM'):
+        return 'image/bmp'
+    return 'application/octet-stream'
+
+
+def pixel_hash(img):
+    """Hash of decoded pixels, identical for re-encodings that decode to the same image"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(img.shape).encode('ascii'))
+    digest.update(memoryview(np.ascontiguousarray(img)).cast('B'))
+    return digest.hexdigest()
+
+
+def _bits_to_hex(bits):
+    return np.packbits(bits.astype(np.uint8).ravel()).tobytes().hex()
+
+
+def perceptual_hashes(gray):
+    """64-bit pHash and dHash of a grayscale image as 16-digit hex strings.
+
+    Both survive re-encoding and resizing: pHash compares low-frequency DCT
+    coefficients against their median, dHash the brightness gradient
+    between neighbouring pixels of a 9x8 reduction.
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only reflects overall brightness
+    phash = low > np.median(low[1:])
+    reduced = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash = reduced[:, 1:] > reduced[:, :-1]
+    return _bits_to_hex(phash), _bits_to_hex(dhash)
+
+
+def fingerprint_image(source, thumbnail_sizes=()):
+    """Hashes, dimensions and thumbnails of an image without running detection.
+
+    Returns a dict with image_hash, phash, dhash, quality, width, height,
+    thumbnails and per-stage timings, the same fields detect_faces reports.
+    """
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+
+    image_hash = pixel_hash(img)
+    timer.mark("hash")
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    phash, dhash = perceptual_hashes(gray)
+    timer.mark("phash")
+
+    quality = assess_quality(gray)
+    timer.mark("quality")
+
+    thumbnails = {}
+    if thumbnail_sizes:
+        thumbnails = make_thumbnails(img, thumbnail_sizes)
+        timer.mark("thumbnails")
+
+    return {
+        "image_hash": image_hash,
+        "phash": phash,
+        "dhash": dhash,
+        "quality": quality,
+        "width": img.shape[1],
+        "height": img.shape[0],
+        "thumbnails": thumbnails,
+        "timings": timer.timings,
+    }
+
+
+# Face crops are scaled to this side before measuring sharpness, so faces of any size compare
+FACE_SHARPNESS_SIZE = 96
+
+
+def face_sharpness(gray, box):
+    """Variance of the Laplacian over a face box, a focus / motion-blur measure"""
+    x, y, w, h = (int(v) for v in box)
+    crop = gray[max(0, y):y + h, max(0, x):x + w]
+    if crop.size == 0:
+        return 0.0
+    crop = cv2.resize(crop, (FACE_SHARPNESS_SIZE, FACE_SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    return round(float(cv2.Laplacian(crop, cv2.CV_64F).var()), 2)
+
+
+def detect_faces(source, thumbnail_sizes=()):
+    """Advanced face detection using multiple cascade classifiers.
+
+    Returns a dict with faces_detected, face_count, confidence, boxes
+    ({x, y, w, h, score, sharpness, source} in full-resolution pixels), image_hash, phash,
+    dhash, quality (see assess_quality), width, height, thumbnails (for `thumbnail_sizes`, from the same decode) and
+    per-stage timings.
+    """
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+
+    image_hash = pixel_hash(img)
+    timer.mark("hash")
+
+    # Convert to grayscale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    timer.mark("grayscale")
+
+    phash, dhash = perceptual_hashes(gray)
+    timer.mark("phash")
+
+    quality = assess_quality(gray)
+    timer.mark("quality")
+
+    # Frontal and profile cascades on a size-capped copy, merged boxes in full resolution
+    found, scores, sources = detect_face_boxes(gray)
+    timer.mark("cascades")
+
+    thumbnails = {}
+    if thumbnail_sizes:
+        thumbnails = make_thumbnails(img, thumbnail_sizes)
+        timer.mark("thumbnails")
+
+    boxes = [
+        {"x": int(x), "y": int(y), "w": int(w), "h": int(h), "score": round(float(score), 4),
+         "sharpness": face_sharpness(gray, (x, y, w, h)), "source": source}
+        for (x, y, w, h), score, source in zip(found, scores, sources)
+    ]
+    total_faces = len(boxes)
+
+    # Image-level confidence is the mean box score
+    confidence = round(float(np.mean(scores)), 4) if total_faces else 0.0
+
+    return {
+        "faces_detected": total_faces > 0,
+        "face_count": total_faces,
+        "confidence": confidence,
+        "boxes": boxes,
+        "image_hash": image_hash,
+        "phash": phash,
+        "dhash": dhash,
+        "quality": quality,
+        "width": img.shape[1],
+        "height": img.shape[0],
+        "thumbnails": thumbnails,
+        "timings": timer.timings,
+    }
+
+
+# Quality analysis runs on a copy no larger than this, so scores are comparable across sizes
+QUALITY_ANALYSIS_SIZE = 1024
+
+# Immerkaer's noise estimation kernel: zero response on smooth gradients
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], np.float32)
+
+
+def assess_quality(gray):
+    """Blur, noise, exposure and resolution scores of a grayscale image.
+
+    blur is the variance of the Laplacian (lower is blurrier), noise an
+    estimate of the Gaussian noise sigma in grey levels, brightness and
+    contrast the mean and standard deviation of the histogram, and
+    dark/bright_fraction the share of clipped shadows and highlights.
+    """
+    height, width = gray.shape[:2]
+    scale = QUALITY_ANALYSIS_SIZE / max(height, width)
+    small = gray
+    if scale < 1:
+        small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+
+    blur = cv2.Laplacian(small, cv2.CV_32F).var()
+    # Downscaling averages noise away, so it is measured on a full-resolution centre crop
+    y0 = max(0, (height - QUALITY_ANALYSIS_SIZE) // 2)
+    x0 = max(0, (width - QUALITY_ANALYSIS_SIZE) // 2)
+    crop = gray[y0:y0 + QUALITY_ANALYSIS_SIZE, x0:x0 + QUALITY_ANALYSIS_SIZE]
+    residual = cv2.filter2D(crop.astype(np.float32), -1, NOISE_KERNEL)[1:-1, 1:-1]
+    noise = np.sqrt(np.pi / 2) * np.abs(residual).mean() / 6 if residual.size else 0.0
+
+    histogram = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    total = histogram.sum()
+    levels = np.arange(256)
+    brightness = (histogram * levels).sum() / total
+    contrast = np.sqrt((histogram * (levels - brightness) ** 2).sum() / total)
+
+    return {
+        "blur": round(float(blur), 2),
+        "noise": round(float(noise), 2),
+        "brightness": round(float(brightness), 2),
+        "contrast": round(float(contrast), 2),
+        "dark_fraction": round(float(histogram[:16].sum() / total), 4),
+        "bright_fraction": round(float(histogram[240:].sum() / total), 4),
+        "width": int(width),
+        "height": int(height),
+        "megapixels": round(width * height / 1e6, 3),
+    }
+
+
+def face_regions(boxes, width, height, padding=FACE_REGION_PADDING):
+    """Padded [x0, y0, x1, y1] regions around face boxes, clipped to the image, overlaps merged"""
+    regions = []
+    for box in boxes:
+        pad_x, pad_y = int(box["w"] * padding), int(box["h"] * padding)
+        regions.append([
+            max(0, box["x"] - pad_x), max(0, box["y"] - pad_y),
+            min(width, box["x"] + box["w"] + pad_x), min(height, box["y"] + box["h"] + pad_y)
+        ])
+
+    # Overlapping crops would enhance shared pixels twice; keep merging until disjoint
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [region for region in regions if region[2] > region[0] and region[3] > region[1]]
+
+
+def crop_regions(source, regions):
+    """PNG-encoded crops of the given regions; returns (crops, timings)"""
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+
+    crops = []
+    for x0, y0, x1, y1 in regions:
+        crops.append(encode_image(img[y0:y1, x0:x1], INTERMEDIATE_ENCODING))
+    timer.mark("crop")
+    return crops, timer.timings
+
+
+def composite_regions(source, regions, crops, encoding=None):
+    """Paste enhanced crops back over their regions of the original; returns (encoded_bytes, timings).
+
+    A crop of None leaves its region untouched. Crops that came back at a
+    different size (e.g. from a super-resolution model) are resampled to fit.
+    """
+    timer = StageTimer()
+    img = decode_image(source)
+    timer.mark("decode")
+
+    for (x0, y0, x1, y1), crop in zip(regions, crops):
+        if crop is None:
+            continue
+        patch = decode_image(crop)
+        if patch.shape[:2] != (y1 - y0, x1 - x0):
+            patch = cv2.resize(patch, (x1 - x0, y1 - y0), interpolation=cv2.INTER_AREA)
+        img[y0:y1, x0:x1] = patch
+    timer.mark("composite")
+
+    data = encode_image(img, encoding)
+    timer.mark("encode")
+    return data, timer.timings
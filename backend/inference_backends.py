@@ -0,0 +1,272 @@
+"""Inference backends behind face enhancement.
+
+`remote` posts images to the hosted inference API through the shared
+InferenceClient. `onnx` runs `<ONNX_MODEL_DIR>/<enhancement_type>.onnx`
+locally with ONNX Runtime on the CPU, so enhancement also works on nodes
+without network access. onnxruntime is optional and only needed for the
+onnx backend.
+
+Backends raise InferenceUnavailable when they cannot produce a result;
+callers then fall back to the OpenCV pipeline.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_ops import decode_image, encode_image
+from inference_client import InferenceUnavailable
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency
+    ort = None
+
+# Backend selection
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'remote')
+
+# ONNX Runtime configuration
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', str(max(1, (os.cpu_count() or 2) // 2))))
+ONNX_ALLOW_SPINNING = os.environ.get('ONNX_ALLOW_SPINNING', '0')
+ONNX_MAX_BATCH = int(os.environ.get('ONNX_MAX_BATCH', '4'))
+# Input value range the models expect: "unit" for [0, 1], "symmetric" for [-1, 1]
+ONNX_NORMALIZE = os.environ.get('ONNX_NORMALIZE', 'unit')
+
+
+class InferenceBackend:
+    """Interface: enhance(model_type, data, encoding) -> (image bytes, confidence, method)
+
+    enhance_batch() takes several images for the same model as one unit; the
+    default runs them concurrently, backends that can share work override it.
+    """
+
+    name = None
+
+    def available(self):
+        """Whether the backend is configured at all; if not, enhancement is skipped"""
+        return True
+
+    def model_id(self, model_type):
+        """Identifier of the model that serves `model_type`, used in result cache keys"""
+        raise NotImplementedError
+
+    async def enhance(self, model_type, data, encoding=None):
+        raise NotImplementedError
+
+    async def enhance_batch(self, model_type, items, encoding=None):
+        """One (image bytes, confidence, method) tuple or exception per item, in order"""
+        return await asyncio.gather(
+            *[self.enhance(model_type, data, encoding) for data in items],
+            return_exceptions=True
+        )
+
+    async def warm_up(self):
+        pass
+
+    def stats(self):
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+
+class RemoteBackend(InferenceBackend):
+    """Hosted inference API; model output is returned as sent"""
+
+    name = "remote"
+
+    def __init__(self, client, models):
+        self.client = client
+        self.models = models
+
+    def available(self):
+        return bool(self.client.api_key)
+
+    def model_id(self, model_type):
+        return self.models.get(model_type, self.models["restoration"])["model"]
+
+    async def enhance(self, model_type, data, encoding=None):
+        model_name = self.model_id(model_type)
+        content = await self.client.infer(model_name, data)
+        return content, 0.92, f"HuggingFace {model_name}"
+
+    def stats(self):
+        return {"backend": self.name, **self.client.stats()}
+
+
+class OnnxBackend(InferenceBackend):
+    """Local ONNX Runtime sessions on the CPU, one per model file, reused across requests.
+
+    Models take NCHW float32 RGB input. Images of a batch that share an
+    input shape are stacked into one session run (up to ONNX_MAX_BATCH)
+    when the model's batch dimension is dynamic.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, intra_op_threads=ONNX_INTRA_OP_THREADS, max_batch=ONNX_MAX_BATCH):
+        self.model_dir = model_dir
+        self.intra_op_threads = intra_op_threads
+        self.max_batch = max(1, max_batch)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        # Sessions parallelize internally (intra-op threads); one run at a time keeps that predictable
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='onnx')
+        self.runs = 0
+        self.items = 0
+
+    def model_path(self, model_type):
+        return os.path.join(self.model_dir, f"{model_type}.onnx")
+
+    def available(self):
+        return ort is not None and os.path.isdir(self.model_dir)
+
+    def model_id(self, model_type):
+        path = self.model_path(model_type)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return f"onnx:{model_type}:missing"
+        # Replacing the model file must not serve results cached from the old one
+        return f"onnx:{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def _session(self, model_type):
+        with self._lock:
+            session = self._sessions.get(model_type)
+            if session is None:
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = self.intra_op_threads
+                options.inter_op_num_threads = 1
+                options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                # Idle intra-op threads spinning would steal cores from the OpenCV workers
+                options.add_session_config_entry("session.intra_op.allow_spinning", ONNX_ALLOW_SPINNING)
+                session = ort.InferenceSession(
+                    self.model_path(model_type), sess_options=options, providers=["CPUExecutionProvider"]
+                )
+                self._sessions[model_type] = session
+            return session
+
+    def _input_size(self, session):
+        """Fixed (height, width) of the model input, or None if it takes any size"""
+        shape = session.get_inputs()[0].shape
+        if isinstance(shape[2], int) and isinstance(shape[3], int):
+            return shape[2], shape[3]
+        return None
+
+    def _preprocess(self, model_type, data):
+        session = self._session(model_type)
+        img = decode_image(data)
+        height, width = img.shape[:2]
+        size = self._input_size(session)
+        if size is not None and size != (height, width):
+            img = cv2.resize(img, (size[1], size[0]), interpolation=cv2.INTER_AREA)
+        tensor = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        if ONNX_NORMALIZE == "symmetric":
+            tensor = tensor * 2.0 - 1.0
+        return np.ascontiguousarray(tensor.transpose(2, 0, 1)), (height, width)
+
+    def _postprocess(self, output, original_size, input_size, encoding):
+        if ONNX_NORMALIZE == "symmetric":
+            output = (output + 1.0) / 2.0
+        img = np.clip(output.transpose(1, 2, 0) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        # Scale back to the original frame, keeping any upscaling the model applies
+        scale_y = img.shape[0] / input_size[0]
+        scale_x = img.shape[1] / input_size[1]
+        target = (round(original_size[1] * scale_x), round(original_size[0] * scale_y))
+        if (img.shape[1], img.shape[0]) != target:
+            img = cv2.resize(img, target, interpolation=cv2.INTER_CUBIC)
+        return encode_image(img, encoding)
+
+    def _run(self, model_type, tensors):
+        """Session outputs for same-shaped input tensors, stacked into as few runs as possible"""
+        session = self._session(model_type)
+        input_meta = session.get_inputs()[0]
+        # A fixed batch dimension means one run per item
+        chunk = 1 if isinstance(input_meta.shape[0], int) else self.max_batch
+        outputs = []
+        for start in range(0, len(tensors), chunk):
+            stacked = np.stack(tensors[start:start + chunk])
+            outputs.extend(session.run(None, {input_meta.name: stacked})[0])
+            self.runs += 1
+        self.items += len(tensors)
+        return outputs
+
+    def _enhance_many(self, model_type, items, encoding):
+        """Preprocess, run grouped by input shape, and encode; one result or exception per item"""
+        results = [None] * len(items)
+        groups = {}
+        for index, data in enumerate(items):
+            try:
+                tensor, original_size = self._preprocess(model_type, data)
+                groups.setdefault(tensor.shape, []).append((index, tensor, original_size))
+            except Exception as e:
+                results[index] = InferenceUnavailable(f"ONNX preprocessing failed for {model_type}: {e}")
+
+        method = f"ONNX Runtime {os.path.basename(self.model_path(model_type))}"
+        for shape, members in groups.items():
+            try:
+                outputs = self._run(model_type, [tensor for _, tensor, _ in members])
+            except Exception as e:
+                for index, _, _ in members:
+                    results[index] = InferenceUnavailable(f"ONNX inference failed for {model_type}: {e}")
+                continue
+            for (index, _, original_size), output in zip(members, outputs):
+                try:
+                    content = self._postprocess(output, original_size, shape[1:], encoding)
+                    results[index] = (content, 0.9, method)
+                except Exception as e:
+                    results[index] = InferenceUnavailable(f"ONNX postprocessing failed for {model_type}: {e}")
+        return results
+
+    async def enhance_batch(self, model_type, items, encoding=None):
+        if ort is None:
+            return [InferenceUnavailable("onnxruntime is not installed")] * len(items)
+        if not os.path.exists(self.model_path(model_type)):
+            return [InferenceUnavailable(f"No ONNX model for {model_type}")] * len(items)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._enhance_many, model_type, items, encoding)
+
+    async def enhance(self, model_type, data, encoding=None):
+        result = (await self.enhance_batch(model_type, [data], encoding))[0]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def warm_up(self):
+        """Load the sessions for every model file present"""
+        if not self.available():
+            return
+        for filename in sorted(os.listdir(self.model_dir)):
+            if filename.endswith(".onnx"):
+                await asyncio.to_thread(self._session, filename[:-len(".onnx")])
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "onnxruntime": ort.__version__ if ort is not None else None,
+            "sessions": sorted(self._sessions),
+            "intra_op_threads": self.intra_op_threads,
+            "runs": self.runs,
+            "items": self.items,
+            "average_batch": (self.items / self.runs) if self.runs else 0.0,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def get_inference_backend(client, models, backend=None):
+    """Create the configured inference backend"""
+    backend = backend or INFERENCE_BACKEND
+    if backend == "remote":
+        return RemoteBackend(client, models)
+    if backend == "onnx":
+        return OnnxBackend()
+    raise ValueError(f"Unknown inference backend: {backend}")
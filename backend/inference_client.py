@@ -0,0 +1,210 @@
+"""Resilient client for the remote inference API.
+
+All requests share per-model circuit breakers and concurrency limits:
+when a model keeps failing its circuit opens and callers fail fast to the
+local fallback instead of each retrying on its own. Retries back off
+exponentially with jitter and never run past the request's deadline.
+"""
+
+import os
+import time
+import random
+import asyncio
+import httpx
+
+# Inference client configuration
+INFERENCE_MAX_CONCURRENCY = int(os.environ.get('INFERENCE_MAX_CONCURRENCY', '8'))
+INFERENCE_MODEL_CONCURRENCY = int(os.environ.get('INFERENCE_MODEL_CONCURRENCY', '4'))
+INFERENCE_DEADLINE = float(os.environ.get('INFERENCE_DEADLINE', '30'))
+INFERENCE_MAX_ATTEMPTS = int(os.environ.get('INFERENCE_MAX_ATTEMPTS', '3'))
+INFERENCE_BACKOFF_BASE = float(os.environ.get('INFERENCE_BACKOFF_BASE', '0.5'))
+INFERENCE_BACKOFF_MAX = float(os.environ.get('INFERENCE_BACKOFF_MAX', '8'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Statuses worth retrying; they also count against the model's circuit
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class InferenceUnavailable(Exception):
+    """Raised when a model cannot produce a result within the request's budget"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open trial after a cool-down"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_running = False
+        self._opened = asyncio.Event()
+
+    def allow(self):
+        """Whether a request may go out now; in half-open state only one trial at a time"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+            self._opened.clear()
+        if self.state == "half_open":
+            if self._trial_running:
+                self.rejected += 1
+                return False
+            self._trial_running = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_running = False
+        self._opened.clear()
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._opened.set()
+
+    def release(self):
+        """End a trial that neither succeeded nor failed (e.g. the caller gave up)"""
+        self._trial_running = False
+
+    async def sleep(self, delay):
+        """Back off for `delay` seconds, waking early if the circuit opens meanwhile"""
+        try:
+            await asyncio.wait_for(self._opened.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+def backoff_delay(attempt, base=INFERENCE_BACKOFF_BASE, cap=INFERENCE_BACKOFF_MAX):
+    """Full-jitter exponential backoff for the given (zero-based) retry attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def suggested_delay(response):
+    """Server-suggested wait from Retry-After or a model-loading estimate, if any"""
+    retry_after = response.headers.get("retry-after")
+    if retry_after and retry_after.replace('.', '', 1).isdigit():
+        return float(retry_after)
+    try:
+        estimated = response.json().get("estimated_time")
+        return float(estimated) if estimated is not None else None
+    except Exception:
+        return None
+
+
+class InferenceClient:
+    """Posts images to `{api_url}{model}` through a shared httpx client"""
+
+    def __init__(self, get_http_client, api_url, api_key,
+                 max_concurrency=INFERENCE_MAX_CONCURRENCY, model_concurrency=INFERENCE_MODEL_CONCURRENCY,
+                 max_attempts=INFERENCE_MAX_ATTEMPTS, deadline=INFERENCE_DEADLINE):
+        self.get_http_client = get_http_client
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model_concurrency = model_concurrency
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self._global_limit = asyncio.Semaphore(max_concurrency)
+        self._model_limits = {}
+        self._breakers = {}
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def breaker(self, model_name):
+        breaker = self._breakers.get(model_name)
+        if breaker is None:
+            breaker = self._breakers[model_name] = CircuitBreaker()
+        return breaker
+
+    def _model_limit(self, model_name):
+        limit = self._model_limits.get(model_name)
+        if limit is None:
+            limit = self._model_limits[model_name] = asyncio.Semaphore(self.model_concurrency)
+        return limit
+
+    async def infer(self, model_name, data, deadline=None):
+        """Return the model's response body for `data`, or raise InferenceUnavailable"""
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        breaker = self.breaker(model_name)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                self.failures += 1
+                raise InferenceUnavailable(f"circuit open for {model_name}")
+
+            delay = None
+            try:
+                response = await self._post(model_name, data, headers, expires)
+            except InferenceUnavailable:
+                breaker.release()
+                self.failures += 1
+                raise
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                print(f"Inference request error for {model_name} (attempt {attempt + 1}/{self.max_attempts}): {e}")
+            except BaseException:
+                # Cancelled (job stopped, client gone) or a bug: no verdict on the model,
+                # but a half-open trial must not stay claimed forever
+                breaker.release()
+                raise
+            else:
+                if response.status_code == 200:
+                    breaker.record_success()
+                    return response.content
+                if response.status_code not in RETRYABLE_STATUSES:
+                    # The request itself is bad; retrying or tripping the circuit would not help
+                    breaker.record_success()
+                    self.failures += 1
+                    raise InferenceUnavailable(f"{model_name} returned {response.status_code}: {response.text[:200]}")
+                breaker.record_failure()
+                delay = suggested_delay(response)
+                print(f"Inference {model_name} returned {response.status_code} (attempt {attempt + 1}/{self.max_attempts})")
+
+            # Once the circuit is open, retrying would only delay the fallback
+            if attempt == self.max_attempts - 1 or breaker.state == "open":
+                break
+            delay = backoff_delay(attempt) if delay is None else min(delay, INFERENCE_BACKOFF_MAX)
+            if time.monotonic() + delay >= expires:
+                break
+            self.retries += 1
+            await breaker.sleep(delay)
+
+        self.failures += 1
+        raise InferenceUnavailable(f"{model_name} unavailable after retries")
+
+    async def _post(self, model_name, data, headers, expires):
+        """One request under the global and per-model limits, bounded by the deadline"""
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise InferenceUnavailable("deadline exceeded")
+        try:
+            return await asyncio.wait_for(self._limited_post(model_name, data, headers), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise InferenceUnavailable("deadline exceeded")
+
+    async def _limited_post(self, model_name, data, headers):
+        async with self._global_limit, self._model_limit(model_name):
+            self.requests += 1
+            return await self.get_http_client().post(f"{self.api_url}{model_name}", headers=headers, content=data)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "circuits": {model: breaker.stats() for model, breaker in self._breakers.items()},
+        }
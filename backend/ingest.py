@@ -0,0 +1,102 @@
+"""Streaming upload ingestion.
+
+Uploads are copied chunk by chunk from the spooled multipart file into
+the blob store (hashing as they go), so a request never holds more than
+one chunk of the image in memory. Oversized bodies are rejected from the
+Content-Length header, or as soon as the streamed byte count exceeds the
+limit.
+"""
+
+import os
+import json
+import asyncio
+
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get('MAX_BATCH_UPLOAD_BYTES', str(2 * 1024 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds its configured size limit"""
+
+    def __init__(self, limit):
+        super().__init__(f"Upload exceeds {limit} bytes")
+        self.limit = limit
+
+
+async def stream_upload_to_store(file, store, max_bytes=MAX_UPLOAD_BYTES):
+    """Copy an UploadFile into the blob store; returns (blob_id, size)"""
+    writer = await asyncio.to_thread(store.new_file)
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if writer.length + len(chunk) > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            await asyncio.to_thread(writer.write, chunk)
+        blob_id = await asyncio.to_thread(writer.close)
+        return blob_id, writer.length
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+
+
+class _BodyTooLarge(BaseException):
+    # BaseException so request-body parsing does not turn it into a generic 400
+    pass
+
+
+class MaxBodySizeMiddleware:
+    """ASGI middleware rejecting request bodies above a per-path limit with 413"""
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def _reject(self, send, limit):
+        body = json.dumps({"detail": f"Request body exceeds {limit} bytes"}).encode('utf-8')
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self._reject(send, limit)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
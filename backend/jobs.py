@@ -0,0 +1,291 @@
+"""Mongo-backed background job queue.
+
+Jobs are documents in a collection; a fixed number of asyncio workers
+claim queued jobs atomically, run a handler coroutine and record
+progress. Progress updates are also pushed to in-process subscribers so
+the SSE endpoint does not have to poll Mongo.
+
+A claim holds a lease that the running process renews; a job whose lease
+expired (its process died) is claimed again by any worker, so several
+server processes can share one queue without running a job twice. Each
+claim counts as an attempt, and a job is failed after JOB_MAX_ATTEMPTS.
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument
+
+# Job queue configuration
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1.0'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '20'))
+
+JOB_TERMINAL_STATES = ("completed", "failed")
+
+
+class JobRetry(Exception):
+    """Raised by a handler to put its job back in the queue after `delay` seconds"""
+
+    def __init__(self, delay, reason=""):
+        super().__init__(reason)
+        self.delay = delay
+
+
+def public_job(job):
+    """Job document as returned by the API"""
+    job = dict(job)
+    job.pop('_id', None)
+    job.pop('not_before', None)
+    job.pop('lease_until', None)
+    return job
+
+
+class JobQueue:
+    """Runs `handlers[job_type](job, progress)` for queued job documents"""
+
+    def __init__(self, collection, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL,
+                 lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.collection = collection
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Identifies this process's claims
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self.failure_hooks = {}
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._subscribers = {}
+
+    def register(self, job_type, handler, on_failed=None):
+        """Set the handler of a job type.
+
+        `on_failed(job, error)` is awaited when the queue fails a job without
+        running its handler (attempts exhausted), so the handler's own
+        bookkeeping can be brought in line.
+        """
+        self.handlers[job_type] = handler
+        if on_failed is not None:
+            self.failure_hooks[job_type] = on_failed
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("job_id", ASCENDING)], unique=True)
+        await self.collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await self.collection.create_index([("batch_id", ASCENDING)], sparse=True)
+        await self.collection.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+
+    def _new_job(self, job_type, payload, batch_id=None):
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "progress": 0.0,
+            "stage": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "not_before": now,
+            "attempts": 0,
+        }
+        if batch_id:
+            job["batch_id"] = batch_id
+        return job
+
+    async def submit(self, job_type, payload):
+        """Insert a queued job and wake a worker; returns the job document"""
+        job = self._new_job(job_type, payload)
+        await self.collection.insert_one(dict(job))
+        self._wakeup.set()
+        return public_job(job)
+
+    async def submit_many(self, job_type, payloads, batch_id=None):
+        """Insert several queued jobs with one insert_many; returns their documents in order"""
+        jobs = [self._new_job(job_type, payload, batch_id) for payload in payloads]
+        if jobs:
+            await self.collection.insert_many([dict(job) for job in jobs], ordered=True)
+            self._wakeup.set()
+        return [public_job(job) for job in jobs]
+
+    async def get_batch(self, batch_id):
+        return await self.collection.find({"batch_id": batch_id}, {"_id": 0, "not_before": 0, "lease_until": 0}).to_list(length=None)
+
+    async def get(self, job_id):
+        return await self.collection.find_one({"job_id": job_id}, {"_id": 0})
+
+    def is_last_attempt(self, job):
+        """Whether a failed or retried run of this claim ends the job"""
+        return job.get('attempts', 0) >= self.max_attempts
+
+    async def start(self):
+        # Jobs left running by a process that died are claimed again once their lease expires
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self):
+        now = datetime.now()
+        lease_until = (now + timedelta(seconds=self.lease_seconds)).isoformat()
+        now = now.isoformat()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "not_before": {"$lte": now}},
+                # Running under an expired lease, or claimed before jobs had leases
+                {"status": "running", "lease_until": {"$lt": now}},
+                {"status": "running", "lease_until": {"$exists": False}},
+            ]},
+            {"$set": {"status": "running", "stage": "starting", "started_at": now, "updated_at": now,
+                      "owner": self.owner, "lease_until": lease_until},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _renew_lease(self, job):
+        """Extend the lease of a running job until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            lease_until = (datetime.now() + timedelta(seconds=self.lease_seconds)).isoformat()
+            try:
+                await self.collection.update_one(self._claim_filter(job), {"$set": {"lease_until": lease_until}})
+            except Exception as e:
+                print(f"Job {job['job_id']} lease renewal error: {e}")
+
+    def _claim_filter(self, job):
+        """Matches the job only while this claim of it is current"""
+        return {"job_id": job['job_id'], "owner": self.owner, "attempts": job['attempts']}
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                print(f"Job claim error: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._publish(job)
+            await self._run(job)
+
+    async def _run(self, job):
+        handler = self.handlers.get(job['type'])
+        job_id = job['job_id']
+        claim = self._claim_filter(job)
+
+        async def progress(value, stage):
+            await self._update(claim, {"progress": value, "stage": stage})
+
+        renewal = asyncio.create_task(self._renew_lease(job))
+        handler_ran = False
+        try:
+            if job['attempts'] > self.max_attempts:
+                raise RuntimeError(f"Gave up after {job['attempts'] - 1} attempts")
+            if handler is None:
+                raise ValueError(f"No handler for job type {job['type']}")
+            handler_ran = True
+            result = await handler(job, progress)
+            await self._update(claim, {
+                "status": "completed",
+                "progress": 1.0,
+                "stage": "completed",
+                "result": result,
+                "finished_at": datetime.now().isoformat(),
+            })
+        except asyncio.CancelledError:
+            raise
+        except JobRetry as retry:
+            if self.is_last_attempt(job):
+                print(f"Job {job_id} failed: gave up retrying after {job['attempts']} attempts ({retry})")
+                await self._update(claim, {
+                    "status": "failed",
+                    "stage": "failed",
+                    "error": f"Gave up after {job['attempts']} attempts: {retry}",
+                    "finished_at": datetime.now().isoformat(),
+                })
+            else:
+                not_before = (datetime.now() + timedelta(seconds=retry.delay)).isoformat()
+                await self._update(claim, {"status": "queued", "stage": "waiting", "not_before": not_before})
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            await self._update(claim, {
+                "status": "failed",
+                "stage": "failed",
+                "error": str(e),
+                "finished_at": datetime.now().isoformat(),
+            })
+            if not handler_ran:
+                await self._notify_failed(job, str(e))
+        finally:
+            renewal.cancel()
+
+    async def _notify_failed(self, job, error):
+        hook = self.failure_hooks.get(job['type'])
+        if hook is None:
+            return
+        try:
+            await hook(job, error)
+        except Exception as e:
+            print(f"Job {job['job_id']} failure hook error: {e}")
+
+    async def _update(self, claim, fields):
+        """Update a job, unless another claim of it has taken over"""
+        fields["updated_at"] = datetime.now().isoformat()
+        job = await self.collection.find_one_and_update(
+            claim,
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            self._publish(job)
+
+    def _publish(self, job):
+        for queue in self._subscribers.get(job['job_id'], ()):
+            queue.put_nowait(public_job(job))
+
+    async def watch(self, job_id, heartbeat=15.0):
+        """Yield the job document each time it changes until it reaches a terminal state.
+
+        Yields None on heartbeat timeouts so callers can keep connections alive.
+        """
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            last = None
+            while True:
+                if job != last:
+                    yield public_job(job)
+                    last = job
+                if job['status'] in JOB_TERMINAL_STATES:
+                    return
+                try:
+                    job = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # The job may be running in another server process; re-read it
+                    job = await self.get(job_id) or job
+                    if job == last:
+                        yield None
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
@@ -0,0 +1,226 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated as requests and pipeline stages run;
+collectors are callables evaluated at scrape time that turn the stats()
+of other components (worker pool, result cache, inference client, ...)
+into metric samples without double bookkeeping.
+"""
+
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from fast Mongo lookups to slow remote inference
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = key + (("le", _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics plus scrape-time collectors"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, kind, help, [(labels_dict, value), ...]) tuples"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count, status and latency per route template"""
+
+    def __init__(self, app, requests_total, request_duration):
+        self.app = app
+        self.requests_total = requests_total
+        self.request_duration = request_duration
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def tracking_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            # The router stores the matched route in the scope; templates keep label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope.get("method", "")
+            self.requests_total.inc(method=method, route=path, status=str(status))
+            self.request_duration.observe(time.perf_counter() - started, method=method, route=path)
+
+
+# Process-wide registry and the metrics shared across modules
+registry = Registry()
+
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+)
+stage_duration_seconds = registry.histogram(
+    "stage_duration_seconds", "Latency of individual pipeline stages", ("stage",)
+)
+enhancement_fallbacks_total = registry.counter(
+    "enhancement_fallbacks_total", "Enhancements served by the OpenCV fallback or as a pass-through", ("reason",)
+)
+enhancement_jobs_total = registry.counter(
+    "enhancement_jobs_total", "Finished enhancement job attempts by outcome", ("status",)
+)
+enhancement_duration_seconds = registry.histogram(
+    "enhancement_duration_seconds", "End-to-end enhancement time", ("enhancement_type", "region", "cache_hit")
+)
+storage_reclaimed_bytes_total = registry.counter(
+    "storage_reclaimed_bytes_total", "Bytes freed by storage compaction", ("kind",)
+)
+enhancement_routing_decisions_total = registry.counter(
+    "enhancement_routing_decisions_total", "Quality-based routing decisions for auto enhancements",
+    ("action", "enhancement_type")
+)
+
+
+def observe_stages(timings, prefix=""):
+    """Record a {stage: seconds} dict as produced by the image pipelines"""
+    for stage, seconds in timings.items():
+        stage_duration_seconds.observe(seconds, stage=f"{prefix}{stage}")
+
+
+def stage_timer(stage):
+    """Context manager timing one stage, e.g. a Mongo round trip"""
+    return stage_duration_seconds.time(stage=stage)
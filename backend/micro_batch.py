@@ -0,0 +1,83 @@
+"""Micro-batching of concurrent calls.
+
+Callers submit items under a group key. Items of the same group that
+arrive within `max_wait` seconds of the first one, up to `max_batch`, are
+handed to the batch function together and every caller receives its own
+result (or exception) back.
+"""
+
+import time
+import asyncio
+
+
+class MicroBatcher:
+    """Collects items per key and runs `run_batch(key, items)` on each group"""
+
+    def __init__(self, run_batch, max_batch, max_wait):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = {}
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    async def submit(self, key, item):
+        """Queue an item and wait for its result from the batch it ends up in"""
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future, time.perf_counter()))
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.create_task(self._dispatch(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _record(self, batch):
+        now = time.perf_counter()
+        waits = [now - submitted for _, _, submitted in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        self.queue_seconds_total += sum(waits)
+        self.queue_seconds_max = max(self.queue_seconds_max, max(waits))
+
+    async def _dispatch(self, key, batch):
+        self._record(batch)
+        try:
+            results = await self.run_batch(key, [item for item, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "average_queue_seconds": (self.queue_seconds_total / self.items) if self.items else 0.0,
+            "max_queue_seconds": self.queue_seconds_max,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+        }
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Move inline base64 images out of the cases/results collections into the blob store.
+
+Usage: python migrate_blobs.py [--dry-run]
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from blob_store import INLINE_IMAGE_FIELDS, get_blob_store, inline_images_update
+
+load_dotenv()
+
+
+def migrate_collection(collection, fields, store, dry_run=False):
+    """Replace a collection's inline images with blob references; returns the documents migrated"""
+    migrated = 0
+    query = {"$or": [{field: {"$exists": True}} for field, _, _ in fields]}
+    projection = {field: 1 for field, _, _ in fields}
+    for doc in collection.find(query, projection):
+        try:
+            update, _ = inline_images_update(doc, fields, store, dry_run)
+            if update and not dry_run:
+                collection.update_one({"_id": doc['_id']}, update)
+            migrated += 1
+        except Exception as e:
+            print(f"Failed to migrate {collection.name} document {doc['_id']}: {e}")
+    return migrated
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv[1:]
+    client = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017/'))
+    db = client['face_reconstruction_db']
+    store = get_blob_store()
+
+    cases = migrate_collection(db['cases'], INLINE_IMAGE_FIELDS['cases'], store, dry_run)
+    results = migrate_collection(db['results'], INLINE_IMAGE_FIELDS['results'], store, dry_run)
+    prefix = "Would migrate" if dry_run else "Migrated"
+    print(f"{prefix} {cases} cases and {results} results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Near-duplicate lookup over perceptual image hashes.
+
+Every case stores a 64-bit pHash and dHash of its image (see
+image_ops.perceptual_hashes). The pHashes live in a BK-tree, so a query
+only visits the subtrees that can hold hashes within the Hamming
+distance instead of scanning every case; candidates are then confirmed
+with the dHash, which keeps unrelated images with a similar layout out.
+
+The index is in-process: it is loaded from the cases collection at
+startup and updated as this process accepts uploads.
+"""
+
+import os
+import threading
+
+# Near-duplicate configuration (Hamming distances out of 64 bits)
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get('NEAR_DUPLICATE_MAX_DISTANCE', '8'))
+NEAR_DUPLICATE_DHASH_MAX_DISTANCE = int(os.environ.get('NEAR_DUPLICATE_DHASH_MAX_DISTANCE', '12'))
+NEAR_DUPLICATE_LIMIT = int(os.environ.get('NEAR_DUPLICATE_LIMIT', '5'))
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes given as ints"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under the Hamming metric.
+
+    Each node keeps its children by their distance to it; by the triangle
+    inequality a search within `radius` of a query at distance d from a
+    node only needs the children at distances d - radius .. d + radius.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def add(self, value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            node_value, items, children = node
+            distance = hamming(value, node_value)
+            if distance == 0:
+                items.append(item)
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """[(distance, value, item)] for every stored hash within `radius` of `value`"""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((distance, node_value, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+    def __len__(self):
+        return self._size
+
+
+class NearDuplicateIndex:
+    """Case ids by perceptual hash, searchable within a Hamming distance"""
+
+    def __init__(self, cases_collection, max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+                 dhash_max_distance=NEAR_DUPLICATE_DHASH_MAX_DISTANCE):
+        self.cases_collection = cases_collection
+        self.max_distance = max_distance
+        self.dhash_max_distance = dhash_max_distance
+        self._tree = BKTree()
+        self._known = set()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    async def load(self):
+        """Index every stored case that has perceptual hashes"""
+        cursor = self.cases_collection.find(
+            {"phash": {"$exists": True}}, {"_id": 0, "case_id": 1, "phash": 1, "dhash": 1}
+        )
+        async for case in cursor:
+            self.add(case["case_id"], case["phash"], case.get("dhash"))
+
+    def add(self, case_id, phash, dhash=None):
+        if not phash:
+            return
+        with self._lock:
+            if case_id in self._known:
+                return
+            self._known.add(case_id)
+            self._tree.add(int(phash, 16), (case_id, int(dhash, 16) if dhash else None))
+
+    def find(self, phash, dhash=None, max_distance=None, limit=NEAR_DUPLICATE_LIMIT, exclude=None):
+        """Closest cases first as [{case_id, distance}], at most `limit` of them"""
+        if not phash:
+            return []
+        radius = self.max_distance if max_distance is None else max_distance
+        query_dhash = int(dhash, 16) if dhash else None
+        with self._lock:
+            candidates = self._tree.search(int(phash, 16), radius)
+        matches = []
+        for distance, _, (case_id, case_dhash) in candidates:
+            if case_id == exclude:
+                continue
+            if query_dhash is not None and case_dhash is not None and \
+                    hamming(query_dhash, case_dhash) > self.dhash_max_distance:
+                continue
+            matches.append({"case_id": case_id, "distance": distance})
+        matches.sort(key=lambda match: (match["distance"], match["case_id"]))
+        self.lookups += 1
+        if matches:
+            self.matches += 1
+        return matches[:limit]
+
+    def stats(self):
+        return {
+            "indexed": len(self._tree),
+            "max_distance": self.max_distance,
+            "dhash_max_distance": self.dhash_max_distance,
+            "lookups": self.lookups,
+            "matches": self.matches,
+        }
@@ -0,0 +1,128 @@
+"""Enhancement result memoization.
+
+Results are keyed by (decoded image hash, enhancement type, model,
+pipeline version). Lookups go through an in-process LRU bounded by a byte
+budget and then the persistent `results` collection, where every stored
+result carries its `cache_key`.
+"""
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from pymongo import ASCENDING, DESCENDING
+
+# Result cache configuration
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+# Result fields needed to answer a cache hit without running the pipeline
+CACHED_RESULT_FIELDS = (
+    "result_id", "enhanced_blob", "enhanced_format", "thumbnails", "thumbnail_format",
+    "confidence_score", "method_used", "stage_timings"
+)
+
+
+def make_cache_key(image_hash, enhancement_type, model_name, pipeline_version):
+    raw = json.dumps([image_hash, enhancement_type, model_name, pipeline_version])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Least-recently-used mapping whose entries are evicted once `max_bytes` is exceeded"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache:
+    """Two-tier (memory, then Mongo) lookup of previous enhancement results"""
+
+    def __init__(self, results_collection, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.results_collection = results_collection
+        self.memory = LRUCache(max_bytes)
+        self.hits_memory = 0
+        self.hits_persistent = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stored = 0
+
+    async def ensure_indexes(self):
+        await self.results_collection.create_index([("cache_key", ASCENDING), ("processing_timestamp", DESCENDING)])
+
+    async def get(self, cache_key):
+        """Return the cached result fields for a key, or None"""
+        entry = self.memory.get(cache_key)
+        if entry is not None:
+            self.hits_memory += 1
+            return entry
+
+        projection = {field: 1 for field in CACHED_RESULT_FIELDS}
+        projection["_id"] = 0
+        result = await self.results_collection.find_one(
+            {"cache_key": cache_key, "status": "completed"},
+            projection,
+            sort=[("processing_timestamp", DESCENDING)]
+        )
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits_persistent += 1
+        self.remember(cache_key, result)
+        return result
+
+    def remember(self, cache_key, result):
+        entry = {field: result[field] for field in CACHED_RESULT_FIELDS if field in result}
+        self.memory.put(cache_key, entry, len(json.dumps(entry)))
+        self.stored += 1
+
+    def forget(self, cache_keys):
+        """Drop in-memory entries for results that were deleted"""
+        for cache_key in cache_keys:
+            if cache_key:
+                self.memory.discard(cache_key)
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_persistent + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_persistent": self.hits_persistent,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stored": self.stored,
+            "hit_rate": ((self.hits_memory + self.hits_persistent) / lookups) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+            "memory_max_bytes": self.memory.max_bytes,
+        }
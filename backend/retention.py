@@ -0,0 +1,387 @@
+"""Retention policies, cold-image archival and storage compaction.
+
+RetentionManager.compact() applies the policies in bounded, rate-limited
+batches and returns a report of what it reclaimed:
+
+  1. expire   results older than RESULT_TTL_DAYS are deleted
+  2. trim     only the RESULT_KEEP_LATEST newest results of each case are kept
+  3. inline   base64 images still embedded in legacy documents move to the
+              blob store (what migrate_blobs.py does offline)
+  4. archive  cases idle for ARCHIVE_AFTER_DAYS have their original, results
+              and previews written to a compressed zip under ARCHIVE_PATH
+  5. collect  blobs no longer referenced by a live document are deleted
+
+A policy set to 0 is disabled. A case's current result (its `result_id`)
+is never expired or trimmed. Archived images are restored to the blob
+store when they are next needed (rehydrate).
+
+Blobs are content-addressed and shared between documents, so the earlier
+steps never delete blobs themselves: the collect step marks every blob
+referenced by a case or result that is not archived, every video a case
+was sampled from and every video an unfinished ingest job will read, and
+sweeps the rest, sparing blobs written within BLOB_GC_GRACE_SECONDS,
+since an upload stores its blob before the document that references it.
+"""
+
+import os
+import json
+import time
+import asyncio
+import zipfile
+from datetime import datetime, timedelta
+
+from blob_store import INLINE_IMAGE_FIELDS, BlobNotFound, inline_images_update
+from image_ops import sniff_image_type
+from jobs import JOB_TERMINAL_STATES
+
+# Retention policies (0 disables)
+RESULT_TTL_DAYS = float(os.environ.get('RESULT_TTL_DAYS', '0'))
+RESULT_KEEP_LATEST = int(os.environ.get('RESULT_KEEP_LATEST', '0'))
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '0'))
+ARCHIVE_PATH = os.environ.get(
+    'ARCHIVE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+)
+
+# Compaction pacing
+BLOB_GC_GRACE_SECONDS = float(os.environ.get('BLOB_GC_GRACE_SECONDS', '3600'))
+COMPACTION_BATCH_SIZE = int(os.environ.get('COMPACTION_BATCH_SIZE', '100'))
+COMPACTION_MAX_OPS_PER_SECOND = float(os.environ.get('COMPACTION_MAX_OPS_PER_SECOND', '200'))
+# Hours between scheduled compaction jobs; 0 runs them only on request
+COMPACTION_INTERVAL_HOURS = float(os.environ.get('COMPACTION_INTERVAL_HOURS', '0'))
+
+ARCHIVE_MANIFEST = "manifest.json"
+
+# Already-compressed formats are stored as is; everything else is LZMA-compressed
+STORED_CONTENT_TYPES = ("image/jpeg", "image/webp")
+
+# Fraction of the job's progress at which each step starts
+COMPACTION_STEPS = (("expire", 0.0), ("trim", 0.15), ("inline", 0.3), ("archive", 0.45), ("collect", 0.75))
+
+
+class RateLimiter:
+    """Paces operations to at most `rate` per second (0 disables)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+
+    async def acquire(self, count=1):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        start = max(self._next, now)
+        self._next = start + count / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def document_blobs(doc):
+    """Blob ids a case or result document references"""
+    blobs = {doc.get('original_blob'), doc.get('enhanced_blob'), *(doc.get('thumbnails') or {}).values()}
+    blobs.discard(None)
+    return blobs
+
+
+BLOB_FIELDS = {"_id": 0, "original_blob": 1, "enhanced_blob": 1, "thumbnails": 1}
+
+
+async def _chunks(cursor, size):
+    chunk = []
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RetentionManager:
+    """Applies the retention policies to the cases and results collections and the blob store"""
+
+    def __init__(self, cases_collection, results_collection, blob_store, result_cache=None, jobs_collection=None,
+                 ttl_days=RESULT_TTL_DAYS, keep_latest=RESULT_KEEP_LATEST, archive_after_days=ARCHIVE_AFTER_DAYS,
+                 archive_path=ARCHIVE_PATH, grace_seconds=BLOB_GC_GRACE_SECONDS,
+                 batch_size=COMPACTION_BATCH_SIZE, max_ops_per_second=COMPACTION_MAX_OPS_PER_SECOND):
+        self.cases_collection = cases_collection
+        self.results_collection = results_collection
+        self.blob_store = blob_store
+        self.result_cache = result_cache
+        self.jobs_collection = jobs_collection
+        self.ttl_days = ttl_days
+        self.keep_latest = keep_latest
+        self.archive_after_days = archive_after_days
+        self.archive_path = archive_path
+        self.grace_seconds = grace_seconds
+        self.batch_size = batch_size
+        self.max_ops_per_second = max_ops_per_second
+        self.last_report = None
+        self.rehydrated = 0
+
+    def policy(self):
+        return {
+            "result_ttl_days": self.ttl_days,
+            "result_keep_latest": self.keep_latest,
+            "archive_after_days": self.archive_after_days,
+            "blob_gc_grace_seconds": self.grace_seconds,
+            "max_ops_per_second": self.max_ops_per_second,
+        }
+
+    def stats(self):
+        last = self.last_report or {}
+        return {
+            **self.policy(),
+            "last_compaction": last.get("finished_at"),
+            "last_bytes_reclaimed": last.get("bytes_reclaimed"),
+            "rehydrated": self.rehydrated,
+        }
+
+    async def compact(self, progress=None, dry_run=False):
+        """Run every enabled policy; returns the compaction report"""
+        report = {
+            "dry_run": dry_run,
+            "started_at": datetime.now().isoformat(),
+            "policy": self.policy(),
+            "results_expired": 0,
+            "results_trimmed": 0,
+            "images_migrated": 0,
+            "cases_archived": 0,
+            "archive_errors": 0,
+            "archive_bytes_written": 0,
+            "blobs_deleted": 0,
+            "bytes_reclaimed": {"blob_store": 0, "inline_images": 0},
+            "collections": {"before": await self._collection_sizes()},
+        }
+        limiter = RateLimiter(self.max_ops_per_second)
+        steps = {
+            "expire": self._expire_results,
+            "trim": self._trim_results,
+            "inline": self._migrate_inline_images,
+            "archive": self._archive_cold_cases,
+            "collect": self._collect_blobs,
+        }
+        for stage, start in COMPACTION_STEPS:
+            if progress is not None:
+                await progress(start, stage)
+            await steps[stage](report, limiter, dry_run)
+
+        report["collections"]["after"] = await self._collection_sizes()
+        report["finished_at"] = datetime.now().isoformat()
+        self.last_report = report
+        return report
+
+    async def _collection_sizes(self):
+        """Data and storage size of each collection, where the server reports them"""
+        sizes = {}
+        for collection in (self.cases_collection, self.results_collection):
+            try:
+                stats = await collection.database.command("collStats", collection.name)
+                sizes[collection.name] = {
+                    "count": stats.get("count"), "size": stats.get("size"), "storage_size": stats.get("storageSize")
+                }
+            except Exception:
+                sizes[collection.name] = None
+        return sizes
+
+    async def _delete_results(self, results, limiter, dry_run):
+        """Delete result documents except each case's current result; returns how many went"""
+        case_ids = list({result['case_id'] for result in results})
+        current = {
+            case.get('result_id') for case in await self.cases_collection.find(
+                {"case_id": {"$in": case_ids}}, {"_id": 0, "result_id": 1}
+            ).to_list(length=None)
+        }
+        doomed = [result for result in results if result['result_id'] not in current]
+        if doomed and not dry_run:
+            await limiter.acquire(len(doomed))
+            await self.results_collection.delete_many({"result_id": {"$in": [r['result_id'] for r in doomed]}})
+            if self.result_cache is not None:
+                self.result_cache.forget(result.get('cache_key') for result in doomed)
+        return len(doomed)
+
+    async def _expire_results(self, report, limiter, dry_run):
+        if self.ttl_days <= 0:
+            return
+        cutoff = (datetime.now() - timedelta(days=self.ttl_days)).isoformat()
+        cursor = self.results_collection.find(
+            {"processing_timestamp": {"$lt": cutoff}},
+            {"_id": 0, "result_id": 1, "case_id": 1, "cache_key": 1}
+        ).sort("processing_timestamp", 1)
+        async for chunk in _chunks(cursor, self.batch_size):
+            report["results_expired"] += await self._delete_results(chunk, limiter, dry_run)
+
+    async def _trim_results(self, report, limiter, dry_run):
+        if self.keep_latest <= 0:
+            return
+        crowded = self.results_collection.aggregate([
+            {"$group": {"_id": "$case_id", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": self.keep_latest}}},
+        ], allowDiskUse=True)
+        async for group in crowded:
+            older = await self.results_collection.find(
+                {"case_id": group['_id']}, {"_id": 0, "result_id": 1, "case_id": 1, "cache_key": 1}
+            ).sort("processing_timestamp", -1).skip(self.keep_latest).to_list(length=None)
+            for start in range(0, len(older), self.batch_size):
+                report["results_trimmed"] += await self._delete_results(
+                    older[start:start + self.batch_size], limiter, dry_run
+                )
+
+    async def _migrate_inline_images(self, report, limiter, dry_run):
+        for collection, fields in ((self.cases_collection, INLINE_IMAGE_FIELDS["cases"]),
+                                   (self.results_collection, INLINE_IMAGE_FIELDS["results"])):
+            query = {"$or": [{field: {"$exists": True}} for field, _, _ in fields]}
+            projection = {field: 1 for field, _, _ in fields}
+            async for chunk in _chunks(collection.find(query, projection), self.batch_size):
+                await limiter.acquire(len(chunk))
+                for doc in chunk:
+                    try:
+                        update, inline_bytes = await asyncio.to_thread(
+                            inline_images_update, doc, fields, self.blob_store, dry_run
+                        )
+                    except Exception as e:
+                        print(f"Failed to migrate {collection.name} document {doc['_id']}: {e}")
+                        continue
+                    if update and not dry_run:
+                        await collection.update_one({"_id": doc['_id']}, update)
+                    report["images_migrated"] += 1
+                    report["bytes_reclaimed"]["inline_images"] += inline_bytes
+
+    async def _archive_cold_cases(self, report, limiter, dry_run):
+        if self.archive_after_days <= 0:
+            return
+        cutoff = (datetime.now() - timedelta(days=self.archive_after_days)).isoformat()
+        cursor = self.cases_collection.find(
+            {"upload_time": {"$lt": cutoff}, "archive": {"$exists": False}, "original_blob": {"$exists": True},
+             "status": {"$nin": ["queued", "running"]}},
+            {"_id": 0, "case_id": 1, "original_blob": 1, "thumbnails": 1}
+        ).sort("upload_time", 1)
+        async for chunk in _chunks(cursor, self.batch_size):
+            for case in chunk:
+                # Enhanced recently: still in use
+                if await self.results_collection.find_one(
+                    {"case_id": case['case_id'], "processing_timestamp": {"$gte": cutoff}}, {"_id": 1}
+                ):
+                    continue
+                results = await self.results_collection.find(
+                    {"case_id": case['case_id']}, {"result_id": 1, **BLOB_FIELDS}
+                ).to_list(length=None)
+                await limiter.acquire(1 + len(results))
+                if dry_run:
+                    report["cases_archived"] += 1
+                    continue
+                try:
+                    archive = await asyncio.to_thread(self._write_archive, case, results)
+                except BlobNotFound as e:
+                    print(f"Archive of case {case['case_id']} skipped, blob missing: {e}")
+                    report["archive_errors"] += 1
+                    continue
+                await self.cases_collection.update_one({"case_id": case['case_id']}, {"$set": {"archive": archive}})
+                await self.results_collection.update_many({"case_id": case['case_id']}, {"$set": {"archive": archive}})
+                report["cases_archived"] += 1
+                report["archive_bytes_written"] += archive["bytes"]
+
+    def _write_archive(self, case, results):
+        """Zip a case's blobs (named by blob id) with a manifest; returns the archive reference"""
+        relative = os.path.join(case['case_id'][:2], f"{case['case_id']}.zip")
+        path = os.path.join(self.archive_path, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blobs = sorted(document_blobs(case).union(*(document_blobs(result) for result in results)))
+        manifest = {
+            "case_id": case['case_id'],
+            "result_ids": [result['result_id'] for result in results],
+            "blobs": blobs,
+            "archived_at": datetime.now().isoformat(),
+        }
+        tmp_path = path + ".tmp"
+        try:
+            with zipfile.ZipFile(tmp_path, "w") as archive:
+                archive.writestr(ARCHIVE_MANIFEST, json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+                for blob_id in blobs:
+                    data = self.blob_store.read(blob_id)
+                    stored = sniff_image_type(data) in STORED_CONTENT_TYPES
+                    archive.writestr(blob_id, data, zipfile.ZIP_STORED if stored else zipfile.ZIP_LZMA)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"path": relative, "archived_at": manifest["archived_at"], "blobs": len(blobs),
+                "bytes": os.path.getsize(path)}
+
+    async def _collect_blobs(self, report, limiter, dry_run):
+        # Mark: every blob a live (not archived) case or result references
+        referenced = set()
+        for collection in (self.cases_collection, self.results_collection):
+            async for doc in collection.find({"archive": {"$exists": False}}, BLOB_FIELDS):
+                referenced |= document_blobs(doc)
+        # Videos are not archived with the cases sampled from them
+        async for case in self.cases_collection.find(
+            {"source_video.video_blob": {"$ne": None}}, {"_id": 0, "source_video.video_blob": 1}
+        ):
+            referenced.add(case['source_video']['video_blob'])
+        if self.jobs_collection is not None:
+            # Queued, running or retried ingest jobs still have to read their video
+            async for job in self.jobs_collection.find(
+                {"status": {"$nin": list(JOB_TERMINAL_STATES)}, "payload.video_blob": {"$ne": None}},
+                {"_id": 0, "payload.video_blob": 1}
+            ):
+                referenced.add(job['payload']['video_blob'])
+
+        # Sweep what is left, sparing blobs written during the grace period
+        cutoff = time.time() - self.grace_seconds
+        candidates = await asyncio.to_thread(
+            lambda: [(blob_id, size) for blob_id, size, mtime in self.blob_store.iter_blobs()
+                     if blob_id not in referenced and mtime < cutoff]
+        )
+        for start in range(0, len(candidates), self.batch_size):
+            chunk = candidates[start:start + self.batch_size]
+            await limiter.acquire(len(chunk))
+            deleted = chunk if dry_run else await asyncio.to_thread(self._delete_blobs, chunk, cutoff)
+            report["blobs_deleted"] += len(deleted)
+            report["bytes_reclaimed"]["blob_store"] += sum(size for _, size in deleted)
+
+    def _delete_blobs(self, candidates, cutoff):
+        deleted = []
+        for blob_id, size in candidates:
+            # Stored again since the sweep listed it
+            path = self.blob_store.local_path(blob_id)
+            if path and os.path.exists(path) and os.path.getmtime(path) >= cutoff:
+                continue
+            if self.blob_store.delete(blob_id):
+                deleted.append((blob_id, size))
+        return deleted
+
+    async def rehydrate(self, case_id):
+        """Restore an archived case's images to the blob store and make it live again.
+
+        Returns False if the case is not archived (or was restored concurrently).
+        """
+        case = await self.cases_collection.find_one({"case_id": case_id}, {"_id": 0, "archive": 1})
+        if not case or not case.get('archive'):
+            return False
+        path = os.path.join(self.archive_path, case['archive']['path'])
+        try:
+            await asyncio.to_thread(self._restore_archive, path)
+        except FileNotFoundError:
+            case = await self.cases_collection.find_one({"case_id": case_id}, {"_id": 0, "archive": 1})
+            if case and not case.get('archive'):
+                return False
+            raise
+        await self.cases_collection.update_one({"case_id": case_id}, {"$unset": {"archive": ""}})
+        await self.results_collection.update_many({"case_id": case_id}, {"$unset": {"archive": ""}})
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.rehydrated += 1
+        return True
+
+    def _restore_archive(self, path):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name == ARCHIVE_MANIFEST:
+                    continue
+                # Blobs are content-addressed, so the stored id verifies the archived bytes
+                if self.blob_store.put(archive.read(name)) != name:
+                    raise ValueError(f"Archived blob {name} failed verification")
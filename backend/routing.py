@@ -0,0 +1,104 @@
+"""Quality-based routing of enhancement requests.
+
+`enhancement_type=auto` asks the routing policy to choose: the quality
+scores stored on the case at upload (image_ops.assess_quality) are turned
+into a set of issues, and the policy then
+
+  * skips enhancement when there are none,
+  * picks the cheapest FACE_MODELS entry whose `handles` cover them, and
+  * limits the OpenCV fallback to the stages that address them.
+
+Every decision is returned with the scores and issues behind it, so it can
+be stored with the result and logged for tuning the thresholds.
+"""
+
+import os
+
+from fallback_pipeline import FALLBACK_STAGES
+
+AUTO_ENHANCEMENT = "auto"
+
+# Bump when thresholds or rules change, so logged decisions can be told apart
+ROUTING_POLICY_VERSION = "quality-v1"
+
+# Thresholds on the assess_quality scores
+ROUTING_BLUR_MIN = float(os.environ.get('ROUTING_BLUR_MIN', '100'))
+ROUTING_SEVERE_BLUR = float(os.environ.get('ROUTING_SEVERE_BLUR', '20'))
+ROUTING_NOISE_MAX = float(os.environ.get('ROUTING_NOISE_MAX', '5'))
+ROUTING_SEVERE_NOISE = float(os.environ.get('ROUTING_SEVERE_NOISE', '12'))
+ROUTING_DARK_BRIGHTNESS = float(os.environ.get('ROUTING_DARK_BRIGHTNESS', '70'))
+ROUTING_BRIGHT_BRIGHTNESS = float(os.environ.get('ROUTING_BRIGHT_BRIGHTNESS', '190'))
+ROUTING_MIN_CONTRAST = float(os.environ.get('ROUTING_MIN_CONTRAST', '20'))
+ROUTING_CLIPPED_FRACTION = float(os.environ.get('ROUTING_CLIPPED_FRACTION', '0.1'))
+# Faces smaller than this (pixels, shorter side) or images below this size call for upscaling
+ROUTING_MIN_FACE_SIZE = int(os.environ.get('ROUTING_MIN_FACE_SIZE', '64'))
+ROUTING_MIN_MEGAPIXELS = float(os.environ.get('ROUTING_MIN_MEGAPIXELS', '0.3'))
+
+# Fallback stages that address each issue
+ISSUE_STAGES = {
+    "blur": ("sharpen",),
+    "noise": ("denoise",),
+    "underexposed": ("clahe", "brightness"),
+    "overexposed": ("clahe",),
+    "low_contrast": ("clahe",),
+    "low_resolution": ("sharpen",),
+}
+
+
+def quality_issues(quality, face_boxes=()):
+    """Issues found in a case's quality scores, e.g. ["blur", "severe"]"""
+    issues = []
+    if quality["blur"] < ROUTING_BLUR_MIN:
+        issues.append("blur")
+    if quality["noise"] > ROUTING_NOISE_MAX:
+        issues.append("noise")
+    if quality["brightness"] < ROUTING_DARK_BRIGHTNESS or quality["dark_fraction"] > ROUTING_CLIPPED_FRACTION:
+        issues.append("underexposed")
+    elif quality["brightness"] > ROUTING_BRIGHT_BRIGHTNESS or quality["bright_fraction"] > ROUTING_CLIPPED_FRACTION:
+        issues.append("overexposed")
+    if quality["contrast"] < ROUTING_MIN_CONTRAST:
+        issues.append("low_contrast")
+    largest_face = max((min(box["w"], box["h"]) for box in face_boxes), default=None)
+    small_face = largest_face is not None and largest_face < ROUTING_MIN_FACE_SIZE
+    if quality["megapixels"] < ROUTING_MIN_MEGAPIXELS or small_face:
+        issues.append("low_resolution")
+    if quality["blur"] < ROUTING_SEVERE_BLUR or quality["noise"] > ROUTING_SEVERE_NOISE:
+        issues.append("severe")
+    return issues
+
+
+def cheapest_model(models, issues):
+    """Lowest-cost model type whose `handles` cover every issue (the most capable one otherwise)"""
+    ranked = sorted(models.items(), key=lambda item: item[1]["cost"])
+    for model_type, model in ranked:
+        if set(issues) <= set(model["handles"]):
+            return model_type
+    return max(ranked, key=lambda item: (len(set(issues) & set(item[1]["handles"])), -item[1]["cost"]))[0]
+
+
+def route_enhancement(case, models):
+    """Routing decision for an `auto` enhancement of a case.
+
+    Returns {action: "skip" | "enhance", enhancement_type, fallback_stages,
+    issues, quality, policy}. Cases uploaded before quality scores were
+    recorded get the default model and the full fallback.
+    """
+    quality = case.get("quality")
+    decision = {"policy": ROUTING_POLICY_VERSION, "quality": quality}
+    if not quality:
+        return {**decision, "action": "enhance", "enhancement_type": "restoration",
+                "fallback_stages": list(FALLBACK_STAGES), "issues": ["unscored"]}
+
+    issues = quality_issues(quality, case.get("face_boxes") or [])
+    if not issues:
+        return {**decision, "action": "skip", "enhancement_type": None, "fallback_stages": [], "issues": []}
+
+    wanted = {stage for issue in issues for stage in ISSUE_STAGES.get(issue, ())}
+    return {
+        **decision,
+        "action": "enhance",
+        "enhancement_type": cheapest_model(models, issues),
+        # "severe" alone maps to no stage; the blur/noise issue it comes with does
+        "fallback_stages": [stage for stage in FALLBACK_STAGES if stage in wanted] or list(FALLBACK_STAGES),
+        "issues": issues,
+    }
@@ -0,0 +1,39 @@
+"""Dynamic micro-batching of enhancement requests.
+
+Concurrent enhancement requests for the same enhancement type (and
+output encoding) are held for at most ENHANCE_BATCH_MAX_WAIT seconds, or
+until ENHANCE_BATCH_MAX_SIZE are waiting, and sent to the inference
+backend as one batch; each request gets its own result back. Batch sizes
+and queue latency are reported through stats().
+"""
+
+import os
+
+from micro_batch import MicroBatcher
+
+# Scheduler configuration
+ENHANCE_BATCH_MAX_SIZE = int(os.environ.get('ENHANCE_BATCH_MAX_SIZE', '8'))
+ENHANCE_BATCH_MAX_WAIT = float(os.environ.get('ENHANCE_BATCH_MAX_WAIT', '0.02'))
+
+
+class EnhancementScheduler:
+    """Groups enhance() calls into backend.enhance_batch() calls"""
+
+    def __init__(self, backend, max_batch=ENHANCE_BATCH_MAX_SIZE, max_wait=ENHANCE_BATCH_MAX_WAIT):
+        self.backend = backend
+        self._batcher = MicroBatcher(self._dispatch, max_batch, max_wait)
+
+    async def enhance(self, model_type, data, encoding=None):
+        """Same contract as InferenceBackend.enhance(), served from a shared batch"""
+        return await self._batcher.submit((model_type, encoding), data)
+
+    async def _dispatch(self, key, items):
+        model_type, encoding = key
+        return await self.backend.enhance_batch(model_type, items, encoding)
+
+    def stats(self):
+        return {
+            "max_batch_size": self._batcher.max_batch,
+            "max_wait_seconds": self._batcher.max_wait,
+            **self._batcher.stats(),
+        }
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
-from bson import ObjectId
+from fastapi.responses import Response, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 import base64
@@ -10,13 +11,41 @@ import uuid
 import asyncio
 from datetime import datetime
 from typing import Optional, List
-import cv2
-import numpy as np
-from io import BytesIO
-from PIL import Image
-import requests
+import httpx
 import json
 import time
+import hashlib
+import mimetypes
+import zipfile
+from blob_store import get_blob_store, decode_data_uri, BlobNotFound
+from image_ops import (
+    detect_faces, sniff_image_type, face_regions, crop_regions, composite_regions,
+    output_encoding, transcode_image, render_thumbnails, fingerprint_image,
+    OUTPUT_FORMATS, INTERMEDIATE_ENCODING,
+    THUMBNAIL_SIZES, THUMBNAIL_FORMAT, THUMBNAIL_LEVEL
+)
+from fallback_pipeline import fallback_enhance, fallback_preset_name, FALLBACK_STAGES, FALLBACK_PIPELINE_VERSIONS
+from workers import worker_pool, WorkerPoolSaturated, WORKER_RETRY_AFTER, WORKER_POOL_SIZE
+from jobs import JobQueue, JobRetry, public_job
+from result_cache import ResultCache, make_cache_key
+from near_duplicates import NearDuplicateIndex
+from retention import RetentionManager, COMPACTION_INTERVAL_HOURS
+from face_tracker import track_faces, best_frames
+from routing import route_enhancement, AUTO_ENHANCEMENT
+from inference_client import InferenceClient, InferenceUnavailable
+from inference_backends import get_inference_backend
+from scheduler import EnhancementScheduler
+from metrics import (
+    registry, MetricsMiddleware, observe_stages, stage_timer,
+    http_requests_total, http_request_duration_seconds,
+    enhancement_fallbacks_total, enhancement_jobs_total, enhancement_duration_seconds,
+    enhancement_routing_decisions_total, storage_reclaimed_bytes_total
+)
+from ingest import (
+    stream_upload_to_store, UploadTooLarge, MaxBodySizeMiddleware,
+    MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, MULTIPART_OVERHEAD, UPLOAD_CHUNK_SIZE
+)
+from video_ingest import iter_keyframes, resolve_ingest_path, VIDEO_MAX_UPLOAD_BYTES
 
 # Load environment variables
 load_dotenv()
@@ -32,158 +61,483 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized upload bodies before they are spooled
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    limits={
+        "/api/upload-image": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+        "/api/upload-batch": MAX_BATCH_UPLOAD_BYTES,
+        "/api/upload-video": VIDEO_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD,
+    }
+)
+
+# Outermost, so rejected and failed requests are counted too
+app.add_middleware(
+    MetricsMiddleware,
+    requests_total=http_requests_total,
+    request_duration=http_request_duration_seconds
+)
+
 # MongoDB connection
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
+client = AsyncIOMotorClient(MONGO_URL, maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')))
 db = client['face_reconstruction_db']
 cases_collection = db['cases']
 results_collection = db['results']
+jobs_collection = db['jobs']
+
+# Background enhancement jobs
+job_queue = JobQueue(jobs_collection)
+
+# Memoized enhancement results (in-process LRU backed by the results collection)
+result_cache = ResultCache(results_collection)
+
+# Perceptual-hash index of uploaded images for near-duplicate lookups
+near_duplicate_index = NearDuplicateIndex(cases_collection)
+
+# Image blob store (raw bytes keyed by SHA-256, referenced from cases/results)
+blob_store = get_blob_store()
+
+# Result expiry, cold-case archival and blob garbage collection (run as compaction jobs)
+retention = RetentionManager(cases_collection, results_collection, blob_store, result_cache, jobs_collection)
+compaction_task: Optional[asyncio.Task] = None
+
+# Case listing pagination
+CASES_PAGE_SIZE = 50
+CASES_MAX_PAGE_SIZE = 200
+
+# Storage internals left out of case and result responses; images are served by URL
+CASE_INTERNAL_FIELDS = ("original_image", "original_blob", "stage_timings", "archive")
+RESULT_INTERNAL_FIELDS = CASE_INTERNAL_FIELDS + ("enhanced_image", "enhanced_blob", "cache_key")
+CASE_PROJECTION = {"_id": 0, **{field: 0 for field in CASE_INTERNAL_FIELDS}}
+RESULT_PROJECTION = {"_id": 0, **{field: 0 for field in RESULT_INTERNAL_FIELDS}}
+
+# Method name of the OpenCV fallback, recorded on results it produced
+FALLBACK_METHOD = "Advanced OpenCV Enhancement"
+
+# Batch ingestion/enhancement
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', str(WORKER_POOL_SIZE)))
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+BATCH_INSERT_SIZE = 100
+BATCH_BUSY_RETRIES = 20
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# Video ingestion: keyframes waiting for detection, and detections run at once
+VIDEO_QUEUE_SIZE = int(os.environ.get('VIDEO_QUEUE_SIZE', '8'))
+VIDEO_DETECT_CONCURRENCY = int(os.environ.get('VIDEO_DETECT_CONCURRENCY', str(WORKER_POOL_SIZE)))
+
+# Enhancement scopes: the whole frame, or padded crops around detected faces
+ENHANCEMENT_REGIONS = ("full", "faces")
+
+# Content type of stored previews
+THUMBNAIL_CONTENT_TYPE = OUTPUT_FORMATS[output_encoding(THUMBNAIL_FORMAT, THUMBNAIL_LEVEL)[0]][1]
+
+# Image URLs never change content, so browsers may cache them for a year
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # HuggingFace API configuration
 HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', '')
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/"
+HUGGINGFACE_API_URL = os.environ.get('HUGGINGFACE_API_URL', "https://api-inference.huggingface.co/models/")
+HUGGINGFACE_TIMEOUT = float(os.environ.get('HUGGINGFACE_TIMEOUT', '60'))
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '20'))
+
+# Shared pooled HTTP client for inference calls (created on startup)
+http_client: Optional[httpx.AsyncClient] = None
 
 # Advanced face reconstruction models for government-level forensic accuracy
+# `cost` ranks the models for routing; `handles` lists the quality issues each one addresses
 FACE_MODELS = {
     "restoration": {
         "model": "microsoft/DiT-XL-2-256",  # Advanced restoration
-        "description": "High-fidelity face restoration with identity preservation"
+        "description": "High-fidelity face restoration with identity preservation",
+        "cost": 1,
+        "handles": ["blur", "noise", "underexposed", "overexposed", "low_contrast"]
     },
     "super_resolution": {
         "model": "stabilityai/stable-diffusion-xl-base-1.0",  # Super resolution
-        "description": "Ultra-high resolution enhancement"
+        "description": "Ultra-high resolution enhancement",
+        "cost": 3,
+        "handles": ["low_resolution", "blur"]
     },
     "forensic_enhancement": {
         "model": "runwayml/stable-diffusion-v1-5",  # Forensic-grade enhancement
-        "description": "Government-grade forensic face reconstruction"
+        "description": "Government-grade forensic face reconstruction",
+        "cost": 4,
+        "handles": ["blur", "noise", "underexposed", "overexposed", "low_contrast", "low_resolution", "severe"]
     },
     "identity_preservation": {
         "model": "microsoft/DiT-XL-2-256",  # Identity-preserving restoration
-        "description": "Maximum identity consistency for forensic analysis"
+        "description": "Maximum identity consistency for forensic analysis",
+        "cost": 2,
+        "handles": ["blur", "noise"]
     }
 }
 
-def detect_faces_opencv(image_data):
-    """Advanced face detection using multiple cascade classifiers"""
+async def blob_source(blob_id):
+    """Image input for the worker pool: the blob's local path if it has one, else its bytes"""
+    path = blob_store.local_path(blob_id)
+    if path:
+        return path
+    return await asyncio.to_thread(blob_store.read, blob_id)
+
+async def source_bytes(source):
+    """Encoded image bytes of a worker pool image input"""
+    if isinstance(source, str):
+        with open(source, 'rb') as fh:
+            return await asyncio.to_thread(fh.read)
+    return source
+
+def parse_range_header(range_header, length):
+    """Parse a single `bytes=` range into (start, end) inclusive; None if absent or unsupported"""
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec:
+        # Multipart ranges are not supported; serve the full image instead
+        return None
+    start_str, _, end_str = spec.partition('-')
     try:
-        # Convert base64 to image
-        img_bytes = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Multiple cascade classifiers for better accuracy
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        profile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_profileface.xml')
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Detect frontal faces
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        # Detect profile faces
-        profile_faces = profile_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        total_faces = len(faces) + len(profile_faces)
-        
-        # Calculate confidence based on face detection quality
-        confidence = min(0.9, 0.3 + (total_faces * 0.2))
-        
-        return total_faces > 0, total_faces, confidence
+        if not start_str:
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise ValueError(spec)
+            return max(0, length - suffix), length - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, min(end, length - 1)
+
+def image_response(request, blob_id, content_type, legacy_image=None):
+    """Stream an image from the blob store with ETag, Range and cache headers"""
+    if blob_id:
+        blob = blob_store.get(blob_id)
+        etag = f'"{blob_id}"'
+        length = blob.length
+    else:
+        # Documents not yet migrated by migrate_blobs.py
+        content, content_type = decode_data_uri(legacy_image)
+        blob = None
+        etag = f'"{hashlib.sha256(content).hexdigest()}"'
+        length = len(content)
+    
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]):
+        if blob:
+            blob.close()
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        byte_range = parse_range_header(request.headers.get('range'), length)
+    except HTTPException:
+        if blob:
+            blob.close()
+        raise
+    
+    status_code = 200
+    start, end = 0, length - 1
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    
+    if blob is None:
+        return Response(content=content[start:end + 1], status_code=status_code, headers=headers, media_type=content_type)
+    return StreamingResponse(
+        blob.iter_range(start, end - start + 1),
+        status_code=status_code,
+        headers=headers,
+        media_type=content_type
+    )
+
+async def detect_faces_opencv(image_source, details=None):
+    """Advanced face detection using multiple cascade classifiers (runs in the worker pool)
+
+    `image_source` is a blob path or encoded bytes. `details`, if given, is filled with the
+    face boxes, encoded thumbnails, decoded image hash, dimensions, quality scores and stage timings.
+    """
+    try:
+        detection = await worker_pool.run(detect_faces, image_source, THUMBNAIL_SIZES)
+        if details is not None:
+            details["face_boxes"] = detection["boxes"]
+            details["thumbnails"] = detection["thumbnails"]
+            details["image_hash"] = detection["image_hash"]
+            details["phash"] = detection["phash"]
+            details["dhash"] = detection["dhash"]
+            details["width"] = detection["width"]
+            details["height"] = detection["height"]
+            details["quality"] = detection["quality"]
+            details.setdefault("stage_timings", {}).update(
+                {f"detect_{k}": v for k, v in detection["timings"].items()}
+            )
+        return detection["faces_detected"], detection["face_count"], detection["confidence"]
+    except WorkerPoolSaturated:
+        raise
     except Exception as e:
         print(f"Face detection error: {e}")
         return False, 0, 0.0
 
-async def enhance_face_huggingface(image_data, model_type="restoration"):
-    """Advanced face enhancement using HuggingFace models"""
+def worker_pool_busy():
+    return HTTPException(
+        status_code=503,
+        detail="Image processing capacity exhausted, retry shortly",
+        headers={"Retry-After": str(WORKER_RETRY_AFTER)}
+    )
+
+def get_http_client():
+    """Return the shared keep-alive HTTP client, creating it if startup has not run"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HUGGINGFACE_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS
+            )
+        )
+    return http_client
+
+# Circuit breakers, concurrency limits and retry budget shared by all inference calls
+inference_client = InferenceClient(get_http_client, HUGGINGFACE_API_URL, HUGGINGFACE_API_KEY)
+
+# Remote API or local ONNX Runtime, selected by INFERENCE_BACKEND
+inference_backend = get_inference_backend(inference_client, FACE_MODELS)
+
+# Concurrent enhancement requests of the same type reach the backend as one batch
+enhancement_scheduler = EnhancementScheduler(inference_backend)
+
+async def enhance_face_huggingface(image_source, model_type="restoration", timings=None, encoding=None,
+                                   fallback_stages=FALLBACK_STAGES, fallback_preset=None):
+    """Advanced face enhancement using the configured inference backend; returns (image bytes, confidence, method)
+
+    `encoding` applies to fallback and locally encoded output; remote model output is
+    returned as the model sent it. `fallback_stages` and `fallback_preset` configure the
+    OpenCV fallback.
+    """
     try:
-        if not HUGGINGFACE_API_KEY:
-            print("HuggingFace API key not found - using fallback")
+        if not inference_backend.available():
+            print(f"Inference backend '{inference_backend.name}' not configured - using fallback")
+            enhancement_fallbacks_total.inc(reason="not_configured")
             return None, 0.5, "Fallback Enhancement"
-            
-        model_info = FACE_MODELS.get(model_type, FACE_MODELS["restoration"])
-        model_name = model_info["model"]
         
-        headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}"}
+        img_bytes = await source_bytes(image_source)
         
-        # Convert base64 to bytes
-        img_bytes = base64.b64decode(image_data.split(',')[1])
+        # Batching lives in the scheduler; backoff, deadlines and circuit breaking in the backend
+        try:
+            started = time.perf_counter()
+            result = await enhancement_scheduler.enhance(model_type, img_bytes, encoding)
+            if timings is not None:
+                timings["inference"] = timings.get("inference", 0.0) + time.perf_counter() - started
+            return result
+        except InferenceUnavailable as e:
+            print(f"Inference unavailable - using fallback: {e}")
+            enhancement_fallbacks_total.inc(reason="inference_unavailable")
         
-        # Call HuggingFace API with retry mechanism
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    f"{HUGGINGFACE_API_URL}{model_name}",
-                    headers=headers,
-                    data=img_bytes,
-                    timeout=60
-                )
-                
-                if response.status_code == 200:
-                    # Convert response to base64
-                    enhanced_img = base64.b64encode(response.content).decode('utf-8')
-                    return f"data:image/png;base64,{enhanced_img}", 0.92, f"HuggingFace {model_name}"
-                
-                elif response.status_code == 503:
-                    print(f"Model loading, attempt {attempt + 1}/{max_retries}")
-                    await asyncio.sleep(10)  # Wait for model to load
-                    continue
-                else:
-                    print(f"API Error: {response.status_code}, {response.text}")
-                    break
-                    
-            except Exception as e:
-                print(f"Request error on attempt {attempt + 1}: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(5)
-                continue
-        
-        # If all attempts fail, use advanced fallback
-        return await advanced_fallback_enhancement(image_data)
+        # If the model is unavailable, use advanced fallback
+        return await advanced_fallback_enhancement(image_source, timings, encoding, fallback_stages, fallback_preset)
         
+    except WorkerPoolSaturated:
+        raise
     except Exception as e:
         print(f"HuggingFace API error: {e}")
-        return await advanced_fallback_enhancement(image_data)
+        enhancement_fallbacks_total.inc(reason="error")
+        return await advanced_fallback_enhancement(image_source, timings, encoding, fallback_stages, fallback_preset)
 
-async def advanced_fallback_enhancement(image_data):
-    """Advanced fallback enhancement using OpenCV techniques"""
+async def advanced_fallback_enhancement(image_source, timings=None, encoding=None, stages=FALLBACK_STAGES,
+                                        preset=None):
+    """Advanced fallback enhancement using OpenCV techniques (runs in the worker pool)
+
+    The stages that run and their filters are planned per image; see fallback_pipeline.py.
+    """
     try:
-        # Convert base64 to image
-        img_bytes = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Apply multiple enhancement techniques
-        enhanced = img.copy()
-        
-        # 1. Contrast enhancement
-        lab = cv2.cvtColor(enhanced, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l = clahe.apply(l)
-        enhanced = cv2.merge([l, a, b])
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
-        
-        # 2. Noise reduction
-        enhanced = cv2.bilateralFilter(enhanced, 9, 75, 75)
-        
-        # 3. Sharpening
-        kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-        enhanced = cv2.filter2D(enhanced, -1, kernel)
-        
-        # 4. Brightness and contrast adjustment
-        enhanced = cv2.convertScaleAbs(enhanced, alpha=1.2, beta=20)
-        
-        # Convert back to base64
-        _, buffer = cv2.imencode('.png', enhanced)
-        enhanced_img = base64.b64encode(buffer).decode('utf-8')
+        preset = fallback_preset_name(preset)
+        enhanced_bytes, stage_timings, plan = await worker_pool.run(
+            fallback_enhance, image_source, encoding, stages, preset
+        )
+        if timings is not None:
+            timings.update({f"fallback_{k}": v for k, v in stage_timings.items()})
         
-        return f"data:image/png;base64,{enhanced_img}", 0.75, "Advanced OpenCV Enhancement"
+        steps = ", ".join(step["filter"] for step in plan) or "no stages needed"
+        return enhanced_bytes, 0.75, f"{FALLBACK_METHOD} ({preset}: {steps})"
         
+    except WorkerPoolSaturated:
+        raise
     except Exception as e:
         print(f"Fallback enhancement error: {e}")
-        return image_data, 0.5, "Basic Enhancement"
+        enhancement_fallbacks_total.inc(reason="fallback_error")
+        return None, 0.5, "Basic Enhancement"
+
+async def enhance_face_regions(image_source, regions, model_type="restoration", timings=None, encoding=None,
+                               fallback_stages=FALLBACK_STAGES, fallback_preset=None):
+    """Enhance only the given face regions, concurrently, and composite them back into the frame"""
+    crops, crop_timings = await worker_pool.run(crop_regions, image_source, regions)
+    
+    crop_stage_timings = [{} for _ in crops]
+    outcomes = await asyncio.gather(
+        *[enhance_face_huggingface(crop, model_type, crop_timing, INTERMEDIATE_ENCODING, fallback_stages,
+                                   fallback_preset)
+          for crop, crop_timing in zip(crops, crop_stage_timings)],
+        return_exceptions=True
+    )
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    
+    enhanced = [(crop, confidence, method) for crop, confidence, method in outcomes if crop]
+    if not enhanced:
+        return None, 0.5, "Basic Enhancement"
+    
+    composite, composite_timings = await worker_pool.run(
+        composite_regions, image_source, regions, [crop for crop, _, _ in outcomes], encoding
+    )
+    
+    if timings is not None:
+        stage_sources = [{f"regions_{k}": v for k, v in crop_timings.items()}]
+        stage_sources += crop_stage_timings
+        stage_sources.append({f"regions_{k}": v for k, v in composite_timings.items()})
+        for stage_timings in stage_sources:
+            for stage, seconds in stage_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+    
+    confidence = min(confidence for _, confidence, _ in enhanced)
+    methods = sorted({method for _, _, method in enhanced})
+    return composite, confidence, f"{' + '.join(methods)} (face regions)"
+
+async def store_thumbnails(thumbnails):
+    """Write encoded previews to the blob store; returns {size: blob_id}"""
+    stored = {}
+    for size, data in thumbnails.items():
+        with stage_timer("blob_write"):
+            stored[size] = await asyncio.to_thread(blob_store.put, data)
+    return stored
+
+async def generate_thumbnails(blob_id, timings=None):
+    """Build and store previews of a stored image; {} if the worker pool cannot take it now"""
+    try:
+        thumbnails, stage_timings = await worker_pool.run(render_thumbnails, await blob_source(blob_id))
+        if timings is not None:
+            timings.update({f"thumbnail_{k}": v for k, v in stage_timings.items()})
+        return await store_thumbnails(thumbnails)
+    except Exception as e:
+        # Previews are optional: the image endpoints serve the full image without them
+        print(f"Thumbnail generation error: {e}")
+        return {}
+
+def pick_thumbnail(thumbnails, size):
+    """Blob id of the smallest stored preview at least `size` pixels, else the largest"""
+    if not thumbnails:
+        return None
+    sizes = sorted(int(s) for s in thumbnails)
+    chosen = next((s for s in sizes if s >= size), sizes[-1])
+    return thumbnails[str(chosen)]
+
+def thumbnail_urls(base_url, thumbnails):
+    return {size: f"{base_url}/thumbnail/{size}" for size in sorted(thumbnails, key=int)}
+
+def encode_cases_cursor(case):
+    """Opaque pagination cursor pointing after the given case"""
+    raw = json.dumps([case.get('upload_time', ''), case['case_id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cases_cursor(cursor):
+    try:
+        upload_time, case_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return upload_time, case_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def get_case_statistics():
+    """Aggregate dashboard statistics in Mongo instead of loading every case"""
+    pipeline = [
+        {"$group": {
+            "_id": None,
+            "total_cases": {"$sum": 1},
+            "processed_cases": {"$sum": {"$cond": [{"$eq": ["$status", "processed"]}, 1, 0]}},
+            "faces_detected": {"$sum": {"$ifNull": ["$face_count", 0]}},
+        }}
+    ]
+    stats = (await cases_collection.aggregate(pipeline).to_list(length=1) or [{}])[0]
+    total_cases = stats.get('total_cases', 0)
+    processed_cases = stats.get('processed_cases', 0)
+    return {
+        "total_cases": total_cases,
+        "processed_cases": processed_cases,
+        "faces_detected": stats.get('faces_detected', 0),
+        "processing_rate": (processed_cases / total_cases * 100) if total_cases > 0 else 0
+    }
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the indexes used by lookups, listing pagination and statistics"""
+    try:
+        await cases_collection.create_index([("case_id", ASCENDING)], unique=True)
+        await cases_collection.create_index([("upload_time", DESCENDING), ("case_id", DESCENDING)])
+        await cases_collection.create_index([("status", ASCENDING)])
+        await cases_collection.create_index([("source_video.video_id", ASCENDING)], sparse=True)
+        await results_collection.create_index([("result_id", ASCENDING)], unique=True)
+        await results_collection.create_index([("case_id", ASCENDING)])
+        await results_collection.create_index([("processing_timestamp", ASCENDING)])
+        await job_queue.ensure_indexes()
+        await result_cache.ensure_indexes()
+    except Exception as e:
+        print(f"Index creation error: {e}")
+
+@app.on_event("startup")
+async def load_near_duplicate_index():
+    try:
+        await near_duplicate_index.load()
+    except Exception as e:
+        print(f"Near-duplicate index load error: {e}")
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.register("enhance_face", enhancement_job, on_failed=enhancement_job_failed)
+    job_queue.register("ingest_video", video_ingest_job)
+    job_queue.register("compact_storage", compaction_job)
+    await job_queue.start()
+
+@app.on_event("startup")
+async def schedule_compaction():
+    global compaction_task
+    if COMPACTION_INTERVAL_HOURS > 0:
+        compaction_task = asyncio.create_task(compaction_scheduler())
+
+@app.on_event("startup")
+async def open_http_client():
+    get_http_client()
+
+@app.on_event("startup")
+async def warm_up_workers():
+    """Spawn image workers and load inference sessions before the first request"""
+    try:
+        await worker_pool.warm_up()
+        await inference_backend.warm_up()
+    except Exception as e:
+        print(f"Worker warm-up error: {e}")
+
+@app.on_event("shutdown")
+async def close_clients():
+    if http_client is not None:
+        await http_client.aclose()
+    if compaction_task is not None:
+        compaction_task.cancel()
+    await job_queue.stop()
+    client.close()
+    worker_pool.shutdown()
+    inference_backend.close()
 
 @app.get("/api/health")
 async def health_check():
@@ -191,178 +545,1346 @@ async def health_check():
         "status": "healthy", 
         "service": "AI Face Reconstruction API",
         "version": "2.0.0",
-        "huggingface_api": "enabled" if HUGGINGFACE_API_KEY else "disabled"
+        "huggingface_api": "enabled" if HUGGINGFACE_API_KEY else "disabled",
+        "inference": inference_backend.stats(),
+        "enhancement_scheduler": enhancement_scheduler.stats(),
+        "worker_pool": worker_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "near_duplicates": near_duplicate_index.stats(),
+        "retention": retention.stats()
+    }
+
+def component_metrics():
+    """Scrape-time samples derived from the stats() of the long-lived components"""
+    pool = worker_pool.stats()
+    cache = result_cache.stats()
+    client_stats = inference_client.stats()
+    batching = enhancement_scheduler.stats()
+    circuit_states = {"closed": 0, "half_open": 1, "open": 2}
+    return [
+        ("worker_pool_pending", "gauge", "Image jobs running or queued in the worker pool", [({}, pool["pending"])]),
+        ("worker_pool_finished_total", "counter", "Image jobs finished by the worker pool", [({}, pool["finished"])]),
+        ("worker_pool_rejected_total", "counter", "Image jobs rejected because the pool was full", [({}, pool["rejected"])]),
+        ("result_cache_lookups_total", "counter", "Result cache lookups by outcome", [
+            ({"outcome": "hit_memory"}, cache["hits_memory"]),
+            ({"outcome": "hit_persistent"}, cache["hits_persistent"]),
+            ({"outcome": "miss"}, cache["misses"]),
+            ({"outcome": "bypassed"}, cache["bypassed"]),
+        ]),
+        ("inference_requests_total", "counter", "Remote inference HTTP requests sent", [({}, client_stats["requests"])]),
+        ("inference_retries_total", "counter", "Remote inference retries", [({}, client_stats["retries"])]),
+        ("inference_failures_total", "counter", "Remote inference calls that gave up", [({}, client_stats["failures"])]),
+        ("inference_circuit_state", "gauge", "Circuit state per model (0 closed, 1 half-open, 2 open)", [
+            ({"model": model}, circuit_states[circuit["state"]]) for model, circuit in client_stats["circuits"].items()
+        ]),
+        ("inference_circuit_rejected_total", "counter", "Requests failed fast by an open circuit", [
+            ({"model": model}, circuit["rejected"]) for model, circuit in client_stats["circuits"].items()
+        ]),
+        ("enhancement_batches_total", "counter", "Batches dispatched by the enhancement scheduler", [({}, batching["batches"])]),
+        ("enhancement_batch_items_total", "counter", "Requests dispatched in scheduler batches", [({}, batching["items"])]),
+        ("enhancement_batch_pending", "gauge", "Requests waiting for a scheduler batch", [({}, batching["pending"])]),
+    ]
+
+registry.register_collector(component_metrics)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage and component metrics"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def scale_face_boxes(boxes, from_size, to_size):
+    """Face boxes detected at (width, height) `from_size` mapped onto an image of `to_size`"""
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    return [
+        {**box, "x": round(box["x"] * scale_x), "y": round(box["y"] * scale_y),
+         "w": round(box["w"] * scale_x), "h": round(box["h"] * scale_y)}
+        for box in boxes
+    ]
+
+async def find_near_duplicates(phash, dhash, exclude=None, max_distance=None):
+    """Indexed cases that look like the given hashes, closest first, with their latest result"""
+    matches = near_duplicate_index.find(phash, dhash, max_distance=max_distance, exclude=exclude)
+    if not matches:
+        return []
+    found = await cases_collection.find(
+        {"case_id": {"$in": [match["case_id"] for match in matches]}},
+        {"_id": 0, "case_id": 1, "result_id": 1, "face_count": 1}
+    ).to_list(length=None)
+    by_id = {case["case_id"]: case for case in found}
+    return [
+        {**match, "face_count": by_id[match["case_id"]].get("face_count"),
+         "result_id": by_id[match["case_id"]].get("result_id")}
+        for match in matches if match["case_id"] in by_id
+    ]
+
+async def reused_detection(duplicates, width, height):
+    """Detection fields of the closest near-duplicate that has them, scaled to this image"""
+    for duplicate in duplicates:
+        donor = await cases_collection.find_one(
+            {"case_id": duplicate["case_id"]},
+            {"_id": 0, "case_id": 1, "faces_detected": 1, "face_count": 1, "detection_confidence": 1,
+             "face_boxes": 1, "width": 1, "height": 1}
+        )
+        if donor and donor.get("width") and donor.get("height") and "face_boxes" in donor:
+            return {
+                "faces_detected": donor["faces_detected"],
+                "face_count": donor["face_count"],
+                "detection_confidence": donor["detection_confidence"],
+                "face_boxes": scale_face_boxes(donor["face_boxes"], (donor["width"], donor["height"]), (width, height)),
+                "detection_reused_from": donor["case_id"],
+            }
+    return None
+
+async def analyze_upload(original_blob, file_size, filename, content_type, reuse_detection=False):
+    """Run face detection on a stored upload and build its case document
+
+    Near-duplicates of earlier uploads are listed on the case. With `reuse_detection`
+    the closest one's detection is reused (boxes scaled to this image) instead of
+    running the cascades again.
+    """
+    source = await blob_source(original_blob)
+    details = {}
+    detection = None
+    if reuse_detection:
+        try:
+            fingerprint = await worker_pool.run(fingerprint_image, source, THUMBNAIL_SIZES)
+            details = {key: fingerprint[key]
+                       for key in ("image_hash", "phash", "dhash", "width", "height", "quality", "thumbnails")}
+            details["stage_timings"] = {f"fingerprint_{k}": v for k, v in fingerprint["timings"].items()}
+            duplicates = await find_near_duplicates(details["phash"], details["dhash"])
+            detection = await reused_detection(duplicates, details["width"], details["height"])
+        except WorkerPoolSaturated:
+            raise
+        except Exception as e:
+            # Reuse is an optimization: the upload must not fail where plain detection would not
+            print(f"Detection reuse error, running detection: {e}")
+            detection = None
+    
+    if detection is None:
+        # Advanced face detection, decoding straight from the stored blob
+        details = {}
+        detection = detection_fields(*await detect_faces_opencv(source, details), details)
+        duplicates = await find_near_duplicates(details.get("phash"), details.get("dhash"))
+    
+    return await case_document(original_blob, file_size, filename, content_type, detection, details, duplicates)
+
+def detection_fields(faces_detected, face_count, detection_confidence, details):
+    """Case fields of a detection run by detect_faces_opencv"""
+    return {
+        "faces_detected": faces_detected,
+        "face_count": face_count,
+        "detection_confidence": detection_confidence,
+        "face_boxes": details.get("face_boxes", []),
+        "detection_reused_from": None,
+    }
+
+async def case_document(original_blob, file_size, filename, content_type, detection, details, duplicates):
+    """Store the previews of an analyzed image and build its case document"""
+    thumbnails = await store_thumbnails(details.get("thumbnails", {}))
+    observe_stages(details.get("stage_timings", {}))
+    
+    return {
+        "case_id": str(uuid.uuid4()),
+        "original_blob": original_blob,
+        "filename": filename,
+        "upload_time": datetime.now().isoformat(),
+        **detection,
+        "file_size": file_size,
+        "image_format": content_type,
+        "image_hash": details.get("image_hash"),
+        "phash": details.get("phash"),
+        "dhash": details.get("dhash"),
+        "near_duplicates": duplicates,
+        "near_duplicate_of": duplicates[0]["case_id"] if duplicates else None,
+        "width": details.get("width"),
+        "height": details.get("height"),
+        "quality": details.get("quality"),
+        "thumbnails": thumbnails,
+        "thumbnail_format": THUMBNAIL_CONTENT_TYPE,
+        "stage_timings": details.get("stage_timings", {}),
+        "status": "uploaded"
+    }
+
+def index_cases(cases):
+    """Make stored cases findable as near-duplicates of later uploads"""
+    for case_data in cases:
+        near_duplicate_index.add(case_data["case_id"], case_data.get("phash"), case_data.get("dhash"))
+
+def upload_summary(case_data):
+    return {
+        "case_id": case_data["case_id"],
+        "faces_detected": case_data["faces_detected"],
+        "face_count": case_data["face_count"],
+        "face_boxes": case_data["face_boxes"],
+        "detection_confidence": case_data["detection_confidence"],
+        "detection_reused_from": case_data["detection_reused_from"],
+        "near_duplicates": case_data["near_duplicates"],
+        "thumbnail_urls": thumbnail_urls(f"/api/case/{case_data['case_id']}", case_data["thumbnails"]),
+        "file_size": case_data["file_size"],
+        "stage_timings": case_data["stage_timings"],
     }
 
 @app.post("/api/upload-image")
-async def upload_image(file: UploadFile = File(...)):
-    """Upload and analyze image with advanced face detection"""
+async def upload_image(file: UploadFile = File(...), reuse_detection: bool = False):
+    """Upload and analyze image with advanced face detection
+
+    Near-duplicates of earlier uploads are reported; `reuse_detection` takes the
+    closest one's face detection instead of recomputing it.
+    """
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read and encode image
-        content = await file.read()
-        base64_image = base64.b64encode(content).decode('utf-8')
-        image_data = f"data:{file.content_type};base64,{base64_image}"
+        # Stream to the blob store in chunks, hashing as we go
+        original_blob, file_size = await stream_upload_to_store(file, blob_store)
+        case_data = await analyze_upload(original_blob, file_size, file.filename, file.content_type, reuse_detection)
         
-        # Advanced face detection
-        faces_detected, face_count, detection_confidence = detect_faces_opencv(image_data)
+        with stage_timer("mongo_insert_case"):
+            await cases_collection.insert_one(case_data)
+        index_cases([case_data])
         
-        # Create case record
-        case_id = str(uuid.uuid4())
-        case_data = {
-            "case_id": case_id,
-            "original_image": image_data,
-            "filename": file.filename,
-            "upload_time": datetime.now().isoformat(),
-            "faces_detected": faces_detected,
-            "face_count": face_count,
-            "detection_confidence": detection_confidence,
-            "file_size": len(content),
-            "image_format": file.content_type,
-            "status": "uploaded"
+        return {
+            **upload_summary(case_data),
+            "message": "Image uploaded and analyzed with advanced detection"
         }
         
-        cases_collection.insert_one(case_data)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except WorkerPoolSaturated:
+        raise worker_pool_busy()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+def copy_zip_member(archive, info):
+    """Stream one zip member into the blob store; returns (blob_id, size)"""
+    if info.file_size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(MAX_UPLOAD_BYTES)
+    writer = blob_store.new_file()
+    try:
+        with archive.open(info) as member:
+            while True:
+                chunk = member.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if writer.length + len(chunk) > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(MAX_UPLOAD_BYTES)
+                writer.write(chunk)
+        return writer.close(), writer.length
+    except BaseException:
+        writer.abort()
+        raise
+
+def zip_member_ingest(archive, info, lock):
+    async def store():
+        # ZipFile shares one file handle, so members are read one at a time
+        async with lock:
+            return await asyncio.to_thread(copy_zip_member, archive, info)
+    return store
+
+def upload_file_ingest(file):
+    async def store():
+        return await stream_upload_to_store(file, blob_store)
+    return store
+
+def expand_batch_files(files):
+    """Flatten uploaded images and zip archives into (filename, content_type, store) items"""
+    items = []
+    for file in files:
+        if file.content_type in ZIP_CONTENT_TYPES or (file.filename or '').lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive: {file.filename}")
+            lock = asyncio.Lock()
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                content_type = mimetypes.guess_type(info.filename)[0] or ''
+                if content_type.startswith('image/'):
+                    items.append((info.filename, content_type, zip_member_ingest(archive, info, lock)))
+        else:
+            items.append((file.filename, file.content_type or '', upload_file_ingest(file)))
+    return items
+
+async def with_backpressure(analyze, *args):
+    """Await analyze(*args), waiting for room in the worker pool instead of failing"""
+    for attempt in range(BATCH_BUSY_RETRIES):
+        try:
+            return await analyze(*args)
+        except WorkerPoolSaturated:
+            if attempt == BATCH_BUSY_RETRIES - 1:
+                raise
+            await asyncio.sleep(0.5)
+
+@app.post("/api/upload-batch")
+async def upload_batch(files: List[UploadFile] = File(...), reuse_detection: bool = False):
+    """Upload and analyze many images (or zip archives of images) in one request"""
+    try:
+        start_time = time.time()
+        items = expand_batch_files(files)
+        if len(items) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} images")
+        
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        
+        async def process(filename, content_type, store):
+            if not content_type.startswith('image/'):
+                return {"filename": filename, "status": "error", "error": "File must be an image"}, None
+            async with semaphore:
+                try:
+                    original_blob, file_size = await store()
+                    case_data = await with_backpressure(
+                        analyze_upload, original_blob, file_size, filename, content_type, reuse_detection
+                    )
+                    return {"filename": filename, "status": "uploaded", **upload_summary(case_data)}, case_data
+                except Exception as e:
+                    print(f"Batch upload error for {filename}: {e}")
+                    return {"filename": filename, "status": "error", "error": str(e)}, None
+        
+        processed = await asyncio.gather(*[process(*item) for item in items])
+        analysis_time = time.time() - start_time
         
+        # One round trip per BATCH_INSERT_SIZE cases instead of one per file
+        cases = [case_data for _, case_data in processed if case_data]
+        mongo_start = time.time()
+        for i in range(0, len(cases), BATCH_INSERT_SIZE):
+            with stage_timer("mongo_insert_cases"):
+                await cases_collection.insert_many(cases[i:i + BATCH_INSERT_SIZE], ordered=False)
+            index_cases(cases[i:i + BATCH_INSERT_SIZE])
+        mongo_time = time.time() - mongo_start
+        
+        results = [item for item, _ in processed]
+        elapsed = time.time() - start_time
         return {
-            "case_id": case_id,
-            "faces_detected": faces_detected,
-            "face_count": face_count,
-            "detection_confidence": detection_confidence,
-            "file_size": len(content),
-            "message": "Image uploaded and analyzed with advanced detection"
+            "items": results,
+            "summary": {
+                "total": len(results),
+                "uploaded": len(cases),
+                "failed": len(results) - len(cases),
+                "faces_detected": sum(c["face_count"] for c in cases),
+                "analysis_time": analysis_time,
+                "mongo_time": mongo_time,
+                "elapsed": elapsed,
+                "images_per_second": (len(results) / elapsed) if elapsed > 0 else 0
+            },
+            "message": "Batch uploaded and analyzed with advanced detection"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch upload failed: {str(e)}")
 
-@app.post("/api/enhance-face/{case_id}")
-async def enhance_face(case_id: str, enhancement_type: str = "restoration"):
-    """Government-grade face enhancement using advanced AI models"""
+async def analyze_keyframe(video, keyframe):
+    """Case document for a video keyframe showing faces, or None; only such frames are stored"""
+    details = {}
+    detection = detection_fields(*await detect_faces_opencv(keyframe["image"], details), details)
+    if not detection["faces_detected"]:
+        return None
+    
+    original_blob = await asyncio.to_thread(blob_store.put, keyframe["image"])
+    duplicates = await find_near_duplicates(details.get("phash"), details.get("dhash"))
+    case_data = await case_document(
+        original_blob,
+        len(keyframe["image"]),
+        f"{video['filename']}#frame={keyframe['frame_index']}",
+        "image/png",
+        detection,
+        details,
+        duplicates
+    )
+    case_data["source_video"] = {
+        "video_id": video["video_id"],
+        "video_blob": video.get("video_blob"),
+        "frame_index": keyframe["frame_index"],
+        "timestamp": keyframe["timestamp"],
+        "sharpness": keyframe["sharpness"],
+        "scene_change": keyframe["scene_change"],
+    }
+    return case_data
+
+async def video_ingest_job(job, progress):
+    """Job handler: sample keyframes from a video and turn the ones showing faces into cases
+
+    A decoding producer feeds keyframes through a bounded queue to detection consumers,
+    so at most VIDEO_QUEUE_SIZE frames are held no matter how long the video is.
+    """
+    payload = job['payload']
+    video = {"video_id": payload['video_id'], "filename": payload['filename'], "video_blob": payload.get('video_blob')}
+    source = payload.get('path') or blob_store.local_path(payload['video_blob'])
+    if not source:
+        raise ValueError("Video ingestion needs a file-based blob store")
+    start_time = time.time()
+    
+    # A retried job skips the frames an interrupted attempt already turned into cases
+    existing = await cases_collection.find(
+        {"source_video.video_id": video['video_id']}, {"_id": 0, "case_id": 1, "source_video.frame_index": 1}
+    ).to_list(length=None)
+    done_frames = {case['source_video']['frame_index'] for case in existing}
+    case_ids = [case['case_id'] for case in existing]
+    
+    queue = asyncio.Queue(maxsize=VIDEO_QUEUE_SIZE)
+    frames = iter_keyframes(source)
+    summary = {}
+    failed = 0
+    
+    async def produce():
+        try:
+            while True:
+                keyframe = await asyncio.to_thread(next, frames, None)
+                if keyframe is None:
+                    break
+                if keyframe.get("done"):
+                    summary.update(keyframe)
+                    break
+                if keyframe["frame_count"]:
+                    await progress(min(0.99, keyframe["frame_index"] / keyframe["frame_count"]), "sampling")
+                if keyframe["frame_index"] not in done_frames:
+                    await queue.put(keyframe)
+        finally:
+            for _ in range(VIDEO_DETECT_CONCURRENCY):
+                await queue.put(None)
+    
+    async def consume():
+        nonlocal failed
+        while True:
+            keyframe = await queue.get()
+            if keyframe is None:
+                return
+            try:
+                case_data = await with_backpressure(analyze_keyframe, video, keyframe)
+                if case_data:
+                    with stage_timer("mongo_insert_case"):
+                        await cases_collection.insert_one(case_data)
+                    index_cases([case_data])
+                    case_ids.append(case_data['case_id'])
+            except Exception as e:
+                failed += 1
+                print(f"Video keyframe {keyframe['frame_index']} of {video['video_id']} failed: {e}")
+    
     try:
-        # Get case data
-        case = cases_collection.find_one({"case_id": case_id})
-        if not case:
-            raise HTTPException(status_code=404, detail="Case not found")
+        await asyncio.gather(produce(), *[consume() for _ in range(VIDEO_DETECT_CONCURRENCY)])
+    finally:
+        await asyncio.to_thread(frames.close)
+    
+    return {
+        "video_id": video['video_id'],
+        "filename": video['filename'],
+        "frames": summary.get("frames"),
+        "fps": summary.get("fps"),
+        "keyframes": summary.get("keyframes"),
+        "truncated": summary.get("truncated", False),
+        "skipped_blurry": summary.get("skipped_blurry"),
+        "skipped_unchanged": summary.get("skipped_unchanged"),
+        "cases_created": len(case_ids),
+        "failed": failed,
+        "case_ids": case_ids,
+        "elapsed": time.time() - start_time
+    }
+
+async def queue_video_ingest(payload):
+    job = await job_queue.submit("ingest_video", {"video_id": str(uuid.uuid4()), **payload})
+    return {
+        "job_id": job['job_id'],
+        "video_id": job['payload']['video_id'],
+        "status": job['status'],
+        "status_url": f"/api/job/{job['job_id']}",
+        "events_url": f"/api/job/{job['job_id']}/events",
+        "message": "Video ingestion queued"
+    }
+
+@app.post("/api/upload-video", status_code=202)
+async def upload_video(file: UploadFile = File(...)):
+    """Upload a video; keyframes showing faces become cases (track via the returned job)"""
+    try:
+        if not (file.content_type or '').startswith('video/'):
+            raise HTTPException(status_code=400, detail="File must be a video")
         
-        start_time = time.time()
+        video_blob, file_size = await stream_upload_to_store(file, blob_store, VIDEO_MAX_UPLOAD_BYTES)
+        return await queue_video_ingest({"video_blob": video_blob, "filename": file.filename, "file_size": file_size})
         
-        # Validate enhancement type
-        if enhancement_type not in FACE_MODELS:
-            enhancement_type = "restoration"
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Video upload failed: {str(e)}")
+
+class IngestVideoRequest(BaseModel):
+    path: str
+
+@app.post("/api/ingest-video", status_code=202)
+async def ingest_video(request: IngestVideoRequest):
+    """Ingest a video or image sequence pattern (frame_%05d.jpg) under VIDEO_INGEST_ROOT"""
+    try:
+        try:
+            path = resolve_ingest_path(request.path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Enhanced processing using HuggingFace models
-        enhanced_image, confidence, method = await enhance_face_huggingface(
-            case['original_image'], 
-            enhancement_type
+        return await queue_video_ingest({"path": path, "filename": os.path.basename(path)})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Video ingestion failed: {str(e)}")
+
+def enhancement_cache_key(case, enhancement_type, region="full", encoding=None, fallback_stages=FALLBACK_STAGES,
+                          fallback_preset=None):
+    """Memoization key for a case/enhancement pair; None when the image cannot be identified"""
+    image_hash = case.get('image_hash')
+    if not image_hash and case.get('original_blob'):
+        image_hash = f"blob:{case['original_blob']}"
+    if not image_hash:
+        return None
+    pipeline_version = FALLBACK_PIPELINE_VERSIONS[fallback_preset_name(fallback_preset)]
+    if region != "full":
+        # The crops depend on the stored boxes, which change with the detector
+        regions = json.dumps(enhancement_regions(case, region))
+        pipeline_version += "+faces-" + hashlib.sha256(regions.encode('utf-8')).hexdigest()[:16]
+    if encoding:
+        pipeline_version += "+{}-{}".format(*encoding)
+    if tuple(fallback_stages) != FALLBACK_STAGES:
+        pipeline_version += "+stages-" + "-".join(fallback_stages)
+    return make_cache_key(
+        image_hash,
+        enhancement_type,
+        inference_backend.model_id(enhancement_type),
+        pipeline_version
+    )
+
+def enhancement_regions(case, region):
+    """Padded face regions to enhance, or [] to enhance the full frame"""
+    if region != "faces" or not case.get('face_boxes') or not case.get('width'):
+        return []
+    return face_regions(case['face_boxes'], case['width'], case['height'])
+
+async def near_duplicate_result(case, enhancement_type, region, encoding, fallback_stages=FALLBACK_STAGES,
+                                fallback_preset=None):
+    """Cached result of the same enhancement for the case's closest near-duplicate, if any"""
+    donor = await cases_collection.find_one({"case_id": case['near_duplicate_of']})
+    if not donor:
+        return None
+    donor_region = "faces" if enhancement_regions(donor, region) else "full"
+    cache_key = enhancement_cache_key(donor, enhancement_type, donor_region, encoding, fallback_stages, fallback_preset)
+    if not cache_key:
+        return None
+    with stage_timer("cache_lookup"):
+        return await result_cache.get(cache_key)
+
+async def available(cached):
+    """A cached result, or None if compaction has since removed or archived its image"""
+    if cached and not await asyncio.to_thread(blob_store.exists, cached['enhanced_blob']):
+        return None
+    return cached
+
+async def run_enhancement(case, enhancement_type, progress=None, force=False, region="full",
+                          output_format=None, quality=None, reuse_duplicate=False, fallback_preset=None):
+    """Government-grade face enhancement using advanced AI models; returns the result summary
+
+    With region="faces" only padded crops around the detected faces are enhanced; cases
+    without stored face boxes are enhanced as a full frame. `output_format`/`quality`
+    override the deployment output encoding; model output is transcoded only when a
+    format is requested explicitly. With `reuse_duplicate`, a result already computed
+    for the case's closest near-duplicate is reused when there is none for the case itself.
+    `fallback_preset` overrides the deployment's OpenCV fallback preset.
+    
+    enhancement_type="auto" lets the routing policy pick the model and fallback stages
+    from the case's quality scores, or skip enhancement of an image that needs none.
+    """
+    async def report(value, stage):
+        if progress is not None:
+            await progress(value, stage)
+    
+    case_id = case['case_id']
+    start_time = time.time()
+    
+    if case.get('archive'):
+        # Archived by compaction: restore the images before they are read or referenced
+        await retention.rehydrate(case_id)
+    
+    routing = None
+    fallback_stages = FALLBACK_STAGES
+    if enhancement_type == AUTO_ENHANCEMENT:
+        routing = route_enhancement(case, FACE_MODELS)
+        enhancement_routing_decisions_total.inc(
+            action=routing["action"], enhancement_type=routing["enhancement_type"] or "none"
         )
+        print(f"Enhancement routing for case {case_id}: {json.dumps(routing)}")
+        if routing["action"] == "enhance":
+            enhancement_type = routing["enhancement_type"]
+            fallback_stages = tuple(routing["fallback_stages"])
+    skipped = routing is not None and routing["action"] == "skip"
+    
+    regions = enhancement_regions(case, region)
+    region = "faces" if regions else "full"
+    encoding = output_encoding(output_format, quality)
+    cache_key = None if skipped else enhancement_cache_key(
+        case, enhancement_type, region, encoding, fallback_stages, fallback_preset
+    )
+    cached = None
+    if cache_key and force:
+        result_cache.record_bypass()
+    elif cache_key:
+        with stage_timer("cache_lookup"):
+            cached = await available(await result_cache.get(cache_key))
+    
+    reused_from_case = None
+    if not cached and not skipped and not force and reuse_duplicate and case.get('near_duplicate_of'):
+        cached = await available(await near_duplicate_result(
+            case, enhancement_type, region, encoding, fallback_stages, fallback_preset
+        ))
+        if cached:
+            reused_from_case = case['near_duplicate_of']
+            # Another image's output must not answer exact lookups for this one
+            cache_key = None
+    
+    if cached:
+        await report(0.5, "cached")
+        original_format = case.get('image_format', 'image/png')
+        original_blob = case['original_blob']
+        enhanced_blob = cached['enhanced_blob']
+        enhanced_format = cached['enhanced_format']
+        confidence = cached['confidence_score']
+        method = cached['method_used']
+        stage_timings = {}
+        thumbnails = cached.get('thumbnails', {})
+        thumbnail_format = cached.get('thumbnail_format', THUMBNAIL_CONTENT_TYPE)
+        cached_from = cached['result_id']
+    elif skipped:
+        # The original already meets the quality thresholds: return it unaltered
+        await report(0.5, "skipped")
+        original_format = case.get('image_format', 'image/png')
+        original_blob = enhanced_blob = case['original_blob']
+        enhanced_format = original_format
+        confidence = 1.0
+        method = "Skipped (input meets quality thresholds)"
+        stage_timings = {}
+        thumbnails = case.get('thumbnails', {})
+        thumbnail_format = case.get('thumbnail_format', THUMBNAIL_CONTENT_TYPE)
+        cached_from = None
+    else:
+        await report(0.1, "loading")
+        original_format = case.get('image_format', 'image/png')
+        original_blob = case.get('original_blob')
+        if not original_blob:
+            # Documents written before the blob store still carry the inline data URI
+            original_bytes, original_format = decode_data_uri(case['original_image'])
+            original_blob = await asyncio.to_thread(blob_store.put, original_bytes)
         
-        if not enhanced_image:
-            enhanced_image = case['original_image']
+        # Enhanced processing using HuggingFace models
+        await report(0.2, "enhancing")
+        stage_timings = {}
+        if regions:
+            enhanced_bytes, confidence, method = await enhance_face_regions(
+                await blob_source(original_blob),
+                regions,
+                enhancement_type,
+                stage_timings,
+                encoding,
+                fallback_stages,
+                fallback_preset
+            )
+        else:
+            enhanced_bytes, confidence, method = await enhance_face_huggingface(
+                await blob_source(original_blob),
+                enhancement_type,
+                stage_timings,
+                encoding,
+                fallback_stages,
+                fallback_preset
+            )
+        
+        await report(0.9, "saving")
+        if enhanced_bytes and output_format and sniff_image_type(enhanced_bytes) != OUTPUT_FORMATS[encoding[0]][1]:
+            enhanced_bytes, transcode_timings = await worker_pool.run(transcode_image, enhanced_bytes, encoding)
+            stage_timings.update({f"transcode_{k}": v for k, v in transcode_timings.items()})
+        
+        thumbnails = {}
+        thumbnail_format = THUMBNAIL_CONTENT_TYPE
+        if enhanced_bytes:
+            enhanced_format = sniff_image_type(enhanced_bytes)
+            with stage_timer("blob_write"):
+                enhanced_blob = await asyncio.to_thread(blob_store.put, enhanced_bytes)
+            thumbnails = await generate_thumbnails(enhanced_blob, stage_timings)
+        else:
+            enhanced_blob = original_blob
+            enhanced_format = original_format
             confidence = 0.5
             method = "Basic Enhancement"
+        cached_from = None
         
-        processing_time = time.time() - start_time
+        # Only model output is memoized: a fallback result cached under the model's key
+        # would keep being served after the model recovers
+        if method == "Basic Enhancement" or FALLBACK_METHOD in method:
+            cache_key = None
+    
+    processing_time = time.time() - start_time
+    observe_stages(stage_timings)
+    enhancement_duration_seconds.observe(
+        processing_time, enhancement_type=enhancement_type, region=region, cache_hit=str(cached is not None).lower()
+    )
+    
+    model_description = (
+        "Original retained: no enhancement needed" if skipped else FACE_MODELS[enhancement_type]["description"]
+    )
+    
+    # Save result with detailed metadata
+    result_id = str(uuid.uuid4())
+    result_data = {
+        "result_id": result_id,
+        "case_id": case_id,
+        "original_blob": original_blob,
+        "original_format": original_format,
+        "enhanced_blob": enhanced_blob,
+        "enhanced_format": enhanced_format,
+        "thumbnails": thumbnails,
+        "thumbnail_format": thumbnail_format,
+        "enhancement_type": enhancement_type,
+        "region": region,
+        "face_regions": regions,
+        "confidence_score": confidence,
+        "method_used": method,
+        "processing_time": processing_time,
+        "stage_timings": stage_timings,
+        "cache_key": cache_key,
+        "cached_from": cached_from,
+        "reused_from_case": reused_from_case,
+        "routing": routing,
+        "model_info": model_description,
+        "processing_timestamp": datetime.now().isoformat(),
+        "status": "completed",
+        "forensic_grade": confidence >= 0.8
+    }
+    
+    with stage_timer("mongo_insert_result"):
+        await results_collection.insert_one(result_data)
+    if cache_key and not cached:
+        result_cache.remember(cache_key, result_data)
+    
+    # Update case status
+    with stage_timer("mongo_update_case"):
+        await cases_collection.update_one(
+            {"case_id": case_id},
+            {"$set": {"status": "processed", "result_id": result_id}}
+        )
+    
+    return {
+        "result_id": result_id,
+        "enhanced_url": f"/api/result/{result_id}/enhanced",
+        "original_url": f"/api/case/{case_id}/original",
+        "thumbnail_urls": thumbnail_urls(f"/api/result/{result_id}", thumbnails),
+        "enhanced_format": enhanced_format,
+        "confidence_score": confidence,
+        "method_used": method,
+        "region": region,
+        "processing_time": processing_time,
+        "stage_timings": stage_timings,
+        "cache_hit": cached_from is not None,
+        "reused_from_case": reused_from_case,
+        "enhancement_type": enhancement_type,
+        "routing": routing,
+        "forensic_grade": confidence >= 0.8,
+        "model_description": model_description,
+        "message": "Face enhancement completed with government-grade accuracy"
+    }
+
+async def enhancement_job(job, progress):
+    """Job handler: enhance one case and keep its status in step with the job"""
+    payload = job['payload']
+    case_id = payload['case_id']
+    with stage_timer("mongo_find_case"):
+        case = await cases_collection.find_one({"case_id": case_id})
+    if not case:
+        enhancement_jobs_total.inc(status="failed")
+        raise ValueError("Case not found")
+    
+    await cases_collection.update_one({"case_id": case_id}, {"$set": {"status": "running"}})
+    try:
+        result = await run_enhancement(
+            case, payload['enhancement_type'], progress, payload.get('force', False), payload.get('region', "full"),
+            payload.get('output_format'), payload.get('quality'), payload.get('reuse_duplicate', False),
+            payload.get('fallback_preset')
+        )
+        enhancement_jobs_total.inc(status="completed")
+        return result
+    except WorkerPoolSaturated:
+        if job_queue.is_last_attempt(job):
+            # The queue fails the job instead of retrying it again
+            enhancement_jobs_total.inc(status="failed")
+            await cases_collection.update_one(
+                {"case_id": case_id},
+                {"$set": {"status": "failed", "error": "Worker pool saturated, retries exhausted"}}
+            )
+        else:
+            enhancement_jobs_total.inc(status="retried")
+            await cases_collection.update_one({"case_id": case_id}, {"$set": {"status": "queued"}})
+        raise JobRetry(WORKER_RETRY_AFTER, "worker pool saturated")
+    except Exception as e:
+        enhancement_jobs_total.inc(status="failed")
+        await cases_collection.update_one(
+            {"case_id": case_id},
+            {"$set": {"status": "failed", "error": str(e)}}
+        )
+        raise
+
+async def enhancement_job_failed(job, error):
+    """Job failure hook: the queue gave up on a job before running it, so fail its case too"""
+    enhancement_jobs_total.inc(status="failed")
+    await cases_collection.update_one(
+        {"case_id": job['payload']['case_id']},
+        {"$set": {"status": "failed", "error": error}}
+    )
+
+@app.post("/api/enhance-face/{case_id}", status_code=202)
+async def enhance_face(case_id: str, enhancement_type: str = "restoration", force: bool = False, region: str = "full",
+                       output_format: Optional[str] = None, quality: Optional[int] = None,
+                       reuse_duplicate: bool = False, fallback_preset: Optional[str] = None):
+    """Queue a face enhancement job; progress via /api/job/{job_id} and its SSE stream"""
+    try:
+        # Get case data
+        case = await cases_collection.find_one({"case_id": case_id}, {"case_id": 1})
+        if not case:
+            raise HTTPException(status_code=404, detail="Case not found")
         
-        # Save result with detailed metadata
-        result_id = str(uuid.uuid4())
-        result_data = {
-            "result_id": result_id,
+        # Validate enhancement type
+        if enhancement_type not in FACE_MODELS and enhancement_type != AUTO_ENHANCEMENT:
+            enhancement_type = "restoration"
+        if region not in ENHANCEMENT_REGIONS:
+            raise HTTPException(status_code=400, detail=f"region must be one of {', '.join(ENHANCEMENT_REGIONS)}")
+        try:
+            output_encoding(output_format, quality)
+            fallback_preset_name(fallback_preset)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Mark the case queued before a worker can pick the job up and set it running
+        await cases_collection.update_one({"case_id": case_id}, {"$set": {"status": "queued"}})
+        
+        job = await job_queue.submit("enhance_face", {
             "case_id": case_id,
-            "original_image": case['original_image'],
-            "enhanced_image": enhanced_image,
             "enhancement_type": enhancement_type,
-            "confidence_score": confidence,
-            "method_used": method,
-            "processing_time": processing_time,
-            "model_info": FACE_MODELS[enhancement_type]["description"],
-            "processing_timestamp": datetime.now().isoformat(),
-            "status": "completed",
-            "forensic_grade": confidence >= 0.8
+            "force": force,
+            "region": region,
+            "output_format": output_format,
+            "quality": quality,
+            "reuse_duplicate": reuse_duplicate,
+            "fallback_preset": fallback_preset
+        })
+        
+        await cases_collection.update_one({"case_id": case_id}, {"$set": {"job_id": job['job_id']}})
+        
+        return {
+            "job_id": job['job_id'],
+            "case_id": case_id,
+            "status": job['status'],
+            "status_url": f"/api/job/{job['job_id']}",
+            "events_url": f"/api/job/{job['job_id']}/events",
+            "message": "Face enhancement queued"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
+
+@app.get("/api/job/{job_id}")
+async def get_job(job_id: str):
+    """Get the status, progress and (when completed) result of a job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@app.get("/api/job/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events with the job document on every progress change"""
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        async for job in job_queue.watch(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(job)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class EnhanceBatchRequest(BaseModel):
+    case_ids: List[str]
+    enhancement_type: str = "restoration"
+    force: bool = False
+    region: str = "full"
+    output_format: Optional[str] = None
+    quality: Optional[int] = None
+    reuse_duplicate: bool = False
+    fallback_preset: Optional[str] = None
+    # Enhance only the best frame of each face track (for consecutive frames of the same scene)
+    best_frame_per_track: bool = False
+
+async def case_tracks(case_ids):
+    """Face tracks across the given cases and the case ids holding each track's best detection
+
+    Frames of one video are ordered by frame index and tracked together; other uploads form one
+    sequence ordered by upload time.
+    """
+    cases = await cases_collection.find(
+        {"case_id": {"$in": case_ids}},
+        {"_id": 0, "case_id": 1, "face_boxes": 1, "width": 1, "height": 1, "upload_time": 1, "source_video": 1}
+    ).to_list(length=None)
+    sequences = {}
+    for case in cases:
+        video = case.get('source_video') or {}
+        key = video.get('video_id', "uploads")
+        order = (video['frame_index'], "") if video else (0, case.get('upload_time') or "")
+        sequences.setdefault(key, []).append((order, case))
+    
+    tracks = []
+    for key, members in sequences.items():
+        frames = [
+            {"frame_id": case['case_id'], "width": case.get('width'), "height": case.get('height'),
+             "boxes": case.get('face_boxes') or []}
+            for _, case in sorted(members, key=lambda member: member[0])
+        ]
+        for track in track_faces(frames):
+            track["track_id"] = len(tracks)
+            track["sequence"] = key
+            tracks.append(track)
+    return tracks, best_frames(tracks)
+
+class TrackFacesRequest(BaseModel):
+    case_ids: List[str]
+
+@app.post("/api/track-faces")
+async def track_case_faces(request: TrackFacesRequest):
+    """Link the faces detected in a sequence of cases into tracks and pick each track's best frame"""
+    try:
+        case_ids = list(dict.fromkeys(request.case_ids))
+        if len(case_ids) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} cases")
+        
+        tracks, best_case_ids = await case_tracks(case_ids)
+        return {
+            "tracks": [
+                {"track_id": track["track_id"], "sequence": track["sequence"], "length": len(track["detections"]),
+                 "best": track["best"], "detections": track["detections"]}
+                for track in tracks
+            ],
+            "best_case_ids": best_case_ids,
+            "summary": {
+                "cases": len(case_ids),
+                "detections": sum(len(track["detections"]) for track in tracks),
+                "tracks": len(tracks),
+                "best_frames": len(best_case_ids)
+            }
         }
         
-        results_collection.insert_one(result_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Face tracking failed: {str(e)}")
+
+@app.post("/api/enhance-batch", status_code=202)
+async def enhance_batch(batch: EnhanceBatchRequest):
+    """Queue enhancement jobs for many cases; track them via /api/batch/{batch_id}
+
+    With best_frame_per_track, faces are tracked across the cases and only the frames
+    holding a track's best detection are enhanced; the others are reported as skipped.
+    """
+    try:
+        start_time = time.time()
+        case_ids = list(dict.fromkeys(batch.case_ids))
+        if len(case_ids) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} cases")
         
-        # Update case status
-        cases_collection.update_one(
-            {"case_id": case_id},
-            {"$set": {"status": "processed", "result_id": result_id}}
-        )
+        enhancement_type = batch.enhancement_type
+        if enhancement_type not in FACE_MODELS and enhancement_type != AUTO_ENHANCEMENT:
+            enhancement_type = "restoration"
+        if batch.region not in ENHANCEMENT_REGIONS:
+            raise HTTPException(status_code=400, detail=f"region must be one of {', '.join(ENHANCEMENT_REGIONS)}")
+        try:
+            output_encoding(batch.output_format, batch.quality)
+            fallback_preset_name(batch.fallback_preset)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        found = await cases_collection.find(
+            {"case_id": {"$in": case_ids}}, {"_id": 0, "case_id": 1}
+        ).to_list(length=None)
+        found_ids = {case['case_id'] for case in found}
+        valid_ids = [case_id for case_id in case_ids if case_id in found_ids]
+        
+        tracks = None
+        if batch.best_frame_per_track and valid_ids:
+            tracks, best_case_ids = await case_tracks(valid_ids)
+            selected = set(best_case_ids)
+            valid_ids = [case_id for case_id in valid_ids if case_id in selected]
+        
+        batch_id = str(uuid.uuid4())
+        jobs = []
+        if valid_ids:
+            await cases_collection.update_many({"case_id": {"$in": valid_ids}}, {"$set": {"status": "queued"}})
+            jobs = await job_queue.submit_many("enhance_face", [
+                {"case_id": case_id, "enhancement_type": enhancement_type, "force": batch.force, "region": batch.region,
+                 "output_format": batch.output_format, "quality": batch.quality,
+                 "reuse_duplicate": batch.reuse_duplicate, "fallback_preset": batch.fallback_preset}
+                for case_id in valid_ids
+            ], batch_id)
+            await cases_collection.bulk_write([
+                UpdateOne({"case_id": job['payload']['case_id']}, {"$set": {"job_id": job['job_id']}})
+                for job in jobs
+            ], ordered=False)
+        
+        job_ids = {job['payload']['case_id']: job['job_id'] for job in jobs}
+        items = [
+            {"case_id": case_id, "job_id": job_ids[case_id], "status": "queued"}
+            if case_id in job_ids else
+            {"case_id": case_id, "status": "skipped", "reason": "Not the best frame of any face track"}
+            if case_id in found_ids else
+            {"case_id": case_id, "status": "error", "error": "Case not found"}
+            for case_id in case_ids
+        ]
+        
+        summary = {
+            "total": len(items),
+            "queued": len(jobs),
+            "skipped": sum(1 for item in items if item["status"] == "skipped"),
+            "not_found": sum(1 for item in items if item["status"] == "error"),
+            "elapsed": time.time() - start_time
+        }
+        if tracks is not None:
+            summary["tracks"] = len(tracks)
         
         return {
-            "result_id": result_id,
-            "enhanced_image": enhanced_image,
-            "confidence_score": confidence,
-            "method_used": method,
-            "processing_time": processing_time,
-            "forensic_grade": confidence >= 0.8,
-            "model_description": FACE_MODELS[enhancement_type]["description"],
-            "message": "Face enhancement completed with government-grade accuracy"
+            "batch_id": batch_id,
+            "status_url": f"/api/batch/{batch_id}",
+            "items": items,
+            "summary": summary,
+            "message": "Batch enhancement queued"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Enhancement failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch enhancement failed: {str(e)}")
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """Per-item status and aggregate timing of a batch enhancement"""
+    jobs = await job_queue.get_batch(batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    counts = {}
+    for job in jobs:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+    
+    finished = [job['finished_at'] for job in jobs if job.get('finished_at')]
+    created = min(job['created_at'] for job in jobs)
+    done = len(finished) == len(jobs)
+    processing_times = [job['result']['processing_time'] for job in jobs if job.get('result')]
+    
+    return {
+        "batch_id": batch_id,
+        "status": "completed" if done else "running",
+        "counts": counts,
+        "items": [{
+            "case_id": job['payload']['case_id'],
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "progress": job.get('progress', 0.0),
+            "result_id": (job.get('result') or {}).get('result_id'),
+            "method_used": (job.get('result') or {}).get('method_used'),
+            "error": job.get('error')
+        } for job in jobs],
+        "timing": {
+            "created_at": created,
+            "finished_at": max(finished) if done else None,
+            "elapsed": (datetime.fromisoformat(max(finished)) - datetime.fromisoformat(created)).total_seconds() if done else None,
+            "total_processing_time": sum(processing_times),
+            "average_processing_time": (sum(processing_times) / len(processing_times)) if processing_times else 0
+        }
+    }
+
+async def compaction_job(job, progress):
+    """Job handler: apply the retention policies and report the space reclaimed"""
+    report = await retention.compact(progress, job['payload'].get('dry_run', False))
+    if not report["dry_run"]:
+        for kind, reclaimed in report["bytes_reclaimed"].items():
+            storage_reclaimed_bytes_total.inc(reclaimed, kind=kind)
+    print(f"Storage compaction: {json.dumps({k: v for k, v in report.items() if k != 'collections'})}")
+    return report
+
+async def queue_compaction(dry_run=False):
+    """Submit a compaction job unless one is already queued or running; returns (job, created)"""
+    active = await jobs_collection.find_one(
+        {"type": "compact_storage", "status": {"$in": ["queued", "running"]}}, {"_id": 0, "not_before": 0, "lease_until": 0}
+    )
+    if active:
+        return active, False
+    return await job_queue.submit("compact_storage", {"dry_run": dry_run}), True
+
+async def compaction_scheduler():
+    """Queue a compaction job every COMPACTION_INTERVAL_HOURS"""
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL_HOURS * 3600)
+        try:
+            await queue_compaction()
+        except Exception as e:
+            print(f"Compaction scheduling error: {e}")
+
+class CompactionRequest(BaseModel):
+    # Report what the policies would reclaim without changing anything
+    dry_run: bool = False
+
+@app.post("/api/maintenance/compact", status_code=202)
+async def compact_storage(request: Optional[CompactionRequest] = None):
+    """Queue a storage compaction job; its result is the reclaimed-space report"""
+    try:
+        job, created = await queue_compaction((request or CompactionRequest()).dry_run)
+        if not created:
+            raise HTTPException(status_code=409, detail=f"Compaction job {job['job_id']} is already {job['status']}")
+        
+        return {
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "status_url": f"/api/job/{job['job_id']}",
+            "events_url": f"/api/job/{job['job_id']}/events",
+            "policy": retention.policy(),
+            "message": "Storage compaction queued"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Compaction failed: {str(e)}")
 
 @app.get("/api/case/{case_id}")
 async def get_case(case_id: str):
     """Get detailed case information"""
     try:
-        case = cases_collection.find_one({"case_id": case_id})
+        case = await cases_collection.find_one({"case_id": case_id}, CASE_PROJECTION)
         if not case:
             raise HTTPException(status_code=404, detail="Case not found")
         
-        # Remove MongoDB ObjectId for JSON serialization
-        case.pop('_id', None)
+        case['original_url'] = f"/api/case/{case_id}/original"
+        case['thumbnail_urls'] = thumbnail_urls(f"/api/case/{case_id}", case.pop('thumbnails', None) or {})
         
         return case
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get case: {str(e)}")
 
+@app.get("/api/case/{case_id}/near-duplicates")
+async def get_near_duplicates(case_id: str, max_distance: Optional[int] = None):
+    """Cases whose images are near-duplicates of this one, closest first"""
+    try:
+        case = await cases_collection.find_one({"case_id": case_id}, {"_id": 0, "phash": 1, "dhash": 1})
+        if not case:
+            raise HTTPException(status_code=404, detail="Case not found")
+        if max_distance is not None and not 0 <= max_distance <= 64:
+            raise HTTPException(status_code=400, detail="max_distance must be between 0 and 64")
+        
+        return {
+            "case_id": case_id,
+            "phash": case.get("phash"),
+            "near_duplicates": await find_near_duplicates(
+                case.get("phash"), case.get("dhash"), exclude=case_id, max_distance=max_distance
+            )
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find near-duplicates: {str(e)}")
+
 @app.get("/api/result/{result_id}")
 async def get_result(result_id: str):
     """Get detailed enhancement result"""
     try:
-        result = results_collection.find_one({"result_id": result_id})
+        result = await results_collection.find_one({"result_id": result_id}, RESULT_PROJECTION)
         if not result:
             raise HTTPException(status_code=404, detail="Result not found")
         
-        # Remove MongoDB ObjectId for JSON serialization
-        result.pop('_id', None)
+        result['original_url'] = f"/api/case/{result['case_id']}/original"
+        result['enhanced_url'] = f"/api/result/{result_id}/enhanced"
+        result['thumbnail_urls'] = thumbnail_urls(f"/api/result/{result_id}", result.pop('thumbnails', None) or {})
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get result: {str(e)}")
 
+async def restore_archived(doc):
+    """Bring back the images of an archived case (or of a result's case) before serving them"""
+    if doc.get('archive'):
+        await retention.rehydrate(doc['case_id'])
+
+@app.get("/api/case/{case_id}/original")
+async def get_case_original(case_id: str, request: Request):
+    """Stream the original evidence image as raw bytes"""
+    try:
+        case = await cases_collection.find_one(
+            {"case_id": case_id},
+            {"case_id": 1, "original_blob": 1, "original_image": 1, "image_format": 1, "archive": 1}
+        )
+        if not case or not (case.get('original_blob') or case.get('original_image')):
+            raise HTTPException(status_code=404, detail="Case not found")
+        await restore_archived(case)
+        
+        return image_response(
+            request,
+            case.get('original_blob'),
+            case.get('image_format', 'image/png'),
+            case.get('original_image')
+        )
+        
+    except HTTPException:
+        raise
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get image: {str(e)}")
+
+@app.get("/api/result/{result_id}/enhanced")
+async def get_result_enhanced(result_id: str, request: Request):
+    """Stream the enhanced image as raw bytes"""
+    try:
+        result = await results_collection.find_one(
+            {"result_id": result_id},
+            {"case_id": 1, "enhanced_blob": 1, "enhanced_image": 1, "enhanced_format": 1, "archive": 1}
+        )
+        if not result or not (result.get('enhanced_blob') or result.get('enhanced_image')):
+            raise HTTPException(status_code=404, detail="Result not found")
+        await restore_archived(result)
+        
+        return image_response(
+            request,
+            result.get('enhanced_blob'),
+            result.get('enhanced_format', 'image/png'),
+            result.get('enhanced_image')
+        )
+        
+    except HTTPException:
+        raise
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get image: {str(e)}")
+
+@app.get("/api/case/{case_id}/thumbnail/{size}")
+async def get_case_thumbnail(case_id: str, size: int, request: Request):
+    """Stream the stored preview closest to `size`, or the original if the case has none"""
+    try:
+        case = await cases_collection.find_one(
+            {"case_id": case_id},
+            {"case_id": 1, "original_blob": 1, "original_image": 1, "image_format": 1, "thumbnails": 1,
+             "thumbnail_format": 1, "archive": 1}
+        )
+        if not case or not (case.get('original_blob') or case.get('original_image')):
+            raise HTTPException(status_code=404, detail="Case not found")
+        await restore_archived(case)
+        
+        thumbnail_blob = pick_thumbnail(case.get('thumbnails'), size)
+        if thumbnail_blob:
+            return image_response(request, thumbnail_blob, case.get('thumbnail_format', THUMBNAIL_CONTENT_TYPE))
+        return image_response(
+            request,
+            case.get('original_blob'),
+            case.get('image_format', 'image/png'),
+            case.get('original_image')
+        )
+        
+    except HTTPException:
+        raise
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get image: {str(e)}")
+
+@app.get("/api/result/{result_id}/thumbnail/{size}")
+async def get_result_thumbnail(result_id: str, size: int, request: Request):
+    """Stream the stored preview of an enhanced image closest to `size`, or the full image"""
+    try:
+        result = await results_collection.find_one(
+            {"result_id": result_id},
+            {"case_id": 1, "enhanced_blob": 1, "enhanced_image": 1, "enhanced_format": 1, "thumbnails": 1,
+             "thumbnail_format": 1, "archive": 1}
+        )
+        if not result or not (result.get('enhanced_blob') or result.get('enhanced_image')):
+            raise HTTPException(status_code=404, detail="Result not found")
+        await restore_archived(result)
+        
+        thumbnail_blob = pick_thumbnail(result.get('thumbnails'), size)
+        if thumbnail_blob:
+            return image_response(request, thumbnail_blob, result.get('thumbnail_format', THUMBNAIL_CONTENT_TYPE))
+        return image_response(
+            request,
+            result.get('enhanced_blob'),
+            result.get('enhanced_format', 'image/png'),
+            result.get('enhanced_image')
+        )
+        
+    except HTTPException:
+        raise
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get image: {str(e)}")
+
 @app.get("/api/cases")
-async def get_all_cases():
-    """Get all cases with enhanced metadata"""
+async def get_all_cases(limit: int = CASES_PAGE_SIZE, cursor: Optional[str] = None, status: Optional[str] = None):
+    """Get a page of cases (newest first) with enhanced metadata"""
     try:
-        cases = list(cases_collection.find({}).sort("upload_time", -1))
+        limit = max(1, min(limit, CASES_MAX_PAGE_SIZE))
         
-        # Remove MongoDB ObjectIds and add statistics
-        for case in cases:
-            case.pop('_id', None)
+        query = {}
+        if status:
+            query["status"] = status
+        if cursor:
+            upload_time, case_id = decode_cases_cursor(cursor)
+            query["$or"] = [
+                {"upload_time": {"$lt": upload_time}},
+                {"upload_time": upload_time, "case_id": {"$lt": case_id}}
+            ]
         
-        # Calculate statistics
-        total_cases = len(cases)
-        processed_cases = len([c for c in cases if c.get('status') == 'processed'])
-        faces_detected = sum([c.get('face_count', 0) for c in cases])
+        # Fetch one extra document to know whether another page exists
+        cases = await (
+            cases_collection.find(query, CASE_PROJECTION)
+            .sort([("upload_time", DESCENDING), ("case_id", DESCENDING)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+        has_more = len(cases) > limit
+        cases = cases[:limit]
+        
+        for case in cases:
+            case['original_url'] = f"/api/case/{case['case_id']}/original"
+            case['thumbnail_urls'] = thumbnail_urls(f"/api/case/{case['case_id']}", case.pop('thumbnails', None) or {})
+            # Smallest configured preview; legacy cases without previews fall back to the original
+            case['thumbnail_url'] = f"/api/case/{case['case_id']}/thumbnail/{min(THUMBNAIL_SIZES)}"
         
         return {
             "cases": cases,
-            "statistics": {
-                "total_cases": total_cases,
-                "processed_cases": processed_cases,
-                "faces_detected": faces_detected,
-                "processing_rate": (processed_cases / total_cases * 100) if total_cases > 0 else 0
-            }
+            "next_cursor": encode_cases_cursor(cases[-1]) if has_more else None,
+            "statistics": await get_case_statistics()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get cases: {str(e)}")
 
@@ -0,0 +1,183 @@
+"""Keyframe sampling from video files and frame sequences.
+
+Frames are decoded one at a time with cv2.VideoCapture, so memory stays
+flat regardless of video length. The video is split into windows of
+VIDEO_SAMPLE_INTERVAL seconds; a few evenly spaced frames per window are
+scored for sharpness (variance of the Laplacian) and the sharpest one
+becomes a keyframe if it is sharp enough and differs from the previous
+keyframe: the share of cells of a small grayscale signature whose
+brightness changed, so a person entering a static CCTV view counts even
+though most of the frame is unchanged. A static camera therefore yields
+one keyframe per scene instead of one per frame.
+
+`source` is anything VideoCapture opens: a video file, or an image
+sequence pattern such as /evidence/cam1/frame_%05d.jpg.
+"""
+
+import os
+import cv2
+import numpy as np
+
+from image_ops import encode_image
+
+# Video ingestion configuration
+VIDEO_MAX_UPLOAD_BYTES = int(os.environ.get('VIDEO_MAX_UPLOAD_BYTES', str(2 * 1024 * 1024 * 1024)))
+VIDEO_SAMPLE_INTERVAL = float(os.environ.get('VIDEO_SAMPLE_INTERVAL', '0.5'))
+VIDEO_CANDIDATES_PER_WINDOW = int(os.environ.get('VIDEO_CANDIDATES_PER_WINDOW', '4'))
+# Share of signature cells that must change (by more than SCENE_CELL_DELTA levels) for a new keyframe
+VIDEO_SCENE_THRESHOLD = float(os.environ.get('VIDEO_SCENE_THRESHOLD', '0.02'))
+VIDEO_MIN_SHARPNESS = float(os.environ.get('VIDEO_MIN_SHARPNESS', '30.0'))
+VIDEO_MAX_KEYFRAMES = int(os.environ.get('VIDEO_MAX_KEYFRAMES', '500'))
+# Frame rate assumed when the container (or an image sequence) does not report one
+VIDEO_DEFAULT_FPS = float(os.environ.get('VIDEO_DEFAULT_FPS', '25'))
+# Local directory videos may be ingested from by path; unset disables path ingestion
+VIDEO_INGEST_ROOT = os.environ.get('VIDEO_INGEST_ROOT')
+
+# Keyframes are stored losslessly; they become the case originals
+KEYFRAME_ENCODING = ("png", 1)
+
+# Width frames are scaled to before scoring, so scores do not depend on resolution
+ANALYSIS_WIDTH = 320
+SIGNATURE_SIZE = (64, 36)
+SCENE_CELL_DELTA = 12
+
+
+def analysis_view(frame):
+    """Small grayscale copy of a frame used for sharpness and scene scores"""
+    height, width = frame.shape[:2]
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if width > ANALYSIS_WIDTH:
+        size = (ANALYSIS_WIDTH, max(1, round(height * ANALYSIS_WIDTH / width)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def sharpness(gray):
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def signature(gray):
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+class KeyframeSampler:
+    """Picks the sharpest candidate of each window and keeps it on a scene change"""
+
+    def __init__(self, min_sharpness=VIDEO_MIN_SHARPNESS, scene_threshold=VIDEO_SCENE_THRESHOLD):
+        self.min_sharpness = min_sharpness
+        self.scene_threshold = scene_threshold
+        self._best = None
+        self._last_signature = None
+        self.candidates = 0
+        self.blurry = 0
+        self.unchanged = 0
+
+    def offer(self, frame_index, frame):
+        """Score a candidate frame of the current window"""
+        self.candidates += 1
+        gray = analysis_view(frame)
+        score = sharpness(gray)
+        if self._best is None or score > self._best[2]:
+            self._best = (frame_index, frame, score, gray)
+
+    def end_window(self):
+        """Close the window; returns (frame_index, frame, sharpness, scene_change) or None"""
+        best, self._best = self._best, None
+        if best is None:
+            return None
+        frame_index, frame, score, gray = best
+        if score < self.min_sharpness:
+            self.blurry += 1
+            return None
+        current = signature(gray)
+        change = None
+        if self._last_signature is not None:
+            change = float(np.mean(np.abs(current - self._last_signature) > SCENE_CELL_DELTA))
+            if change < self.scene_threshold:
+                self.unchanged += 1
+                return None
+        self._last_signature = current
+        return frame_index, frame, score, change
+
+    def stats(self):
+        return {"candidates": self.candidates, "skipped_blurry": self.blurry, "skipped_unchanged": self.unchanged}
+
+
+def iter_keyframes(source, interval=VIDEO_SAMPLE_INTERVAL, candidates=VIDEO_CANDIDATES_PER_WINDOW,
+                   max_keyframes=VIDEO_MAX_KEYFRAMES, sampler=None):
+    """Yield keyframe dicts (frame_index, timestamp, image, width, height, sharpness, scene_change).
+
+    `image` is the encoded keyframe. Frames that are not candidates are only
+    grabbed, never converted. The last item yielded is a summary dict with
+    `done` set, carrying the frame count and sampler statistics.
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError("Unsupported or unreadable video")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or VIDEO_DEFAULT_FPS
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        window = max(1, round(fps * interval))
+        step = max(1, window // max(1, candidates))
+        sampler = sampler or KeyframeSampler()
+        emitted = 0
+        frame_index = 0
+        truncated = False
+
+        def keyframe(picked):
+            index, frame, score, change = picked
+            return {
+                "frame_index": index,
+                "timestamp": round(index / fps, 3),
+                "image": encode_image(frame, KEYFRAME_ENCODING),
+                "width": frame.shape[1],
+                "height": frame.shape[0],
+                "sharpness": round(score, 2),
+                "scene_change": None if change is None else round(change, 4),
+                "frame_count": total,
+            }
+
+        while True:
+            if emitted >= max_keyframes:
+                truncated = True
+                break
+            position = frame_index % window
+            if position % step == 0:
+                ok, frame = capture.read()
+                if ok:
+                    sampler.offer(frame_index, frame)
+            else:
+                ok = capture.grab()
+            if not ok:
+                break
+            frame_index += 1
+            if frame_index % window == 0:
+                picked = sampler.end_window()
+                if picked:
+                    emitted += 1
+                    yield keyframe(picked)
+
+        if not truncated:
+            picked = sampler.end_window()
+            if picked:
+                emitted += 1
+                yield keyframe(picked)
+
+        yield {"done": True, "frames": frame_index, "fps": fps, "keyframes": emitted,
+               "truncated": truncated, **sampler.stats()}
+    finally:
+        capture.release()
+
+
+def resolve_ingest_path(path):
+    """Absolute path of a local video under VIDEO_INGEST_ROOT; ValueError if not allowed"""
+    if not VIDEO_INGEST_ROOT:
+        raise ValueError("Ingesting videos by path is disabled (VIDEO_INGEST_ROOT is not set)")
+    root = os.path.realpath(VIDEO_INGEST_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError("Path is outside the video ingest root")
+    # Image sequence patterns (frame_%05d.jpg) name files that do not exist literally
+    if '%' not in os.path.basename(resolved) and not os.path.isfile(resolved):
+        raise ValueError("Video not found")
+    return resolved
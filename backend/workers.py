@@ -0,0 +1,100 @@
+"""Bounded worker pool for CPU-bound image processing.
+
+OpenCV work is moved off the event loop into a process pool (or a thread
+pool, since OpenCV releases the GIL). The number of in-flight jobs is
+capped so a burst of large uploads is rejected early instead of queueing
+without limit.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker pool configuration
+WORKER_POOL_KIND = os.environ.get('WORKER_POOL_KIND', 'process')
+WORKER_POOL_SIZE = int(os.environ.get('WORKER_POOL_SIZE', str(os.cpu_count() or 2)))
+WORKER_QUEUE_LIMIT = int(os.environ.get('WORKER_QUEUE_LIMIT', str(WORKER_POOL_SIZE * 4)))
+WORKER_RETRY_AFTER = int(os.environ.get('WORKER_RETRY_AFTER', '5'))
+
+
+class WorkerPoolSaturated(Exception):
+    """Raised when the pool already holds its maximum number of pending jobs"""
+
+
+def _init_worker():
+    # Each worker gets one core; let the pool provide the parallelism
+    import cv2
+    cv2.setNumThreads(1)
+    # Parse the Haar cascades once per worker instead of once per request
+    from face_detector import warm_up
+    warm_up()
+
+
+def _noop():
+    return None
+
+
+class WorkerPool:
+    """Executor wrapper that bounds running + queued jobs"""
+
+    def __init__(self, kind=WORKER_POOL_KIND, size=WORKER_POOL_SIZE, queue_limit=WORKER_QUEUE_LIMIT):
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"Unknown worker pool kind: {kind}")
+        self.kind = kind
+        self.size = max(1, size)
+        self.max_pending = self.size + max(0, queue_limit)
+        self.pending = 0
+        self.finished = 0
+        self.rejected = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.size, initializer=_init_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='image-worker', initializer=_init_worker)
+        return self._executor
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, raising WorkerPoolSaturated when full"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise WorkerPoolSaturated(f"{self.pending} image jobs pending")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge image); start a fresh pool
+                print("Worker pool broken - restarting")
+                self._executor = None
+                raise
+        finally:
+            self.pending -= 1
+            self.finished += 1
+
+    async def warm_up(self):
+        """Start the workers ahead of the first request"""
+        await asyncio.gather(*[self.run(_noop) for _ in range(self.size)])
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "size": self.size,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "finished": self.finished,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the AI Face Reconstruction backend.
+
+Runs entirely locally and reports JSON so numbers can be compared between
+commits:
+
+  * pipelines: detect_faces_opencv / advanced_fallback_enhancement latency
+    and peak memory per resolution, each measured in a fresh process
+  * api: the FastAPI app driven in-process under concurrent load, with
+    mongomock (or --mongo-url) for MongoDB and a local mock inference server
+
+Usage:
+    python backend_benchmark.py --output bench.json
+    python backend_benchmark.py --compare bench.json     # diff against a baseline
+
+Requires backend/requirements.txt (which includes mongomock-motor). Progress
+goes to stderr, so without --output stdout carries only the JSON report.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+DEFAULT_RESOLUTIONS = "640x480,1920x1080,3840x2160"
+
+
+def log(message=""):
+    """Progress output; stdout is reserved for the JSON report"""
+    print(message, file=sys.stderr, flush=True)
+
+
+def configure_backend(blob_dir, inference_url=None, mongo_url=None):
+    """Point the backend at throwaway storage and in-process stand-ins; call before importing it"""
+    # The backend logs with print(); keep it out of the report on stdout
+    sys.stdout = sys.stderr
+    os.environ["BLOB_STORE_PATH"] = blob_dir
+    os.environ["WORKER_POOL_KIND"] = "thread"
+    os.environ.setdefault("WORKER_QUEUE_LIMIT", "256")
+    if inference_url:
+        os.environ["HUGGINGFACE_API_KEY"] = "benchmark"
+        os.environ["HUGGINGFACE_API_URL"] = inference_url
+    else:
+        os.environ["HUGGINGFACE_API_KEY"] = ""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    if mongo_url:
+        os.environ["MONGO_URL"] = mongo_url
+        return
+    import motor.motor_asyncio
+    import mongomock_motor
+    motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient()
+
+
+def synthetic_frame(width, height, seed=0):
+    """Deterministic photo-like BGR array: gradient, sensor noise and a few face-like shapes"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = np.dstack([60 + 120 * x * (1 - y), 80 + 100 * y + 0 * x, 140 - 60 * x + 0 * y])
+    img = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+
+    for _ in range(4):
+        r = int(min(width, height) * rng.uniform(0.06, 0.12))
+        cx, cy = int(rng.uniform(r, width - r)), int(rng.uniform(r, height - r))
+        cv2.ellipse(img, (cx, cy), (r, int(r * 1.25)), 0, 0, 360, (150, 170, 200), -1)
+        for dx in (-r // 3, r // 3):
+            cv2.circle(img, (cx + dx, cy - r // 4), max(2, r // 8), (40, 40, 40), -1)
+        cv2.ellipse(img, (cx, cy + r // 2), (r // 3, max(2, r // 8)), 0, 0, 180, (60, 50, 120), max(1, r // 20))
+    return img
+
+
+def synthetic_image(width, height, seed=0, quality=90):
+    """synthetic_frame encoded as JPEG"""
+    import cv2
+
+    img = synthetic_frame(width, height, seed)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def load_images(resolutions, fixtures_dir=None):
+    """[(label, encoded bytes)] for each synthetic resolution and fixture file"""
+    images = []
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        images.append((f"synthetic-{width}x{height}", synthetic_image(width, height)))
+    if fixtures_dir:
+        for name in sorted(os.listdir(fixtures_dir)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".bmp")):
+                with open(os.path.join(fixtures_dir, name), "rb") as f:
+                    images.append((f"fixture-{name}", f.read()))
+    return images
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Pipeline benchmarks (one fresh process per measurement for clean peak RSS)
+# ---------------------------------------------------------------------------
+
+def _pipeline_worker(operation, data, iterations, blob_dir, queue):
+    configure_backend(blob_dir)
+    import server
+
+    async def run():
+        # Warm-up call loads cascades and allocator pools outside the measurement
+        await call()
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await call()
+            timings.append(time.perf_counter() - started)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return timings, (peak - baseline) / 1024, peak / 1024
+
+    async def call():
+        if operation == "detect_faces_opencv":
+            await server.detect_faces_opencv(data)
+        else:
+            await server.advanced_fallback_enhancement(data)
+
+    try:
+        queue.put(("ok", asyncio.run(run())))
+    except Exception as e:
+        queue.put(("error", repr(e)))
+    finally:
+        server.worker_pool.shutdown()
+
+
+def bench_pipelines(images, iterations, blob_dir):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for operation in ("detect_faces_opencv", "advanced_fallback_enhancement"):
+        for label, data in images:
+            queue = context.Queue()
+            process = context.Process(target=_pipeline_worker, args=(operation, data, iterations, blob_dir, queue))
+            process.start()
+            status, payload = queue.get()
+            process.join()
+            if status != "ok":
+                log(f"  {operation} {label}: ERROR {payload}")
+                results.append({"operation": operation, "image": label, "error": payload})
+                continue
+            timings, growth_mb, peak_mb = payload
+            entry = {
+                "operation": operation,
+                "image": label,
+                "bytes": len(data),
+                "latency": summarize(timings),
+                "throughput_per_s": len(timings) / sum(timings) if sum(timings) else None,
+                "peak_rss_growth_mb": round(growth_mb, 1),
+                "peak_rss_mb": round(peak_mb, 1),
+            }
+            results.append(entry)
+            log(f"  {operation:32s} {label:28s} p50 {entry['latency']['p50_ms']:8.1f} ms"
+                  f"  p99 {entry['latency']['p99_ms']:8.1f} ms  +{entry['peak_rss_growth_mb']} MB")
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Mock inference server
+# ---------------------------------------------------------------------------
+
+def start_mock_inference(latency, failure_rate):
+    """Local stand-in for the hosted inference API: echoes the image after `latency` seconds"""
+    import random
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response, JSONResponse
+
+    mock = FastAPI()
+    rng = random.Random(0)
+
+    @mock.post("/models/{model_path:path}")
+    async def infer(model_path: str, request: Request):
+        body = await request.body()
+        await asyncio.sleep(latency)
+        if rng.random() < failure_rate:
+            return JSONResponse({"error": "overloaded"}, status_code=503)
+        return Response(body, media_type="image/jpeg")
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(mock, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}/models/"
+
+
+# ---------------------------------------------------------------------------
+# In-process API load
+# ---------------------------------------------------------------------------
+
+async def run_load(name, requests_total, concurrency, make_request):
+    """Issue `requests_total` calls of make_request(i) with bounded concurrency"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await make_request(i)
+            except Exception as e:
+                log(f"    {name} request error: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests_total)])
+    elapsed = time.perf_counter() - started
+    entry = {
+        "scenario": name,
+        "requests": requests_total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_per_s": requests_total / elapsed if elapsed else None,
+        "latency": summarize(latencies),
+    }
+    log(f"  {name:28s} {entry['throughput_per_s']:8.1f} req/s  p50 {entry['latency']['p50_ms']:8.1f} ms"
+          f"  p99 {entry['latency']['p99_ms']:8.1f} ms  errors {errors}")
+    return entry
+
+
+async def bench_api(requests_total, concurrency, upload_resolution):
+    import httpx
+    import server
+
+    app = server.app
+    # Runs the app's startup/shutdown handlers (indexes, job workers, warm-up)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            width, height = (int(v) for v in upload_resolution.split("x"))
+            images = [synthetic_image(width, height, seed=i) for i in range(8)]
+            case_ids = []
+
+            async def upload(i):
+                response = await client.post(
+                    "/api/upload-image",
+                    files={"file": (f"bench-{i}.jpg", images[i % len(images)], "image/jpeg")}
+                )
+                if response.status_code == 200:
+                    case_ids.append(response.json()["case_id"])
+                return response.status_code == 200
+
+            async def enhance(i, force=True):
+                case_id = case_ids[i % len(case_ids)]
+                response = await client.post(f"/api/enhance-face/{case_id}", params={"force": str(force).lower()})
+                if response.status_code != 202:
+                    return False
+                status_url = response.json()["status_url"]
+                while True:
+                    job = (await client.get(status_url)).json()
+                    if job["status"] in ("completed", "failed"):
+                        return job["status"] == "completed"
+                    await asyncio.sleep(0.01)
+
+            async def enhance_cached(i):
+                return await enhance(i, force=False)
+
+            async def list_cases(i):
+                response = await client.get("/api/cases", params={"limit": 20})
+                return response.status_code == 200
+
+            async def thumbnail(i):
+                case_id = case_ids[i % len(case_ids)]
+                response = await client.get(f"/api/case/{case_id}/thumbnail/160")
+                return response.status_code == 200
+
+            results = [await run_load("upload", requests_total, concurrency, upload)]
+            if case_ids:
+                results.append(await run_load("enhance", requests_total, concurrency, enhance))
+                results.append(await run_load("enhance_cached", requests_total, concurrency, enhance_cached))
+                results.append(await run_load("list_cases", requests_total, concurrency, list_cases))
+                results.append(await run_load("thumbnail", requests_total, concurrency, thumbnail))
+
+            metrics = (await client.get("/api/health")).json()
+            return results, {key: metrics.get(key) for key in ("worker_pool", "result_cache", "inference", "enhancement_scheduler")}
+
+
+def _api_worker(args, blob_dir, inference_url, queue):
+    configure_backend(blob_dir, inference_url, args.mongo_url)
+    try:
+        queue.put(("ok", asyncio.run(bench_api(args.requests, args.concurrency, args.upload_resolution))))
+    except Exception as e:
+        queue.put(("error", repr(e)))
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def environment():
+    import cv2
+    import numpy
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def compare(baseline, current):
+    """Print p50/p99 changes per benchmark between two reports"""
+    def index(report):
+        rows = {}
+        for entry in report.get("pipelines", []):
+            rows[f"{entry['operation']} {entry['image']}"] = entry.get("latency", {})
+        for entry in report.get("api", []):
+            rows[f"api {entry['scenario']}"] = entry.get("latency", {})
+        return rows
+
+    before, after = index(baseline), index(current)
+    log(f"\n{'benchmark':62s} {'p50 change':>12s} {'p99 change':>12s}")
+    for name in sorted(set(before) & set(after)):
+        changes = []
+        for key in ("p50_ms", "p99_ms"):
+            old, new = before[name].get(key), after[name].get(key)
+            changes.append(f"{(new - old) / old * 100:+11.1f}%" if old and new is not None else f"{'n/a':>12s}")
+        log(f"{name:62s} {changes[0]} {changes[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="comma-separated WxH list")
+    parser.add_argument("--fixtures", help="directory of extra images to benchmark")
+    parser.add_argument("--iterations", type=int, default=5, help="runs per pipeline measurement")
+    parser.add_argument("--requests", type=int, default=40, help="requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent API requests")
+    parser.add_argument("--upload-resolution", default="1280x720", help="WxH of images used for API load")
+    parser.add_argument("--inference-latency", type=float, default=0.05, help="mock inference latency (s)")
+    parser.add_argument("--inference-failure-rate", type=float, default=0.0, help="share of mock 503 responses")
+    parser.add_argument("--mongo-url", help="run the API scenarios against this MongoDB instead of mongomock (writes to face_reconstruction_db)")
+    parser.add_argument("--skip-pipelines", action="store_true")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "config": vars(args)}
+    blob_dir = tempfile.mkdtemp(prefix="bench-blobs-")
+    try:
+        if not args.skip_pipelines:
+            log("=== Pipelines ===")
+            images = load_images(args.resolutions.split(","), args.fixtures)
+            report["pipelines"] = bench_pipelines(images, args.iterations, blob_dir)
+
+        if not args.skip_api:
+            log("=== API (in-process, mongomock, mock inference) ===")
+            mock_server, mock_thread, inference_url = start_mock_inference(
+                args.inference_latency, args.inference_failure_rate
+            )
+            try:
+                context = multiprocessing.get_context("spawn")
+                queue = context.Queue()
+                process = context.Process(target=_api_worker, args=(args, blob_dir, inference_url, queue))
+                process.start()
+                status, payload = queue.get()
+                process.join()
+            finally:
+                mock_server.should_exit = True
+                mock_thread.join(timeout=5)
+            if status == "ok":
+                report["api"], report["api_components"] = payload
+            else:
+                log(f"  API benchmark ERROR {payload}")
+                report["api_error"] = payload
+    finally:
+        shutil.rmtree(blob_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        log(f"\nReport written to {args.output}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -108,6 +108,21 @@ def test_image_upload():
         print(f"❌ Image upload FAILED - Error: {str(e)}")
         return False, None
 
+def wait_for_job(job, timeout=180):
+    """Poll an enhancement job until it completes; returns the result or None"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BACKEND_URL}/job/{job['job_id']}", timeout=10)
+        data = response.json()
+        if data.get("status") == "completed":
+            return data.get("result")
+        if data.get("status") == "failed":
+            print(f"Job failed: {data.get('error')}")
+            return None
+        time.sleep(2)
+    print("Job timed out")
+    return None
+
 def test_face_enhancement(case_id):
     """Test Face Enhancement API - POST /api/enhance-face/{case_id}"""
     print(f"\n=== Testing Face Enhancement for case_id: {case_id} ===")
@@ -116,9 +131,9 @@ def test_face_enhancement(case_id):
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
-        if response.status_code == 200:
-            data = response.json()
-            required_fields = ['result_id', 'enhanced_image', 'confidence_score', 'method_used', 'message']
+        if response.status_code == 202:
+            data = wait_for_job(response.json()) or {}
+            required_fields = ['result_id', 'enhanced_url', 'confidence_score', 'method_used', 'message']
             
             if all(field in data for field in required_fields):
                 print("✅ Face enhancement PASSED")
@@ -153,8 +168,8 @@ def test_face_enhancement_with_models(case_id):
             )
             print(f"Status Code: {response.status_code}")
             
-            if response.status_code == 200:
-                data = response.json()
+            data = wait_for_job(response.json()) if response.status_code == 202 else None
+            if data:
                 print(f"Method used: {data.get('method_used')}")
                 print(f"Confidence score: {data.get('confidence_score')}")
                 print(f"Model description: {data.get('model_description')}")
@@ -186,7 +201,7 @@ def test_get_case(case_id):
         
         if response.status_code == 200:
             data = response.json()
-            required_fields = ['case_id', 'original_image', 'filename', 'upload_time', 'faces_detected', 'face_count', 'status']
+            required_fields = ['case_id', 'original_url', 'filename', 'upload_time', 'faces_detected', 'face_count', 'status']
             
             if all(field in data for field in required_fields):
                 print("✅ Get case PASSED")
@@ -8,6 +8,8 @@ const App = () => {
   const [analysisResult, setAnalysisResult] = useState(null);
   const [enhancementResult, setEnhancementResult] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [jobProgress, setJobProgress] = useState(null);
+  const [facesOnly, setFacesOnly] = useState(false);
   const [cases, setCases] = useState([]);
   const fileInputRef = useRef(null);
 
@@ -19,7 +21,7 @@ const App = () => {
 
   const fetchCases = async () => {
     try {
-      const response = await fetch(`${backendUrl}/api/cases`);
+      const response = await fetch(`${backendUrl}/api/cases?limit=6`);
       const data = await response.json();
       setCases(data.cases || []);
     } catch (error) {
@@ -79,19 +81,56 @@ const App = () => {
     }
   };
 
+  // Follow a background job over SSE, falling back to polling if the stream drops
+  const waitForJob = (job) => new Promise((resolve, reject) => {
+    const finish = (data) => {
+      if (data.status === 'completed') {
+        resolve(data.result);
+        return true;
+      }
+      if (data.status === 'failed') {
+        reject(new Error(data.error || 'Job failed'));
+        return true;
+      }
+      setJobProgress(data.progress);
+      return false;
+    };
+
+    const poll = async () => {
+      try {
+        const response = await fetch(`${backendUrl}${job.status_url}`);
+        const data = await response.json();
+        if (!finish(data)) setTimeout(poll, 2000);
+      } catch (error) {
+        reject(error);
+      }
+    };
+
+    const events = new EventSource(`${backendUrl}${job.events_url}`);
+    events.onmessage = (event) => {
+      if (finish(JSON.parse(event.data))) events.close();
+    };
+    events.onerror = () => {
+      events.close();
+      poll();
+    };
+  });
+
   const enhanceFace = async (enhancementType = 'restoration') => {
     if (!caseId) return;
 
     setLoading(true);
+    setJobProgress(0);
     try {
-      const response = await fetch(`${backendUrl}/api/enhance-face/${caseId}?enhancement_type=${enhancementType}`, {
+      const response = await fetch(`${backendUrl}/api/enhance-face/${caseId}?enhancement_type=${enhancementType}&region=${facesOnly ? 'faces' : 'full'}`, {
         method: 'POST',
       });
 
       const data = await response.json();
       
       if (response.ok) {
-        setEnhancementResult(data);
+        const result = await waitForJob(data);
+        setEnhancementResult(result);
         setCurrentStep('results');
         fetchCases();
       } else {
@@ -102,15 +141,21 @@ const App = () => {
       alert('Enhancement failed. Please try again.');
     } finally {
       setLoading(false);
+      setJobProgress(null);
     }
   };
 
+  const processingLabel = jobProgress !== null
+    ? `Processing... ${Math.round(jobProgress * 100)}%`
+    : 'Processing...';
+
   const resetProcess = () => {
     setCurrentStep('upload');
     setSelectedFile(null);
     setCaseId(null);
     setAnalysisResult(null);
     setEnhancementResult(null);
+    setFacesOnly(false);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
     }
@@ -162,7 +207,7 @@ const App = () => {
           <div className="cases-grid">
             {cases.slice(0, 6).map((case_, index) => (
               <div key={index} className="case-card">
-                <img src={case_.original_image} alt={`Case ${case_.case_id}`} />
+                <img src={`${backendUrl}${case_.thumbnail_url || case_.original_url}`} alt={`Case ${case_.case_id}`} loading="lazy" />
                 <div className="case-info">
                   <p>Case: {case_.case_id.substring(0, 8)}</p>
                   <p>Faces: {case_.face_count}</p>
@@ -241,6 +286,17 @@ const App = () => {
 
       <div className="enhancement-options">
         <h3>Government-Grade Enhancement Options</h3>
+        {analysisResult?.faces_detected && (
+          <label className="region-toggle">
+            <input
+              type="checkbox"
+              checked={facesOnly}
+              onChange={(e) => setFacesOnly(e.target.checked)}
+              disabled={loading}
+            />
+            Enhance detected face regions only
+          </label>
+        )}
         <div className="enhancement-grid">
           <div className="enhancement-option">
             <button 
@@ -248,7 +304,7 @@ const App = () => {
               className="btn-primary"
               disabled={loading}
             >
-              {loading ? 'Processing...' : 'Face Restoration'}
+              {loading ? processingLabel : 'Face Restoration'}
             </button>
             <p>High-fidelity restoration with identity preservation</p>
           </div>
@@ -259,7 +315,7 @@ const App = () => {
               className="btn-primary"
               disabled={loading}
             >
-              {loading ? 'Processing...' : 'Super Resolution'}
+              {loading ? processingLabel : 'Super Resolution'}
             </button>
             <p>Ultra-high resolution enhancement</p>
           </div>
@@ -270,7 +326,7 @@ const App = () => {
               className="btn-primary"
               disabled={loading}
             >
-              {loading ? 'Processing...' : 'Forensic Enhancement'}
+              {loading ? processingLabel : 'Forensic Enhancement'}
             </button>
             <p>Government-grade forensic reconstruction</p>
           </div>
@@ -281,10 +337,21 @@ const App = () => {
               className="btn-primary"
               disabled={loading}
             >
-              {loading ? 'Processing...' : 'Identity Preservation'}
+              {loading ? processingLabel : 'Identity Preservation'}
             </button>
             <p>Maximum identity consistency for analysis</p>
           </div>
+          
+          <div className="enhancement-option">
+            <button 
+              onClick={() => enhanceFace('auto')} 
+              className="btn-primary"
+              disabled={loading}
+            >
+              {loading ? processingLabel : 'Automatic'}
+            </button>
+            <p>Model chosen from measured image quality</p>
+          </div>
         </div>
       </div>
 
@@ -309,7 +376,7 @@ const App = () => {
           
           <div className="image-container">
             <h3>Enhanced Result</h3>
-            <img src={enhancementResult?.enhanced_image} alt="Enhanced" />
+            <img src={enhancementResult && `${backendUrl}${enhancementResult.enhanced_url}`} alt="Enhanced" />
           </div>
         </div>
         
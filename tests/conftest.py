@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other as top-level modules (uvicorn runs from backend/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from tests.images import make_image  # noqa: E402
+
+
+@pytest.fixture
+def image():
+    return make_image(500, 370)
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """TestClient for the app, backed by mongomock and a throwaway blob store, without inference.
+
+    The environment and the Motor client patch are undone at the end of the session.
+    """
+    motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("BLOB_STORE_PATH", str(tmp_path_factory.mktemp("blobs")))
+        patch.setenv("ARCHIVE_PATH", str(tmp_path_factory.mktemp("archive")))
+        patch.setenv("WORKER_POOL_KIND", "thread")
+        patch.setenv("HUGGINGFACE_API_KEY", "")
+        patch.setattr(motor_asyncio, "AsyncIOMotorClient", lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient())
+        import server
+
+        with TestClient(server.app) as client:
+            yield client
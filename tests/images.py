@@ -0,0 +1,4 @@
+"""Synthetic images shared by the tests"""
+
+# The benchmark's generator, so tests and benchmarks exercise the same kind of image
+from backend_benchmark import synthetic_frame as make_image  # noqa: F401
@@ -0,0 +1,62 @@
+import base64
+import hashlib
+
+import pytest
+
+from blob_store import INLINE_IMAGE_FIELDS, BlobNotFound, LocalBlobStore, decode_data_uri, inline_images_update
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path / "blobs"))
+
+
+def test_put_is_content_addressed_and_deduplicated(store):
+    data = b"face image bytes"
+    blob_id = store.put(data)
+    assert blob_id == hashlib.sha256(data).hexdigest()
+    assert store.put(data) == blob_id
+    assert store.read(blob_id) == data
+    assert [(entry[0], entry[1]) for entry in store.iter_blobs()] == [(blob_id, len(data))]
+
+
+def test_streamed_writer_matches_put(store):
+    writer = store.new_file()
+    for chunk in (b"abc", b"def", b"ghi"):
+        writer.write(chunk)
+    blob_id = writer.close()
+    assert blob_id == store.put(b"abcdefghi")
+    assert writer.length == 9
+    assert len(list(store.iter_blobs())) == 1
+
+
+def test_ranges_and_delete(store):
+    blob_id = store.put(bytes(range(256)) * 4096)
+    with store.get(blob_id) as blob:
+        assert blob.length == 256 * 4096
+    assert b"".join(store.get(blob_id).iter_range(300, 10)) == bytes(range(44, 54))
+    assert store.delete(blob_id)
+    assert not store.exists(blob_id) and not store.delete(blob_id)
+    with pytest.raises(BlobNotFound):
+        store.get(blob_id)
+
+
+def test_invalid_ids_are_not_found(store):
+    assert not store.exists("../../etc/passwd")
+    with pytest.raises(BlobNotFound):
+        store.get("not-a-hash")
+
+
+def test_inline_images_update(store):
+    uri = "data:image/jpeg;base64," + base64.b64encode(b"jpeg bytes").decode()
+    assert decode_data_uri(uri) == (b"jpeg bytes", "image/jpeg")
+
+    update, inline_bytes = inline_images_update({"original_image": uri}, INLINE_IMAGE_FIELDS["results"], store)
+    assert update == {"$set": {"original_blob": hashlib.sha256(b"jpeg bytes").hexdigest(),
+                               "original_format": "image/jpeg"},
+                      "$unset": {"original_image": ""}}
+    assert inline_bytes == len(uri)
+
+    dry, _ = inline_images_update({"original_image": uri}, INLINE_IMAGE_FIELDS["cases"], store, dry_run=True)
+    assert dry == {"$unset": {"original_image": ""}}
+    assert inline_images_update({"original_blob": "x"}, INLINE_IMAGE_FIELDS["cases"], store) == (None, 0)
@@ -0,0 +1,79 @@
+import time
+
+import cv2
+import pytest
+
+from inference_client import InferenceUnavailable
+from tests.images import make_image
+
+
+def enhance(api, case_id):
+    job = api.post(f"/api/enhance-face/{case_id}").json()
+    for _ in range(500):
+        status = api.get(job["status_url"]).json()
+        if status["status"] in ("completed", "failed"):
+            assert status["status"] == "completed", status
+            return status["result"]
+        time.sleep(0.01)
+    raise AssertionError("enhancement job did not finish")
+
+
+@pytest.fixture
+def model(api, monkeypatch):
+    """Inference that is down until `state["up"]` is set, then echoes the image"""
+    import server
+
+    state = {"up": False, "calls": 0}
+
+    async def fake_enhance(model_type, data, encoding=None):
+        state["calls"] += 1
+        if not state["up"]:
+            raise InferenceUnavailable("circuit open")
+        return data, 0.92, "HuggingFace test-model"
+
+    monkeypatch.setattr(server.inference_backend, "available", lambda: True)
+    monkeypatch.setattr(server.enhancement_scheduler, "enhance", fake_enhance)
+    return state
+
+
+def test_fallback_output_is_not_served_after_the_model_recovers(api, model):
+    data = cv2.imencode(".png", make_image(320, 240, seed=11))[1].tobytes()
+    case_id = api.post("/api/upload-image", files={"file": ("outage.png", data, "image/png")}).json()["case_id"]
+
+    during_outage = enhance(api, case_id)
+    assert not during_outage["cache_hit"]
+    assert "OpenCV" in api.get(f"/api/result/{during_outage['result_id']}").json()["method_used"]
+
+    model["up"] = True
+    recovered = enhance(api, case_id)
+    assert not recovered["cache_hit"]
+    assert api.get(f"/api/result/{recovered['result_id']}").json()["method_used"] == "HuggingFace test-model"
+
+    # Model output is memoized as before
+    calls = model["calls"]
+    assert enhance(api, case_id)["cache_hit"]
+    assert model["calls"] == calls
+
+
+def test_case_fails_when_its_job_runs_out_of_attempts(api):
+    import server
+
+    data = cv2.imencode(".png", make_image(160, 120, seed=12))[1].tobytes()
+    case_id = api.post("/api/upload-image", files={"file": ("stuck.png", data, "image/png")}).json()["case_id"]
+    past = "2020-01-01T00:00:00"
+
+    async def setup():
+        await server.cases_collection.update_one({"case_id": case_id}, {"$set": {"status": "running"}})
+        await server.jobs_collection.insert_one({
+            "job_id": f"stuck-{case_id}", "type": "enhance_face", "payload": {"case_id": case_id},
+            "status": "running", "progress": 0.0, "created_at": past, "updated_at": past, "not_before": past,
+            "attempts": server.job_queue.max_attempts, "owner": "dead-process", "lease_until": past,
+        })
+
+    api.portal.call(setup)
+    for _ in range(500):
+        if api.get(f"/api/job/stuck-{case_id}").json()["status"] == "failed":
+            break
+        time.sleep(0.01)
+    case = api.get(f"/api/case/{case_id}").json()
+    assert case["status"] == "failed" and "Gave up" in case["error"]
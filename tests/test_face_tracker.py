@@ -0,0 +1,58 @@
+import numpy as np
+
+from face_tracker import best_frames, detection_quality, iou_matrix, track_faces
+
+
+def box(x, y, w=50, h=50, **extra):
+    return {"x": x, "y": y, "w": w, "h": h, **extra}
+
+
+def frame(frame_id, boxes, width=640, height=480):
+    return {"frame_id": frame_id, "width": width, "height": height, "boxes": boxes}
+
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    assert np.allclose(ious, [[1.0, 50 / 150, 0.0]])
+    assert iou_matrix([], [[0, 0, 1, 1]]).shape == (0, 1)
+
+
+def test_two_faces_are_tracked_and_best_frame_chosen():
+    frames = [
+        frame("f0", [box(100, 100, sharpness=20), box(400, 100, sharpness=80)]),
+        frame("f1", [box(410, 105, sharpness=300), box(105, 102, sharpness=40)]),
+        frame("f2", [box(110, 104, sharpness=500)]),
+    ]
+    tracks = track_faces(frames)
+    assert len(tracks) == 2
+    left, right = tracks
+    assert [d["frame_id"] for d in left["detections"]] == ["f0", "f1", "f2"]
+    assert [d["box_index"] for d in left["detections"]] == [0, 1, 0]
+    assert left["best"]["frame_id"] == "f2" and right["best"]["frame_id"] == "f1"
+    assert best_frames(tracks) == ["f2", "f1"]
+
+
+def test_tracks_match_across_resolutions_and_fast_motion():
+    frames = [
+        frame("f0", [box(100, 100)]),
+        # Same place at twice the resolution
+        frame("f1", [box(200, 200, 100, 100)], width=1280, height=960),
+        # Moved further than its own width: no overlap, matched by centroid distance
+        frame("f2", [box(160, 100)]),
+    ]
+    tracks = track_faces(frames)
+    assert len(tracks) == 1 and len(tracks[0]["detections"]) == 3
+
+
+def test_gap_ends_a_track():
+    frames = [frame("f0", [box(100, 100)])] + [frame(f"e{n}", []) for n in range(3)] + [frame("f4", [box(100, 100)])]
+    assert len(track_faces(frames, max_gap=5)) == 1
+    assert len(track_faces(frames, max_gap=2)) == 2
+
+
+def test_detection_quality_prefers_sharp_large_confident_faces():
+    small_blurry = detection_quality(box(0, 0, 30, 30, score=0.5, sharpness=10))
+    large_sharp = detection_quality(box(0, 0, 150, 150, score=0.9, sharpness=400))
+    assert 0 < small_blurry < large_sharp < 1
+    # Boxes stored before scores were recorded still get a quality
+    assert 0 < detection_quality(box(0, 0, 60, 60)) < 1
@@ -0,0 +1,68 @@
+import functools
+
+import cv2
+import numpy as np
+import pytest
+
+import fallback_pipeline
+from fallback_pipeline import FALLBACK_PRESETS, fallback_enhance, fallback_preset_name, plan_fallback
+from image_ops import assess_quality, decode_image
+from tiling import apply_tiled
+
+from tests.images import make_image
+
+PNG = ("png", 1)
+
+
+def baseline_fallback(img):
+    """The fallback as originally written, before tiling and presets"""
+    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    l = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(l)
+    enhanced = cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
+    enhanced = cv2.bilateralFilter(enhanced, 9, 75, 75)
+    enhanced = cv2.filter2D(enhanced, -1, np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]))
+    return cv2.convertScaleAbs(enhanced, alpha=1.2, beta=20)
+
+
+def encode(img):
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+@pytest.fixture
+def small_tiles(monkeypatch):
+    monkeypatch.setattr(fallback_pipeline, "apply_tiled", functools.partial(apply_tiled, tile_size=96))
+
+
+def test_classic_preset_matches_baseline(image, small_tiles):
+    data, timings, plan = fallback_enhance(encode(image), PNG, preset="classic")
+    assert np.array_equal(decode_image(data), baseline_fallback(image))
+    assert [step["stage"] for step in plan] == ["clahe", "denoise", "sharpen", "brightness"]
+
+
+@pytest.mark.parametrize("preset", FALLBACK_PRESETS)
+def test_tiled_output_matches_single_tile(image, preset, monkeypatch):
+    source = encode(image)
+    tiled = fallback_enhance(source, PNG, preset=preset)
+    monkeypatch.setattr(fallback_pipeline, "apply_tiled", functools.partial(apply_tiled, tile_size=96))
+    assert fallback_enhance(source, PNG, preset=preset)[0] == tiled[0]
+
+
+def test_plan_respects_stages():
+    quality = assess_quality(cv2.cvtColor(make_image(320, 240, seed=3), cv2.COLOR_BGR2GRAY))
+    for preset in FALLBACK_PRESETS:
+        assert all(step["stage"] == "denoise" for step in plan_fallback(quality, preset, ("denoise",)))
+    assert plan_fallback(quality, "classic", ()) == []
+
+
+def test_unknown_preset_is_rejected():
+    with pytest.raises(ValueError):
+        fallback_preset_name("turbo")
+    assert fallback_preset_name("FAST") == "fast"
+
+
+def test_scratch_buffers_do_not_grow_with_image_sizes(small_tiles):
+    for index in range(8):
+        fallback_enhance(encode(make_image(150 + 31 * index, 110 + 17 * index, seed=index)), PNG, preset="quality")
+    buffers = fallback_pipeline._scratch.__dict__["buffers"]
+    assert set(name for name, _ in buffers) <= {"step", "bgr", "denoised"}
@@ -0,0 +1,65 @@
+import cv2
+import pytest
+
+from tests.images import make_image
+
+
+@pytest.fixture(scope="module")
+def uploaded(api):
+    data = cv2.imencode(".png", make_image(320, 240, seed=7))[1].tobytes()
+    response = api.post("/api/upload-image", files={"file": ("range.png", data, "image/png")})
+    assert response.status_code == 200
+    return response.json()["case_id"], data
+
+
+def test_full_image_with_etag(api, uploaded):
+    case_id, data = uploaded
+    response = api.get(f"/api/case/{case_id}/original")
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"].strip('"')
+
+    etag = response.headers["etag"]
+    cached = api.get(f"/api/case/{case_id}/original", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert api.get(f"/api/case/{case_id}/original", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=100-", 100, None),
+    ("bytes=-50", -50, None),
+    ("bytes=10-999999999", 10, None),
+])
+def test_range_requests(api, uploaded, header, start, end):
+    case_id, data = uploaded
+    response = api.get(f"/api/case/{case_id}/original", headers={"Range": header})
+    expected = data[start:] if end is None else data[start:end + 1]
+    first = start % len(data)
+    assert response.status_code == 206
+    assert response.content == expected
+    assert response.headers["content-range"] == f"bytes {first}-{first + len(expected) - 1}/{len(data)}"
+    assert response.headers["content-length"] == str(len(expected))
+
+
+def test_unsatisfiable_and_unsupported_ranges(api, uploaded):
+    case_id, data = uploaded
+    response = api.get(f"/api/case/{case_id}/original", headers={"Range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(data)}"
+    # Multipart and malformed ranges fall back to the full image
+    for header in ("bytes=0-1,5-6", "bytes=abc", "items=0-1"):
+        response = api.get(f"/api/case/{case_id}/original", headers={"Range": header})
+        assert response.status_code == 200 and response.content == data
+
+
+def test_thumbnails_and_missing_case(api, uploaded):
+    case_id, _ = uploaded
+    case = api.get(f"/api/case/{case_id}").json()
+    assert "original_blob" not in case and "thumbnails" not in case
+    for url in case["thumbnail_urls"].values():
+        response = api.get(url)
+        assert response.status_code == 200 and response.headers["etag"]
+    assert api.get("/api/case/does-not-exist/original").status_code == 404
@@ -0,0 +1,124 @@
+import asyncio
+
+import httpx
+import pytest
+
+import inference_client
+from inference_client import CircuitBreaker, InferenceClient, InferenceUnavailable, suggested_delay
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_timeout(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(inference_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow() and breaker.rejected == 1
+
+    now[0] += 10
+    assert breaker.allow() and breaker.state == "half_open"
+    # One trial at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_released_trial_lets_the_next_caller_try(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(inference_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1)
+    breaker.record_failure()
+    now[0] = 5
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_suggested_delay():
+    assert suggested_delay(httpx.Response(503, headers={"retry-after": "2"})) == 2.0
+    assert suggested_delay(httpx.Response(503, json={"estimated_time": 4.5})) == 4.5
+    assert suggested_delay(httpx.Response(503, text="busy")) is None
+
+
+def make_client(handler, **options):
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return InferenceClient(lambda: http, "http://inference/models/", "key", **options)
+
+
+def test_retries_until_success(monkeypatch):
+    monkeypatch.setattr(inference_client, "backoff_delay", lambda attempt: 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, content=b"enhanced")
+
+    client = make_client(handler, max_attempts=3)
+    assert asyncio.run(client.infer("org/model", b"image")) == b"enhanced"
+    assert calls == ["/models/org/model"] * 3
+    assert client.retries == 2 and client.breaker("org/model").state == "closed"
+
+
+def test_client_errors_fail_without_tripping_the_circuit():
+    client = make_client(lambda request: httpx.Response(400, text="bad image"), max_attempts=3)
+    with pytest.raises(InferenceUnavailable, match="400"):
+        asyncio.run(client.infer("model", b"image"))
+    assert client.requests == 1 and client.breaker("model").failures == 0
+
+
+def test_open_circuit_fails_fast(monkeypatch):
+    monkeypatch.setattr(inference_client, "CircuitBreaker", lambda: CircuitBreaker(failure_threshold=2))
+    client = make_client(lambda request: httpx.Response(500), max_attempts=5)
+
+    async def scenario():
+        with pytest.raises(InferenceUnavailable):
+            await client.infer("model", b"image")
+        with pytest.raises(InferenceUnavailable, match="circuit open"):
+            await client.infer("model", b"image")
+
+    asyncio.run(scenario())
+    # The circuit opened after the second failure, cutting the first call's retries short
+    assert client.requests == 2
+
+
+def test_deadline_bounds_slow_requests():
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    client = make_client(handler)
+    with pytest.raises(InferenceUnavailable, match="deadline"):
+        asyncio.run(client.infer("model", b"image", deadline=0.05))
+
+
+def test_cancelled_trial_releases_the_breaker(monkeypatch):
+    monkeypatch.setattr(inference_client, "CircuitBreaker", lambda: CircuitBreaker(failure_threshold=1, reset_timeout=0))
+
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    client = make_client(handler)
+
+    async def scenario():
+        breaker = client.breaker("model")
+        breaker.record_failure()
+        trial = asyncio.ensure_future(client.infer("model", b"image"))
+        await asyncio.sleep(0.05)
+        assert breaker.state == "half_open"
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return breaker.allow()
+
+    # Without the release every later call would be rejected as "circuit open"
+    assert asyncio.run(scenario())
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from jobs import JobQueue, JobRetry
+
+
+def make_queue(collection, **options):
+    return JobQueue(collection, workers=1, poll_interval=0.01, **options)
+
+
+async def wait_for(queue, job_id, status, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.get(job_id)
+        if job['status'] == status:
+            return job
+        assert asyncio.get_running_loop().time() < deadline, job
+        await asyncio.sleep(0.01)
+
+
+def test_live_lease_is_not_stolen_by_another_process():
+    async def scenario():
+        collection = AsyncMongoMockClient()["jobs_test"]["jobs"]
+        release = asyncio.Event()
+        runs = []
+
+        async def handler(job, progress):
+            runs.append(job['attempts'])
+            await release.wait()
+            return {"ok": True}
+
+        first, second = make_queue(collection, lease_seconds=0.3), make_queue(collection, lease_seconds=0.3)
+        for queue in (first, second):
+            queue.register("slow", handler)
+        await first.start()
+        job = await first.submit("slow", {})
+        await wait_for(first, job['job_id'], "running")
+
+        # A restarting process must leave the job alone while its lease is renewed
+        await second.start()
+        await asyncio.sleep(0.5)
+        release.set()
+        done = await wait_for(first, job['job_id'], "completed")
+        await first.stop()
+        await second.stop()
+        return runs, done
+
+    runs, done = asyncio.run(scenario())
+    assert runs == [1]
+    assert done['attempts'] == 1
+
+
+def test_expired_lease_is_claimed_again():
+    async def scenario():
+        collection = AsyncMongoMockClient()["jobs_test"]["jobs"]
+        queue = make_queue(collection)
+
+        async def handler(job, progress):
+            return {"attempt": job['attempts']}
+
+        queue.register("work", handler)
+        past = (datetime.now() - timedelta(minutes=5)).isoformat()
+        await collection.insert_one({
+            "job_id": "orphaned", "type": "work", "payload": {}, "status": "running", "progress": 0.5,
+            "created_at": past, "updated_at": past, "not_before": past, "attempts": 1,
+            "owner": "dead-process", "lease_until": past,
+        })
+        await queue.start()
+        done = await wait_for(queue, "orphaned", "completed")
+        await queue.stop()
+        return done
+
+    done = asyncio.run(scenario())
+    assert done['result'] == {"attempt": 2}
+
+
+def test_stale_claim_cannot_overwrite_new_owner():
+    async def scenario():
+        collection = AsyncMongoMockClient()["jobs_test"]["jobs"]
+        queue = make_queue(collection)
+        job = await queue.submit("work", {})
+        claimed = await queue._claim()
+        # Another process took the job over after this claim's lease expired
+        await collection.update_one({"job_id": job['job_id']}, {"$set": {"owner": "other"}, "$inc": {"attempts": 1}})
+        await queue._update(queue._claim_filter(claimed), {"status": "failed"})
+        return await queue.get(job['job_id'])
+
+    assert asyncio.run(scenario())['status'] == "running"
+
+
+def test_retries_stop_at_max_attempts():
+    async def scenario():
+        collection = AsyncMongoMockClient()["jobs_test"]["jobs"]
+        queue = make_queue(collection, max_attempts=3)
+        last_attempts = []
+
+        async def handler(job, progress):
+            last_attempts.append(queue.is_last_attempt(job))
+            raise JobRetry(0, "busy")
+
+        queue.register("busy", handler)
+        await queue.start()
+        job = await queue.submit("busy", {})
+        failed = await wait_for(queue, job['job_id'], "failed")
+        await queue.stop()
+        return failed, last_attempts
+
+    failed, last_attempts = asyncio.run(scenario())
+    assert failed['attempts'] == 3 and "busy" in failed['error']
+    assert last_attempts == [False, False, True]
+
+
+def test_failure_hook_runs_when_attempts_are_exhausted_without_the_handler():
+    async def scenario():
+        collection = AsyncMongoMockClient()["jobs_test"]["jobs"]
+        queue = make_queue(collection, max_attempts=2)
+        handled, failed = [], []
+
+        async def handler(job, progress):
+            handled.append(job['job_id'])
+
+        async def on_failed(job, error):
+            failed.append((job['job_id'], error))
+
+        queue.register("work", handler, on_failed=on_failed)
+        past = (datetime.now() - timedelta(minutes=5)).isoformat()
+        # Its process died on the last allowed attempt
+        await collection.insert_one({
+            "job_id": "crashing", "type": "work", "payload": {}, "status": "running", "progress": 0.0,
+            "created_at": past, "updated_at": past, "not_before": past, "attempts": 2,
+            "owner": "dead-process", "lease_until": past,
+        })
+        await queue.start()
+        job = await wait_for(queue, "crashing", "failed")
+        await queue.stop()
+        return job, handled, failed
+
+    job, handled, failed = asyncio.run(scenario())
+    assert handled == []
+    assert failed == [("crashing", job['error'])] and "Gave up after 2 attempts" in job['error']
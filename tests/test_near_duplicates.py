@@ -0,0 +1,50 @@
+import random
+
+import cv2
+
+from image_ops import perceptual_hashes
+from near_duplicates import BKTree, NearDuplicateIndex, hamming
+from tests.images import make_image
+
+
+def test_bk_tree_search_matches_linear_scan():
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(400)]
+    # Clustered values exercise the pruning near the query
+    values += [values[0] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for _ in range(50)]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    assert len(tree) == len(values)
+
+    for query in values[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        for radius in (0, 4, 12, 24):
+            expected = sorted((hamming(query, value), index) for index, value in enumerate(values)
+                              if hamming(query, value) <= radius)
+            assert sorted((distance, item) for distance, _, item in tree.search(query, radius)) == expected
+
+
+def test_empty_tree():
+    assert BKTree().search(123, 64) == []
+
+
+def test_index_finds_recompressed_and_resized_copies():
+    image = make_image(400, 300, seed=2)
+    recompressed = cv2.imdecode(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])[1], cv2.IMREAD_COLOR)
+    resized = cv2.resize(image, (200, 150), interpolation=cv2.INTER_AREA)
+    other = make_image(400, 300, seed=99)[::-1]
+
+    def hashes(img):
+        return perceptual_hashes(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+
+    index = NearDuplicateIndex(cases_collection=None)
+    index.add("original", *hashes(image))
+    index.add("original", *hashes(other))  # already indexed; ignored
+    index.add("other", *hashes(other))
+    assert index.stats()["indexed"] == 2
+
+    for copy in (recompressed, resized):
+        matches = index.find(*hashes(copy))
+        assert [match["case_id"] for match in matches] == ["original"]
+    assert index.find(*hashes(image), exclude="original") == []
+    assert index.find(None) == []
@@ -0,0 +1,59 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from result_cache import LRUCache, ResultCache, make_cache_key
+
+
+def test_cache_key_covers_every_component():
+    key = make_cache_key("hash", "restoration", "model", "v1")
+    assert key == make_cache_key("hash", "restoration", "model", "v1")
+    variants = [("other", "restoration", "model", "v1"), ("hash", "super_resolution", "model", "v1"),
+                ("hash", "restoration", "other", "v1"), ("hash", "restoration", "model", "v2")]
+    assert all(make_cache_key(*variant) != key for variant in variants)
+
+
+def test_lru_evicts_least_recently_used_within_budget():
+    cache = LRUCache(max_bytes=30)
+    cache.put("a", 1, 10)
+    cache.put("b", 2, 10)
+    cache.put("c", 3, 10)
+    assert cache.get("a") == 1  # now most recent
+    cache.put("d", 4, 10)
+    assert cache.get("b") is None and cache.get("a") == 1
+    assert cache.current_bytes == 30 and len(cache) == 3
+
+    cache.put("huge", 5, 31)
+    assert cache.get("huge") is None and len(cache) == 3
+    cache.put("a", 6, 5)
+    assert cache.get("a") == 6 and cache.current_bytes == 25
+    cache.discard("a")
+    cache.discard("missing")
+    assert cache.current_bytes == 20
+
+
+def test_memory_then_persistent_lookup():
+    async def scenario():
+        results = AsyncMongoMockClient()["cache_test"]["results"]
+        cache = ResultCache(results)
+        key = make_cache_key("hash", "restoration", "model", "v1")
+        assert await cache.get(key) is None
+
+        await results.insert_many([
+            {"result_id": "old", "cache_key": key, "status": "completed", "processing_timestamp": "2026-01-01",
+             "enhanced_blob": "b1", "original_blob": "not cached"},
+            {"result_id": "new", "cache_key": key, "status": "completed", "processing_timestamp": "2026-02-01",
+             "enhanced_blob": "b2"},
+            {"result_id": "broken", "cache_key": key, "status": "failed", "processing_timestamp": "2026-03-01"},
+        ])
+        persistent = await cache.get(key)
+        memory = await cache.get(key)
+        cache.forget([key, None])
+        return cache, persistent, memory
+
+    cache, persistent, memory = asyncio.run(scenario())
+    assert persistent == {"result_id": "new", "enhanced_blob": "b2"}
+    assert memory == persistent
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits_persistent"], stats["hits_memory"]) == (1, 1, 1)
+    assert stats["memory_entries"] == 0
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+from tiling import ScratchBuffers, apply_tiled, iter_tiles
+
+
+def test_iter_tiles_cover_image_once():
+    covered = np.zeros((370, 500), np.int32)
+    for (y0, y1, x0, x1), (ry0, ry1, rx0, rx1) in iter_tiles(370, 500, 128, 7):
+        covered[y0:y1, x0:x1] += 1
+        assert ry0 <= y0 and ry1 >= y1 and rx0 <= x0 and rx1 >= x1
+        assert ry0 >= 0 and rx0 >= 0 and ry1 <= 370 and rx1 <= 500
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+@pytest.mark.parametrize("tile_size", [64, 128, 1000])
+def test_apply_tiled_matches_full_frame(image, tile_size, threads):
+    def tile_fn(region, box):
+        blurred = cv2.GaussianBlur(region, (0, 0), 2.0)
+        return cv2.bilateralFilter(blurred, 9, 50, 5), {"filter": 0.001}
+
+    expected = cv2.bilateralFilter(cv2.GaussianBlur(image, (0, 0), 2.0), 9, 50, 5)
+    img = image.copy()
+    timings = apply_tiled(img, tile_fn, halo=7 + 4, tile_size=tile_size, threads=threads)
+    assert np.array_equal(img, expected)
+    assert timings["filter"] > 0
+
+
+def test_apply_tiled_halo_taller_than_a_tile(image):
+    def tile_fn(region, box):
+        return cv2.GaussianBlur(region, (0, 0), 6.0), {}
+
+    expected = cv2.GaussianBlur(image, (0, 0), 6.0)
+    img = image.copy()
+    # The blur reaches 18 rows, past the band above into the ones before it
+    apply_tiled(img, tile_fn, halo=24, tile_size=8)
+    assert np.array_equal(img, expected)
+
+
+def test_scratch_buffers_are_bounded_across_shapes():
+    scratch = ScratchBuffers()
+    for size in range(20, 200, 7):
+        for name in ("a", "b"):
+            buf = scratch.get(name, (size, size + 3, 3))
+            assert buf.shape == (size, size + 3, 3) and buf.flags.c_contiguous
+    buffers = scratch.__dict__["buffers"]
+    assert len(buffers) == 2
+    assert all(buf.size == 195 * 198 * 3 for buf in buffers.values())
+
+
+def test_scratch_buffer_names_do_not_alias():
+    scratch = ScratchBuffers()
+    a = scratch.get("a", (4, 4))
+    b = scratch.get("b", (4, 4))
+    a[:] = 1
+    b[:] = 2
+    assert (a == 1).all()
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.mark.parametrize("reuse_detection", [False, True])
+def test_undecodable_image_is_stored_without_faces(api, reuse_detection):
+    response = api.post(
+        "/api/upload-image",
+        params={"reuse_detection": reuse_detection},
+        files={"file": ("broken.jpg", b"\xff\xd8\xff\xe0 not really a jpeg", "image/jpeg")},
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["face_count"] == 0 and body["detection_reused_from"] is None